@@ -0,0 +1,246 @@
+import os
+import time
+import queue
+import argparse
+import threading
+from datetime import datetime
+import requests
+from scan_metrics import NULL_METRICS
+
+# Background alert delivery for the scanner, one cycle's alerts are coalesced into as few Discord messages as
+# possible, sent from a worker thread so a slow or rate-limited webhook never holds up scoring
+
+# The webhook only ever comes from the environment or --webhook-url, without one alerting is off
+WEBHOOK_URL = os.environ.get('DISCORD_WEBHOOK_URL')
+
+ALERT_THRESHOLD = 0.94
+COOLDOWN_SECONDS = 30 * 60
+MAX_MESSAGE_LENGTH = 2000  # Discord rejects message content longer than this
+MAX_QUEUE = 100
+MAX_RETRIES = 5
+
+
+# Function to split alert lines into messages that fit Discord's content limit
+def build_messages(header, lines, max_length=MAX_MESSAGE_LENGTH):
+    """
+    Pack lines under a header into as few messages as possible.
+
+    Returns:
+    list: (content, number of lines in it) tuples
+    """
+    messages = []
+    content, count = header, 0
+    for line in lines:
+        if count and len(content) + 1 + len(line) > max_length:
+            messages.append((content, count))
+            content, count = header + " (cont.)", 0
+        content += "\n" + line
+        count += 1
+    if count:
+        messages.append((content, count))
+    return messages
+
+
+# Function to read how long a 429 asks us to wait, from the header or Discord's JSON body
+def retry_after_seconds(response, default=1.0):
+    value = response.headers.get('Retry-After')
+    if value is None:
+        try:
+            value = response.json().get('retry_after')
+        except ValueError:
+            value = None
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+class AlertDispatcher:
+    """
+    Deliver coalesced alerts from a background thread.
+
+    submit_cycle() only filters, formats and enqueues, so it is safe to call from the scan loop.
+    Messages wait in a bounded queue, when it is full the oldest message is dropped to make room.
+    A symbol's cooldown starts when its message is delivered, a symbol whose message failed or
+    was dropped can alert again on the next cycle. Without a webhook URL alerting is off.
+
+    Parameters:
+    webhook_url (str): Discord webhook, defaults to DISCORD_WEBHOOK_URL
+    cooldown (float): Seconds before the same symbol is alerted again
+    max_queue (int): Messages waiting for delivery
+    max_retries (int): Attempts per message after the first
+    timeout (float): Seconds per HTTP request
+    backoff (float): First retry delay after a connection error or 5xx, doubled every attempt
+    clock (callable): Time source, replaceable in tests
+    metrics (ScanMetrics): Counts alerts by outcome
+    """
+
+    def __init__(self, webhook_url=None, cooldown=COOLDOWN_SECONDS, max_queue=MAX_QUEUE, max_retries=MAX_RETRIES, timeout=10.0,
+                 backoff=1.0, clock=time.time, metrics=NULL_METRICS):
+        self.webhook_url = webhook_url or WEBHOOK_URL
+        self.enabled = bool(self.webhook_url)
+        if not self.enabled:
+            print("No Discord webhook configured, set DISCORD_WEBHOOK_URL or pass --webhook-url. Alerting is off.")
+        self.cooldown = cooldown
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.clock = clock
+        self.metrics = metrics
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.last_alerted = {}
+        # Symbols queued but not delivered yet, guarded by lock as the sender thread settles them
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        self.thread = None
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self):
+        if self.enabled:
+            self.thread = threading.Thread(target=self._run, name='alert-dispatcher', daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        if self.thread is None:
+            return
+        # The sentinel queues behind any pending messages, so they are delivered first
+        self._enqueue(None)
+        self.thread.join(timeout)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _enqueue(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    dropped = self.queue.get_nowait()
+                except queue.Empty:
+                    continue
+                self.queue.task_done()
+                if dropped is not None:
+                    self.dropped += 1
+                    self._settle(dropped[1], delivered=False)
+                    self.metrics.inc("scan_alerts_total", len(dropped[1]), outcome='dropped')
+                    print(f"Alert queue full, dropped a message with {len(dropped[1])} alert(s), they can alert again next cycle.")
+
+    def _settle(self, symbols, delivered):
+        # Only a delivered alert starts the symbol's cooldown
+        now = self.clock()
+        with self.lock:
+            for symbol in symbols:
+                self.in_flight.discard(symbol)
+                if delivered:
+                    self.last_alerted[symbol] = now
+
+    def submit_cycle(self, alerts, candle_close=None, notes=None):
+        """
+        Queue one cycle's alerts as batched messages sorted by score.
+
+        Parameters:
+        alerts (list): (symbol, cosine_sim) pairs
+        candle_close (float): Epoch seconds of the candle the cycle scored
+        notes (dict): Optional text appended to a symbol's line, e.g. its nearest historical setups
+
+        Returns:
+        int: Alerts queued after the cooldown filter
+        """
+        if not self.enabled:
+            return 0
+        now = self.clock()
+        fresh = []
+        with self.lock:
+            for symbol, score in alerts:
+                last = self.last_alerted.get(symbol)
+                if symbol in self.in_flight or (last is not None and now - last < self.cooldown):
+                    self.metrics.inc("scan_alerts_total", outcome='deduped')
+                    continue
+                self.in_flight.add(symbol)
+                fresh.append((symbol, score))
+        if not fresh:
+            return 0
+
+        fresh.sort(key=lambda alert: alert[1], reverse=True)
+        when = datetime.fromtimestamp(candle_close if candle_close is not None else now).strftime('%Y-%m-%d %H:%M')
+        header = f"**{len(fresh)} alert(s) for the {when} candle**"
+        notes = notes or {}
+        lines = [f"{symbol} with Cosine Sim of: {score:.4f}" + (f", like {notes[symbol]}" if notes.get(symbol) else "") for symbol, score in fresh]
+        # Lines keep the score order, so each message's symbols are the next `count` of fresh
+        offset = 0
+        for content, count in build_messages(header, lines):
+            self._enqueue((content, [symbol for symbol, _ in fresh[offset:offset + count]]))
+            offset += count
+        return len(fresh)
+
+    def submit_message(self, content):
+        if self.enabled:
+            self._enqueue((content, []))
+
+    def _post(self, content):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.webhook_url, json={'content': content}, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                print(f"An error occurred sending an alert: {e}")
+                delay = self.backoff * 2 ** attempt
+            else:
+                if 200 <= response.status_code < 300:
+                    return True
+                if response.status_code == 429:
+                    delay = retry_after_seconds(response)
+                    print(f"Discord webhook rate limited, retrying in {delay:.1f}s.")
+                elif response.status_code >= 500:
+                    delay = self.backoff * 2 ** attempt
+                else:
+                    print(f'Failed to send message to Discord webhook. Status code: {response.status_code}')
+                    return False
+            if attempt < self.max_retries:
+                time.sleep(delay)
+        return False
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            content, symbols = item
+            delivered = self._post(content)
+            self._settle(symbols, delivered)
+            if delivered:
+                self.sent += 1
+                self.metrics.inc("scan_alerts_total", len(symbols), outcome='sent')
+            else:
+                self.failed += 1
+                self.metrics.inc("scan_alerts_total", len(symbols), outcome='failed')
+                if symbols:
+                    print(f"Could not deliver the alerts for {', '.join(symbols)}, they can alert again next cycle.")
+            self.queue.task_done()
+
+    def join(self):
+        """
+        Wait until every queued message has been handled, used by tests and before exiting.
+        """
+        self.queue.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send a sample cycle of alerts through the dispatcher.")
+    parser.add_argument("--webhook-url", required=True, help="Webhook to send the sample to, never read from DISCORD_WEBHOOK_URL")
+    parser.add_argument("--alerts", type=int, default=3, help="Alerts in the sample cycle")
+    args = parser.parse_args()
+
+    alerts = [(f"TEST{i}USDT", 0.94 + 0.0005 * i) for i in range(args.alerts)]
+    with AlertDispatcher(args.webhook_url) as dispatcher:
+        queued = dispatcher.submit_cycle(alerts)
+    print(f"{queued} alerts queued, {dispatcher.sent} message(s) sent, {dispatcher.failed} failed.")
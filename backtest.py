@@ -0,0 +1,230 @@
+import os
+
+# Workers are processes, keep each one's BLAS single threaded so they do not fight over the cores
+for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(variable, '1')
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+import time
+import argparse
+import multiprocessing
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from generate_training_data import (detect_surges, select_windows, normalize_windows, feature_columns,
+                                    SEQUENCE_LENGTH, SURGE_THRESHOLD, SURGE_HORIZON)
+from scoring import load_scoring_model, reconstruction_metrics
+from history_store import read_source, source_name, history_sources, STORE_ROOT
+
+# Run this to replay full-year merged CSVs through the detector, every 25 candle window is scored and the
+# alerts at the cosine threshold are checked against the surges analyze_data would have cut training windows for
+
+ALERT_THRESHOLD = 0.94
+MAX_LEAD = 24  # Candles before a surge an alert still counts for, the training windows cover up to 2 hours
+BATCH_SIZE = 4096
+CANDLE_MINUTES = 5
+
+model = None
+
+
+# Function to load the model once per worker process
+def init_worker(model_path, backend):
+    global model
+    model = load_scoring_model(model_path, backend)
+
+
+# Function to score every window of a merged ticker CSV in large batches
+def score_csv(model, input_csv, batch_size=BATCH_SIZE, sequence_length=SEQUENCE_LENGTH, all_metrics=False):
+    """
+    Score the window ending at every candle of a merged CSV.
+
+    Windows come from a zero-copy strided view over the feature columns, only one batch is
+    normalized and materialized at a time.
+
+    Parameters:
+    model: Object exposing predict(batch, batch_size=None, verbose=0)
+    input_csv (str or HistorySource): Merged <SYMBOL>_<start>_<end>.csv from ticker_data_retrieval.py, or a history store range
+    batch_size (int): Windows per predict call
+    sequence_length (int): Candles per window, the model's input length
+    all_metrics (bool): Also return the MSE and decoded output of every window
+
+    Returns:
+    tuple: close prices (rows,) and cosine similarity of the window ending at each candle (rows - sequence_length + 1,),
+           followed by the MSE (windows,) and decoded outputs (windows, features) with all_metrics
+    """
+    df = read_source(input_csv, ['create_time'] + feature_columns)
+    df.sort_values(by='create_time', ascending=True, inplace=True)
+    values = df[feature_columns].to_numpy(dtype=np.float64)
+    close = df['close'].to_numpy(dtype=np.float64)
+
+    windows = max(len(values) - sequence_length + 1, 0)
+    cosine = np.empty(windows)
+    mse = np.empty(windows)
+    decoded = np.empty((windows, len(feature_columns)), dtype=np.float32)
+    if windows:
+        views = sliding_window_view(values, sequence_length, axis=0)  # (windows, features, sequence_length)
+        for start in range(0, len(views), batch_size):
+            batch = normalize_windows(views[start:start + batch_size].transpose(0, 2, 1)).astype(np.float32)
+            decoded_data = model.predict(batch, batch_size=len(batch), verbose=0)
+            end = start + len(batch)
+            cosine[start:end], mse[start:end], _ = reconstruction_metrics(batch, decoded_data)
+            decoded[start:end] = decoded_data
+
+    if all_metrics:
+        return close, cosine, mse, decoded
+    return close, cosine
+
+
+# Function to compare alerts with the surges analyze_data labels
+def evaluate(close, cosine, alert_threshold=ALERT_THRESHOLD, surge_threshold=SURGE_THRESHOLD, horizon=SURGE_HORIZON, max_lead=MAX_LEAD,
+             sequence_length=SEQUENCE_LENGTH):
+    """
+    Precision, recall and lead time of the alerts for one symbol.
+
+    An alert is the window ending at candle e scoring at or above the threshold. It is a true
+    alert when a labelled surge starts within max_lead candles after e, and a surge counts as
+    detected when any alert fired in that span before it. Lead time is measured from the
+    earliest such alert to the surge start.
+
+    Parameters:
+    close (ndarray): Close prices
+    cosine (ndarray): Score of the window ending at each candle from sequence_length - 1 on
+    alert_threshold (float): Cosine similarity that raises an alert
+    surge_threshold (float): Surge rise, as in analyze_data
+    horizon (int): Surge horizon in candles, as in analyze_data
+    max_lead (int): Candles before a surge an alert is credited to it
+    sequence_length (int): Candles per scored window
+
+    Returns:
+    dict: Alert and surge counts, precision, recall and lead time in minutes
+    """
+    alerts = np.flatnonzero(cosine >= alert_threshold) + sequence_length - 1
+    surges = select_windows(detect_surges(close, surge_threshold, horizon))
+
+    # Next surge strictly after each alert
+    following = np.searchsorted(surges, alerts, side='right')
+    has_following = following < len(surges)
+    true_alerts = np.zeros(len(alerts), dtype=bool)
+    true_alerts[has_following] = surges[following[has_following]] - alerts[has_following] <= max_lead
+
+    # Earliest alert inside each surge's lead span
+    earliest = np.searchsorted(alerts, surges - max_lead, side='left')
+    has_alert = earliest < len(alerts)
+    detected = np.zeros(len(surges), dtype=bool)
+    detected[has_alert] = alerts[earliest[has_alert]] < surges[has_alert]
+    lead = (surges[detected] - alerts[earliest[detected]]) * CANDLE_MINUTES
+
+    return {
+        "windows": len(cosine),
+        "alerts": len(alerts),
+        "true_alerts": int(true_alerts.sum()),
+        "surges": len(surges),
+        "detected": int(detected.sum()),
+        "precision": true_alerts.mean() if len(alerts) else np.nan,
+        "recall": detected.mean() if len(surges) else np.nan,
+        "lead_mean_min": lead.mean() if len(lead) else np.nan,
+        "lead_median_min": np.median(lead) if len(lead) else np.nan,
+        "lead_min_min": lead.min() if len(lead) else np.nan,
+        "lead_max_min": lead.max() if len(lead) else np.nan,
+    }
+
+
+# Function to backtest one symbol inside a worker process
+def backtest_symbol(input_csv, batch_size, alert_threshold, surge_threshold, horizon, max_lead):
+    start = time.perf_counter()
+    close, cosine = score_csv(model, input_csv, batch_size)
+    result = {"symbol": source_name(input_csv).split('_')[0]}
+    result.update(evaluate(close, cosine, alert_threshold, surge_threshold, horizon, max_lead))
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+# Function to pool every symbol's counts into one overall row
+def summarize(results):
+    totals = results[["windows", "alerts", "true_alerts", "surges", "detected"]].sum()
+    return {
+        "symbol": "ALL",
+        **totals.to_dict(),
+        "precision": totals["true_alerts"] / totals["alerts"] if totals["alerts"] else np.nan,
+        "recall": totals["detected"] / totals["surges"] if totals["surges"] else np.nan,
+        # Lead times are only averaged over symbols that detected something, weighted by detections
+        "lead_mean_min": np.average(results["lead_mean_min"].fillna(0), weights=results["detected"]) if totals["detected"] else np.nan,
+        "seconds": results["seconds"].sum(),
+    }
+
+
+def backtest_all(input_csvs, model_path='autoencoder_model.h5', backend='numpy', workers=None, batch_size=BATCH_SIZE,
+                 alert_threshold=ALERT_THRESHOLD, surge_threshold=SURGE_THRESHOLD, horizon=SURGE_HORIZON, max_lead=MAX_LEAD):
+    """
+    Backtest every symbol across a process pool.
+
+    Parameters:
+    input_csvs (list): Merged <SYMBOL>_<start>_<end>.csv paths or HistorySource ranges
+    model_path (str): Keras .h5 model file
+    backend (str): 'numpy' or 'keras' inference
+    workers (int): Processes to use, defaults to the CPU count
+
+    Returns:
+    DataFrame: One row per symbol plus an ALL row
+    """
+    results = []
+    # Spawned workers so a TensorFlow backend never inherits a forked runtime
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_worker, initargs=(model_path, backend)) as executor:
+        futures = {executor.submit(backtest_symbol, input_csv, batch_size, alert_threshold, surge_threshold, horizon, max_lead): input_csv
+                   for input_csv in input_csvs}
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"[{done}/{len(futures)}] Failed to backtest {futures[future]}: {str(e)}")
+                continue
+            results.append(result)
+            print(f"[{done}/{len(futures)}] {result['symbol']}: {result['windows']} windows in {result['seconds']:.1f}s, "
+                  f"{result['alerts']} alerts, {result['detected']}/{result['surges']} surges detected")
+
+    results = pd.DataFrame(results)
+    if results.empty:
+        return results
+    results.sort_values(by="symbol", inplace=True)
+    return pd.concat([results, pd.DataFrame([summarize(results)])], ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay merged ticker CSVs through the autoencoder and score its alerts against labelled surges.")
+    parser.add_argument("inputs", nargs='*', help="Merged CSVs to backtest, defaults to every file matching the date range")
+    parser.add_argument("--start-date", default="2022-09-01", help="Start date in the source CSV names (YYYY-MM-DD)")
+    parser.add_argument("--end-date", default="2023-09-01", help="End date in the source CSV names (YYYY-MM-DD)")
+    parser.add_argument("--model", default='autoencoder_model.h5', help="Autoencoder .h5 file to score with")
+    parser.add_argument("--backend", choices=['keras', 'numpy'], default='numpy', help="Run the model with TensorFlow or the NumPy inference engine")
+    parser.add_argument("--alert-threshold", type=float, default=ALERT_THRESHOLD, help="Cosine similarity that raises an alert")
+    parser.add_argument("--surge-threshold", type=float, default=SURGE_THRESHOLD, help="Surge rise, 0.05 is a 5%% rise")
+    parser.add_argument("--horizon", type=int, default=SURGE_HORIZON, help="Surge horizon in candles")
+    parser.add_argument("--max-lead", type=int, default=MAX_LEAD, help="Candles before a surge an alert is credited to it")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Windows per predict call")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="Symbols backtested in parallel")
+    parser.add_argument("-o", "--output", default="backtest_results.csv", help="CSV to write the per-symbol results to")
+    parser.add_argument("--store", nargs='?', const=STORE_ROOT, default=None, help="Read the date range from the columnar history store instead of merged CSVs")
+    parser.add_argument("--symbols", nargs='+', default=None, help="Symbols to read from the store, defaults to all of them")
+    args = parser.parse_args()
+
+    input_csvs = args.inputs
+    if args.store:
+        input_csvs = history_sources(args.store, args.start_date, args.end_date, args.symbols)
+    elif not input_csvs:
+        for root, dirs, files in os.walk(os.getcwd()):
+            for file in files:
+                if file.endswith(f'_{args.start_date}_{args.end_date}.csv'):
+                    input_csvs.append(os.path.join(root, file))
+
+    start = time.perf_counter()
+    results = backtest_all(sorted(input_csvs, key=str), args.model, args.backend, args.workers, args.batch_size,
+                           args.alert_threshold, args.surge_threshold, args.horizon, args.max_lead)
+    if results.empty:
+        print("No symbols were backtested.")
+    else:
+        results.to_csv(args.output, index=False)
+        with pd.option_context('display.max_rows', None, 'display.width', 200, 'display.float_format', '{:.3f}'.format):
+            print(results.drop(columns=["lead_min_min", "lead_max_min"]).to_string(index=False))
+        print(f"Backtested {len(results) - 1} symbols in {time.perf_counter() - start:.1f}s, results saved to {args.output}.")
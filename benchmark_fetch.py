@@ -0,0 +1,25 @@
+import time
+import argparse
+from binance_fetcher import fetch_all_symbols
+from fake_binance import FakeBinance
+
+# Run this to measure a full fetch cycle against a local Binance stand-in for a growing number of symbols
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the async Binance fetcher against a local stand-in server.")
+    parser.add_argument("--symbols", type=int, nargs='+', default=[10, 50, 100, 250, 500], help="Symbol counts to benchmark")
+    parser.add_argument("--limit", type=int, default=25, help="Candles requested per symbol")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated server latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=20, help="Maximum requests in flight")
+    args = parser.parse_args()
+
+    with FakeBinance(latency=args.latency) as server:
+        print(f"{'symbols':>8} {'requests':>9} {'seconds':>8} {'symbols/s':>10}")
+        for count in args.symbols:
+            symbol_limits = [(f"SYM{i}USDT", args.limit) for i in range(count)]
+            requests_before = server.requests
+            start = time.perf_counter()
+            results = fetch_all_symbols(symbol_limits, fapi_base_url=server.base_url, futures_data_base_url=server.base_url, max_concurrency=args.concurrency)
+            elapsed = time.perf_counter() - start
+            failed = sum(1 for _, oi, klines in results if oi is None or klines is None)
+            print(f"{count:>8} {server.requests - requests_before:>9} {elapsed:>8.3f} {count / elapsed:>10.1f}" + (f"  ({failed} failed)" if failed else ""))
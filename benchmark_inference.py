@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+import numpy as np
+
+# Run this to check the NumPy inference engine against Keras and compare cold start and per-batch latency
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+COLD_START_SNIPPET = """
+import time
+start = time.perf_counter()
+from scoring import load_scoring_model
+model = load_scoring_model({path!r}, {backend!r})
+model.predict(__import__('numpy').zeros((1,) + tuple(model.input_shape[1:]), dtype='float32'), verbose=0)
+print(time.perf_counter() - start)
+"""
+
+
+# Function to time import, load and first predict of a backend in a fresh interpreter
+def cold_start(path, backend):
+    result = subprocess.run([sys.executable, '-c', COLD_START_SNIPPET.format(path=path, backend=backend)],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+# Function to time a backend's predict over a batch, best of a few repeats
+def batch_latency(model, batch, repeats=5):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict(batch, batch_size=len(batch), verbose=0)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parity check and benchmark of the NumPy inference engine against Keras.")
+    parser.add_argument("-m", "--models", nargs='+', default=['autoencoder_model.h5', 'autoencoder_model_200_0025.h5'])
+    parser.add_argument("--batch-sizes", type=int, nargs='+', default=[1, 32, 256, 1024])
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="Maximum absolute difference allowed against Keras")
+    args = parser.parse_args()
+
+    from scoring import load_scoring_model
+    from training_dataset import load_corpus, corpus_array
+
+    shards, _ = load_corpus(os.path.dirname(os.path.abspath(__file__)))
+    windows = corpus_array(shards)
+    if len(windows) == 0:
+        windows = np.random.default_rng(0).random((1024, 25, 12), dtype=np.float32)
+
+    failed = False
+    for path in args.models:
+        print(f"== {path}")
+        numpy_model = load_scoring_model(path, 'numpy')
+        # Older models take longer windows, fall back to random inputs of their shape
+        input_shape = tuple(numpy_model.input_shape[1:])
+        model_windows = windows
+        if windows.shape[1:] != input_shape:
+            model_windows = np.random.default_rng(0).random((1024,) + input_shape, dtype=np.float32)
+        try:
+            keras_model = load_scoring_model(path, 'keras')
+        except ImportError:
+            keras_model = None
+            print("TensorFlow is not installed, skipping the Keras parity check.")
+
+        if keras_model is not None:
+            expected = keras_model.predict(model_windows, batch_size=1024, verbose=0)
+            actual = numpy_model.predict(model_windows)
+            max_diff = float(np.abs(expected - actual).max())
+            status = "OK" if max_diff <= args.tolerance else "FAILED"
+            failed |= status == "FAILED"
+            print(f"Parity over {len(model_windows)} windows: max abs diff {max_diff:.2e} ({status})")
+
+        for backend in ('numpy', 'keras') if keras_model is not None else ('numpy',):
+            seconds = cold_start(path, backend)
+            print(f"Cold start {backend}: " + (f"{seconds:.2f}s" if seconds is not None else "failed"))
+
+        for batch_size in args.batch_sizes:
+            batch = np.resize(model_windows, (batch_size,) + input_shape).astype(np.float32)
+            line = f"Batch {batch_size:>5}: numpy {batch_latency(numpy_model, batch) * 1000:8.2f} ms"
+            if keras_model is not None:
+                line += f", keras {batch_latency(keras_model, batch) * 1000:8.2f} ms"
+            print(line)
+
+    sys.exit(1 if failed else 0)
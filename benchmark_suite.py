@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import platform
+import argparse
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# Run this to benchmark the live scan cycle against a local Binance stand-in and the offline training/scoring
+# paths, each benchmark runs in a fresh process so its peak RSS is its own. Results are written as JSON to
+# benchmark_results/<timestamp>_<commit>.json, pass an earlier file with --baseline to see what regressed
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+RESULTS_DIR = 'benchmark_results'
+CANDLES_PER_YEAR = 365 * 24 * 12
+
+
+# Function to read this process's peak resident set size in MB
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+# Function to get the short hash of the commit being benchmarked
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return 'unknown'
+    return result.stdout.strip() or 'unknown'
+
+
+# Function to build a merged ticker CSV with the same columns ticker_data_retrieval.py writes, surges included
+def make_ticker_csv(path, symbol='SYNTHUSDT', rows=CANDLES_PER_YEAR, seed=0):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0, 0.002, rows)
+    # Sprinkle in pumps so analyze_data has surges to cut windows for
+    pumps = rng.choice(rows, size=max(rows // 2000, 1), replace=False)
+    returns[pumps] += rng.uniform(0.06, 0.15, len(pumps))
+    close = 10 * np.exp(np.cumsum(returns))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.001, rows)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.001, rows)))
+    volume = rng.uniform(1e3, 1e6, rows)
+    taker_buy_volume = volume * rng.uniform(0.3, 0.7, rows)
+    open_interest = 1e6 * np.exp(np.cumsum(rng.normal(0, 0.001, rows)))
+
+    df = pd.DataFrame({
+        "create_time": pd.date_range('2023-01-01', periods=rows, freq='5min').strftime('%Y-%m-%d %H:%M:%S'),
+        "symbol": symbol,
+        "sum_open_interest": open_interest,
+        "sum_open_interest_value": open_interest * close,
+        "open": open_, "high": high, "low": low, "close": close,
+        "volume": volume,
+        "quote_volume": volume * close,
+        "count": rng.integers(100, 10000, rows),
+        "taker_buy_volume": taker_buy_volume,
+        "taker_buy_quote_volume": taker_buy_volume * close,
+        "volume_delta": taker_buy_volume - (volume - taker_buy_volume),
+    })
+    df.to_csv(path, index=False)
+    return path
+
+
+# Function to benchmark cold and warm scan cycles for a synthetic universe
+def bench_scan_cycle(symbol_count, latency, error_rate, backend, model_path, concurrency, micro_batch, real_limits):
+    from fake_binance import FakeBinance
+    from binance_fetcher import BinanceFetcher
+    from window_store import WindowStore
+    from scoring import load_scoring_model
+    from scan_scheduler import run_pipelined_cycle
+    from concurrent_data_fetcher import build_feature_rows
+
+    start = time.perf_counter()
+    model = load_scoring_model(model_path, backend)
+    model_load = time.perf_counter() - start
+
+    symbols = [f"SYN{i:04d}USDT" for i in range(symbol_count)]
+    store = WindowStore(symbols)
+    limits = {} if real_limits else {"fapi_weight_per_minute": 10 ** 9, "futures_data_requests_per_5m": 10 ** 9}
+
+    async def run(server):
+        cycles = {}
+        async with BinanceFetcher(server.base_url, server.base_url, max_concurrency=concurrency, **limits) as fetcher:
+            # Cold fills 25 candles per symbol, warm only refetches the newest one
+            for name in ('cold', 'warm'):
+                requests_before, limited_before = server.requests, server.rate_limited
+                start = time.time()
+                results, stats = await run_pipelined_cycle(fetcher, store, model, symbols, build_feature_rows, micro_batch=micro_batch)
+                total = time.time() - start
+                cycles[name] = {
+                    "fetch_seconds": stats["fetch_done"] - stats["started"],
+                    "score_tail_seconds": (stats["last_score"] - stats["fetch_done"]) if stats["last_score"] else 0.0,
+                    "total_seconds": total,
+                    "symbols_per_second": symbol_count / total,
+                    "scored": stats["scored"],
+                    "failed": stats["failed"],
+                    "batches": stats["batches"],
+                    "requests": server.requests - requests_before,
+                    "rate_limited": server.rate_limited - limited_before,
+                }
+        return cycles
+
+    with FakeBinance(latency=latency, error_rate=error_rate) as server:
+        cycles = asyncio.run(run(server))
+
+    return {"model_load_seconds": model_load, "cycles": cycles}
+
+
+# Function to benchmark analyze_data on a year of synthetic 5m candles
+def bench_analyze_data(rows, output_format):
+    from generate_training_data import analyze_data
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_csv = make_ticker_csv(os.path.join(tmp, 'SYNTHUSDT_2023-01-01_2023-12-31.csv'), rows=rows)
+        start = time.perf_counter()
+        counts = analyze_data(input_csv, output_format=output_format, verbose=False)
+        elapsed = time.perf_counter() - start
+
+    return {"rows": rows, "windows": sum(counts.values()), "seconds": elapsed, "rows_per_second": rows / elapsed}
+
+
+# Function to benchmark one streaming training epoch over synthetic shards
+def bench_train_epoch(windows, batch_size):
+    try:
+        import model_train
+    except ImportError:
+        return {"skipped": "TensorFlow is not installed"}
+    from training_dataset import write_shard, INDEX_COLUMNS
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data = np.random.default_rng(0).random((windows, model_train.SEQUENCE_LENGTH, model_train.NUM_FEATURES), dtype=np.float32)
+        index = pd.DataFrame({"symbol": "SYNTHUSDT", "window_start": np.arange(windows), "surge_threshold": 0.05,
+                              "surge_horizon": 6, "source": ""}, columns=INDEX_COLUMNS)
+        write_shard(os.path.join(tmp, 'SYNTHUSDT_training_data'), data, index)
+
+        model = model_train.build_model()
+        start = time.perf_counter()
+        model_train.train_streaming(model, tmp, epochs=1, batch_size=batch_size, validation_split=0.0,
+                                    checkpoint_dir=os.path.join(tmp, 'checkpoints'), checkpoint_every=10 ** 6)
+        elapsed = time.perf_counter() - start
+
+    return {"windows": windows, "batch_size": batch_size, "epoch_seconds": elapsed, "windows_per_second": windows / elapsed}
+
+
+# Function to benchmark encoder_with_folder_data.py scoring a folder of normalized window CSVs
+def bench_folder_scoring(files, backend, model_path):
+    from scoring import load_scoring_model, FEATURE_COLUMNS
+    from encoder_with_folder_data import score_folder
+
+    model = load_scoring_model(model_path, backend)
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(files):
+            pd.DataFrame(rng.random((25, 12)), columns=FEATURE_COLUMNS).to_csv(os.path.join(tmp, f"SYN{i:04d}USDT_{i}_training_data.csv"), index=False)
+        start = time.perf_counter()
+        score_folder(model, tmp, verbose=0)
+        elapsed = time.perf_counter() - start
+
+    return {"files": files, "seconds": elapsed, "files_per_second": files / elapsed}
+
+
+# Function to run one benchmark function and report its timings along with the process's peak RSS
+def run_isolated(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    result["wall_seconds"] = time.perf_counter() - start
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+# Function to run a benchmark in a fresh spawned interpreter so imports and memory are not shared between runs
+def run_benchmark(function, *args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        try:
+            return executor.submit(run_isolated, function, *args).result()
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {e}"}
+
+
+# Function to print the headline number of each benchmark, with the change against a baseline run if given
+def print_summary(results, baseline=None):
+    previous = {result["name"]: result for result in baseline["results"]} if baseline else {}
+    print(f"{'benchmark':<32} {'seconds':>9} {'peak MB':>8} {'vs base':>8}")
+    for result in results:
+        seconds = result.get("wall_seconds")
+        if "error" in result or "skipped" in result:
+            print(f"{result['name']:<32} {result.get('error') or result.get('skipped')}")
+            continue
+        change = ""
+        base = previous.get(result["name"], {}).get("wall_seconds")
+        if base:
+            change = f"{(seconds - base) / base:+.0%}"
+        print(f"{result['name']:<32} {seconds:>9.3f} {result['peak_rss_mb']:>8.0f} {change:>8}")
+        for cycle, stats in result.get("cycles", {}).items():
+            print(f"  {cycle:<6} fetch {stats['fetch_seconds']:.3f}s, scoring tail {stats['score_tail_seconds']:.3f}s, "
+                  f"{stats['symbols_per_second']:.0f} symbols/s, {stats['rate_limited']} x 429, {stats['failed']} failed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scan cycle and offline paths, writing JSON results per commit.")
+    parser.add_argument("--symbols", type=int, nargs='+', default=[10, 100, 500, 2000], help="Universe sizes for the scan cycle benchmark")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated server latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests the stand-in answers with 429")
+    parser.add_argument("--concurrency", type=int, default=20, help="Maximum Binance requests in flight")
+    parser.add_argument("--micro-batch", type=int, default=64, help="Windows scored together during a cycle")
+    parser.add_argument("--real-limits", action='store_true', help="Keep Binance's request weight limits, by default they are lifted for the stand-in")
+    parser.add_argument("--backend", choices=['keras', 'numpy'], default='numpy', help="Inference backend for the scoring benchmarks")
+    parser.add_argument("--model", default='autoencoder_model.h5', help="Autoencoder .h5 file to score with")
+    parser.add_argument("--rows", type=int, default=CANDLES_PER_YEAR, help="Candles in the synthetic analyze_data input")
+    parser.add_argument("--format", choices=['csv', 'npy', 'both'], default='npy', help="analyze_data output format")
+    parser.add_argument("--train-windows", type=int, default=20000, help="Windows in the synthetic training epoch")
+    parser.add_argument("--batch-size", type=int, default=32, help="Training mini-batch size")
+    parser.add_argument("--folder-files", type=int, default=500, help="Window CSVs in the folder scoring benchmark")
+    parser.add_argument("--skip-scan", action='store_true', help="Only run the offline benchmarks")
+    parser.add_argument("--skip-offline", action='store_true', help="Only run the scan cycle benchmarks")
+    parser.add_argument("--baseline", default=None, help="Earlier results JSON to compare against")
+    parser.add_argument("-o", "--output-dir", default=RESULTS_DIR, help="Folder for the results JSON")
+    args = parser.parse_args()
+
+    benchmarks = []
+    if not args.skip_scan:
+        for count in args.symbols:
+            benchmarks.append((f"scan_cycle_{count}", bench_scan_cycle, count, args.latency, args.error_rate, args.backend,
+                               args.model, args.concurrency, args.micro_batch, args.real_limits))
+    if not args.skip_offline:
+        benchmarks.append(("analyze_data", bench_analyze_data, args.rows, args.format))
+        benchmarks.append(("train_epoch", bench_train_epoch, args.train_windows, args.batch_size))
+        benchmarks.append(("folder_scoring", bench_folder_scoring, args.folder_files, args.backend, args.model))
+
+    results = []
+    for name, function, *function_args in benchmarks:
+        print(f"Running {name}..")
+        result = run_benchmark(function, *function_args)
+        result["name"] = name
+        results.append(result)
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+        "results": results,
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_summary(results, baseline)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(args.output_dir, f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}_{commit}.json")
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output_path}")
@@ -0,0 +1,207 @@
+import os
+import time
+import asyncio
+import aiohttp
+from scan_metrics import NULL_METRICS
+
+# Async Binance fetch layer, one pooled keep-alive session with bounded concurrency and a
+# request-weight-aware scheduler so a full symbol sweep stays inside Binance's limits
+
+# Base URLs can be pointed at a local stand-in server (see fake_binance.py)
+FAPI_BASE_URL = os.environ.get('BINANCE_FAPI_URL', 'https://fapi.binance.com')
+FUTURES_DATA_BASE_URL = os.environ.get('BINANCE_FUTURES_DATA_URL', 'https://www.binance.com')
+
+# fapi allows 2400 request weight per minute, futures/data allows 1000 requests per 5 minutes
+FAPI_WEIGHT_PER_MINUTE = 2400
+FUTURES_DATA_REQUESTS_PER_5M = 1000
+
+RETRY_STATUS_CODES = (418, 429, 500, 502, 503, 504)
+
+
+# Function to get the request weight of a klines call for a given limit
+def kline_weight(limit):
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+class WeightScheduler:
+    """
+    Token bucket tracking request weight spent against a rolling budget.
+
+    Tokens refill continuously at capacity / period per second, callers await acquire(weight)
+    before sending a request. Used-weight headers returned by Binance tighten the bucket when
+    other processes on the same IP are spending weight too.
+    """
+
+    def __init__(self, capacity, period=60.0, used_weight_header=None):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.used_weight_header = used_weight_header
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, weight=1):
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                await asyncio.sleep((weight - self.tokens) / self.rate)
+
+    def observe(self, headers):
+        if self.used_weight_header is None:
+            return
+        used = headers.get(self.used_weight_header)
+        if used is None:
+            return
+        try:
+            self.tokens = min(self.tokens, self.capacity - float(used))
+        except ValueError:
+            pass
+
+    def penalize(self, seconds):
+        # Drain the bucket so nothing else is sent until the server's retry window passes
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+# Function to parse the openInterestHist payload into (sumOpenInterest, sumOpenInterestValue, timestamp) tuples
+def parse_open_interest(data):
+    return [(item.get('sumOpenInterest'), item.get('sumOpenInterestValue'), item.get('timestamp')) for item in data if item.get('sumOpenInterest') and item.get('sumOpenInterestValue')]
+
+
+# Function to parse the klines payload, dropping malformed rows
+def parse_klines(data):
+    return [item for item in data if len(item) > 1]
+
+
+class BinanceFetcher:
+    """
+    Async client for the klines and openInterestHist endpoints.
+
+    Use as an async context manager so the pooled session is opened and closed once per run:
+
+        async with BinanceFetcher() as fetcher:
+            results = await fetcher.fetch_all([("BTCUSDT", 25), ("ETHUSDT", 1)])
+    """
+
+    def __init__(self, fapi_base_url=None, futures_data_base_url=None, max_concurrency=20, retries=3, backoff=0.5, timeout=10.0,
+                 fapi_weight_per_minute=FAPI_WEIGHT_PER_MINUTE, futures_data_requests_per_5m=FUTURES_DATA_REQUESTS_PER_5M, metrics=NULL_METRICS):
+        self.fapi_base_url = (fapi_base_url or FAPI_BASE_URL).rstrip('/')
+        self.futures_data_base_url = (futures_data_base_url or FUTURES_DATA_BASE_URL).rstrip('/')
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.fapi_weight_per_minute = fapi_weight_per_minute
+        self.futures_data_requests_per_5m = futures_data_requests_per_5m
+        self.metrics = metrics
+        self.session = None
+        self.semaphore = None
+        self.fapi_scheduler = None
+        self.futures_data_scheduler = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.fapi_scheduler = WeightScheduler(self.fapi_weight_per_minute, 60.0, 'X-MBX-USED-WEIGHT-1M')
+        self.futures_data_scheduler = WeightScheduler(self.futures_data_requests_per_5m, 300.0)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+
+    async def _get_json(self, scheduler, url, params, weight=1, endpoint=None):
+        for attempt in range(self.retries + 1):
+            await scheduler.acquire(weight)
+            retry_after = None
+            try:
+                async with self.semaphore:
+                    async with self.session.get(url, params=params) as response:
+                        scheduler.observe(response.headers)
+                        if response.status == 200:
+                            return await response.json(content_type=None)
+                        if response.status not in RETRY_STATUS_CODES:
+                            return None
+                        reason = str(response.status)
+                        if response.headers.get('Retry-After'):
+                            retry_after = float(response.headers['Retry-After'])
+                            scheduler.penalize(retry_after)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                reason = type(e).__name__
+
+            if attempt < self.retries:
+                self.metrics.inc("scan_fetch_retries_total", endpoint=endpoint, reason=reason)
+                # After a Retry-After the drained bucket already holds the next acquire back for the whole window
+                if retry_after is None:
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+
+        return None
+
+    # Function to fetch open interest data
+    async def fetch_open_interest_data(self, symbol, limit=1):
+        url = f"{self.futures_data_base_url}/futures/data/openInterestHist"
+        with self.metrics.timer("scan_fetch_seconds", endpoint='openInterestHist'):
+            data = await self._get_json(self.futures_data_scheduler, url, {'symbol': symbol, 'period': '5m', 'limit': limit}, endpoint='openInterestHist')
+        if data is None:
+            self.metrics.inc("scan_fetch_failures_total", endpoint='openInterestHist')
+            print(f"Failed to fetch open interest data for {symbol}.")
+            return None
+        return parse_open_interest(data)
+
+    # Function to fetch kline data
+    async def fetch_kline_data(self, symbol, limit=1):
+        url = f"{self.fapi_base_url}/fapi/v1/klines"
+        with self.metrics.timer("scan_fetch_seconds", endpoint='klines'):
+            data = await self._get_json(self.fapi_scheduler, url, {'symbol': symbol, 'interval': '5m', 'limit': limit}, kline_weight(limit), endpoint='klines')
+        if data is None:
+            self.metrics.inc("scan_fetch_failures_total", endpoint='klines')
+            print(f"Failed to fetch kline data for {symbol}.")
+            return None
+        return parse_klines(data)
+
+    # Function to fetch the futures exchange info, the listing of every contract and its status
+    async def fetch_exchange_info(self):
+        url = f"{self.fapi_base_url}/fapi/v1/exchangeInfo"
+        data = await self._get_json(self.fapi_scheduler, url, {}, 1, endpoint='exchangeInfo')
+        if data is None:
+            print("Failed to fetch exchange info.")
+        return data
+
+    async def fetch_symbol(self, symbol, limit=1):
+        open_interest_data, kline_data = await asyncio.gather(self.fetch_open_interest_data(symbol, limit), self.fetch_kline_data(symbol, limit))
+        return symbol, open_interest_data, kline_data
+
+    async def fetch_all(self, symbol_limits):
+        """
+        Fetch both endpoints for every symbol in parallel.
+
+        Parameters:
+        symbol_limits (list): (symbol, limit) pairs
+
+        Returns:
+        list: (symbol, open_interest_data, kline_data) in the same order, failed fetches are None
+        """
+        return await asyncio.gather(*(self.fetch_symbol(symbol, limit) for symbol, limit in symbol_limits))
+
+
+# Function to run a full fetch from synchronous code
+def fetch_all_symbols(symbol_limits, **kwargs):
+    async def run():
+        async with BinanceFetcher(**kwargs) as fetcher:
+            return await fetcher.fetch_all(symbol_limits)
+
+    return asyncio.run(run())
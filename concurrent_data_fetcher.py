@@ -1,52 +1,28 @@
 import os
+import argparse
 import requests
-from multiprocessing import Pool
 import time
-from datetime import datetime, timedelta
-import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
-from tensorflow.keras.models import load_model
+import asyncio
+from datetime import datetime
 import numpy as np
-import csv
-from sklearn.metrics.pairwise import cosine_similarity
 import json
-
-# Run this to grab latest 200 data points of data, format it, normalize it and then feed into the model
+from scoring import reconstruction_metrics, load_scoring_model, CheckpointWatcher
+from quantize_model import RESIDENT_MODES
+from window_store import WindowStore
+from binance_fetcher import BinanceFetcher
+from scan_scheduler import CandleScheduler, run_pipelined_cycle, GRACE_SECONDS, MICRO_BATCH
+from scan_metrics import ScanMetrics, NULL_METRICS
+from universe import UniverseManager, concurrent_data_symbols, sync_concurrent_data, CACHE_PATH
+from alert_dispatcher import AlertDispatcher, WEBHOOK_URL, ALERT_THRESHOLD, COOLDOWN_SECONDS
+from latent_index import LatentIndex, describe_neighbour
+
+# Run this to keep the latest 25 data points of every symbol in memory, normalize them and then feed into the model at every candle close
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'  # 0 (default) shows all, 2 suppresses INFO messages, 3 also suppresses WARNING messages
 # Initialize variables to store the highest cosine similarity and its associated symbol and timestamp
 highest_cosine_similarity = 0.0
 highest_cosine_similarity_symbol = ""
 highest_cosine_similarity_timestamp = ""
-# Load the pre-trained autoencoder model
-model = load_model('autoencoder_model.h5')
-# Dictionary to track MSE for each symbol
-mse_dict = {}
-
-
-# Function to fetch open interest data
-def fetch_open_interest_data(symbol, limit=1):
-    endpoint = f"https://www.binance.com/futures/data/openInterestHist?symbol={symbol}&period=5m&limit={limit}"
-    response = requests.get(endpoint)
-    if response.status_code == 200:
-        data = response.json()
-        open_interest_data = [(item.get('sumOpenInterest'), item.get('sumOpenInterestValue'), item.get('timestamp')) for item in data if item.get('sumOpenInterest') and item.get('sumOpenInterestValue')]
-        return open_interest_data
-    else:
-        print(f"Failed to fetch open interest data for {symbol}.")
-
-    return None
-
-# Function to fetch kline data
-def fetch_kline_data(symbol, limit=1):
-    endpoint = f"https://fapi.binance.com/fapi/v1/klines?symbol={symbol}&interval=5m&limit={limit}"
-    response = requests.get(endpoint)
-    if response.status_code == 200:
-        data = response.json()
-        kline_data = [item for item in data if len(item) > 1]
-        return kline_data
-    else:
-        print(f"Failed to fetch kline data for {symbol}.")
-        return None
+
 
 # Function to calculate volume_delta
 def calculate_volume_delta(data):
@@ -58,98 +34,39 @@ def calculate_volume_delta(data):
         print("Invalid data format. Could not calculate volume_delta.")
         return None
 
-# Function to save data to CSV
-def save_to_csv(args):
-    filename, open_interest_data, kline_data = args
-    headers = ["timestamp", "sum_open_interest", "sum_open_interest_value", "open", "high", "low", "close", "volume", "quote_volume", "count", "taker_buy_volume", "taker_buy_quote_volume", "volume_delta"]
-
-    try:
-        data_list = []
-        for oi, kline in zip(open_interest_data, kline_data):
-            open_interest = int(round(float(oi[0])))
-            open_interest_value = oi[1]
-            taker_buy_volume = int(round(float(kline[9])))
-            volume_delta = calculate_volume_delta(kline)
-            data_list.append([oi[2], open_interest, open_interest_value, kline[1], kline[2], kline[3], kline[4], kline[5], kline[7], kline[8], taker_buy_volume, kline[10], volume_delta])
-
-        df = pd.DataFrame(data_list, columns=headers)
-        df.sort_values(by=['timestamp'], ascending=True, inplace=True)
-        df.drop(columns=['timestamp'], inplace=True)
-        df.to_csv(filename, index=False)  # Removed header=False to keep headers
-    except Exception as e:
-        print(f"Failed to write data to {filename}: {str(e)}")
-
-
-# Dictionary to track whether it's the first run for each file
-first_run_dict = {}
-
-# Function to process CSV file
-def process_csv_file(csv_file):
-    global first_run_dict
-
-    symbol = csv_file.split('_')[0]
-
-    # Check if it's the first run for this file
-    if symbol not in first_run_dict:
-        open_interest_data = fetch_open_interest_data(symbol, limit=25)
-        kline_data = fetch_kline_data(symbol, limit=25)
-
-        # Set the first run flag to False after the first run
-        first_run_dict[symbol] = False
-    else:
-        open_interest_data = fetch_open_interest_data(symbol, limit=1)
-        kline_data = fetch_kline_data(symbol, limit=1)
-
-    if open_interest_data is not None and kline_data is not None:
-        filename = os.path.join('concurrent_data', csv_file)
-        save_to_csv((filename, open_interest_data, kline_data))
-
-# Function to normalize and min-max a column of data
-def normalize_column(column_data):
-    # Reshape the data for MinMaxScaler
-    column_data = column_data.values.reshape(-1, 1)
-
-    # Apply Min-Max scaling
-    scaler = MinMaxScaler()
-    normalized_column = scaler.fit_transform(column_data)
-
-    return normalized_column
+# Function to turn fetched open interest and kline data into timestamped feature rows
+def build_feature_rows(open_interest_data, kline_data):
+    timestamps = []
+    rows = []
+    for oi, kline in zip(open_interest_data, kline_data):
+        open_interest = int(round(float(oi[0])))
+        open_interest_value = float(oi[1])
+        taker_buy_volume = int(round(float(kline[9])))
+        volume_delta = calculate_volume_delta(kline)
+        timestamps.append(int(oi[2]))
+        rows.append([open_interest, open_interest_value, float(kline[1]), float(kline[2]), float(kline[3]), float(kline[4]), float(kline[5]), float(kline[7]), float(kline[8]), taker_buy_volume, float(kline[10]), volume_delta])
 
-def send_to_discord_webhook(content):
-    webhook_url = 'https://discord.com/api/webhooks/1155503541562114109/84mkMKX4KLQ30EQi0SQSjWfx1HyuCRHZb0kwVOVwNRrSDGRbJIlSEkTT2s6ptIIiU3VB'
-    payload = {'content': content}
-    headers = {'Content-Type': 'application/json'}
+    return np.array(timestamps, dtype=np.int64), np.array(rows, dtype=np.float64).reshape(-1, 12)
 
-    response = requests.post(webhook_url, json=payload, headers=headers)
-
-    if response.status_code == 204:
-        print('Message sent to Discord webhook successfully.')
-    else:
-        print(f'Failed to send message to Discord webhook. Status code: {response.status_code}')
 
 def calculate_cosine_similarity(data, decoded_data):
     """
     Calculate cosine similarity between the input data and decoded data.
 
     Parameters:
-    data (ndarray): Input data with shape (1, 200, 12)
+    data (ndarray): Input data with shape (1, 25, 12)
     decoded_data (ndarray): Decoded output data with shape (1, 12)
 
     Returns:
     float: Cosine similarity
     """
-    # Flatten the input data and reshape the decoded data to match
-    data_flat = data.reshape(-1, data.shape[-1])  # reshape to (200, 12)
-    decoded_data_broadcasted = np.tile(decoded_data, (data.shape[1], 1))  # repeat decoded_data along axis 1 to match (200, 12)
-
-    # Calculate Cosine Similarity
-    cosine_sim = cosine_similarity(data_flat, decoded_data_broadcasted)
+    cosine_sim, _, _ = reconstruction_metrics(data.reshape(-1, data.shape[-2], data.shape[-1]), decoded_data.reshape(-1, data.shape[-1]))
 
     return cosine_sim.mean()  # Return the mean cosine similarity
 
 
 def send_heartbeat():
-    webhook_url = "https://discord.com/api/webhooks/1155503541562114109/84mkMKX4KLQ30EQi0SQSjWfx1HyuCRHZb0kwVOVwNRrSDGRbJIlSEkTT2s6ptIIiU3VB"
+    webhook_url = WEBHOOK_URL
     message = "Hourly Heartbeat Check"
 
     payload = {
@@ -169,70 +86,163 @@ def send_heartbeat():
     except requests.exceptions.RequestException as e:
         print(f"An error occurred: {e}")
 
-if __name__ == "__main__":
-    # Run the script periodically at 5-minute intervals within an hour
-    while True:
-
-        # Get the current time
-        now = datetime.now()
-
-        current_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
-        print("________________________________________________________________________")
-        print("Current Timestamp with Hours and Minutes:", current_timestamp)
-        csv_files = [csv_file for csv_file in os.listdir('concurrent_data') if csv_file.endswith('.csv')]
-
-        with Pool(3) as pool:
-            pool.map(process_csv_file, csv_files)
-
-        # Get the current timestamp with hours and minutes
-        # Print the timestamp
-        print("Latest data fully retieved..")
-
-        # Process and normalize each CSV file
-        for csv_file in csv_files:
-            csv_file_path = os.path.join('concurrent_data', csv_file)
-            try:
-                # Load the CSV file into a DataFrame
-                df = pd.read_csv(csv_file_path)
-
-                # Iterate through each column
-                for col in df.columns:
-                    # Normalize and min-max the column
-                    df[col] = normalize_column(df[col])
-
-                # Save the normalized data back to the same CSV file
-                df.to_csv(csv_file_path, index=False)
-
-                # Read the data (excluding the header) and convert to numpy array
-                data = np.genfromtxt(csv_file_path, delimiter=',', skip_header=1)
+# Function to print, track and alert on a cycle's ranked results, alerts are handed to the dispatcher in one batch
+def report_results(results, dispatcher, candle_close=None, describe=None):
+    global highest_cosine_similarity, highest_cosine_similarity_symbol, highest_cosine_similarity_timestamp
+
+    for row in results.itertuples(index=False):
+        symbol = row.symbol
+        cosine_sim = row.cosine_sim
+
+        if cosine_sim > highest_cosine_similarity:
+            highest_cosine_similarity = cosine_sim
+            highest_cosine_similarity_symbol = symbol
+            highest_cosine_similarity_timestamp = datetime.now().strftime('%Y-%m-%d %H:%M')
+
+        message = symbol + ' with Cosine Sim of: ' + str(cosine_sim)
+
+        print(message)
+
+    # Send every symbol with a Cosine Sim of at least 0.94 to the Discord webhook without waiting on delivery
+    alerts = results.loc[results["cosine_sim"] >= ALERT_THRESHOLD, ["symbol", "cosine_sim"]]
+    if len(alerts) and dispatcher.enabled:
+        # describe maps the alerting symbols to a note for their alert line, e.g. their nearest historical setups
+        notes = describe(list(alerts["symbol"])) if describe is not None else None
+        queued = dispatcher.submit_cycle(list(alerts.itertuples(index=False, name=None)), candle_close, notes)
+        if queued < len(alerts):
+            print(f"{len(alerts) - queued} alert(s) skipped, already sent within the cooldown or still being delivered.")
+
+
+# Function to match each alerting symbol's window to its nearest pre-surge training windows
+def nearest_setups(latent_index, store, symbols, k=3):
+    symbols = [symbol for symbol in symbols if symbol in store.index and store.is_ready(symbol)]
+    if not symbols or len(latent_index) == 0:
+        return {}
+    start = time.perf_counter()
+    windows = np.stack([store.normalized_window(symbol) for symbol in symbols])
+    notes = {symbol: ", ".join(describe_neighbour(row) for row in neighbours.itertuples(index=False))
+             for symbol, neighbours in zip(symbols, latent_index.neighbours(windows, k))}
+    print(f"Nearest historical setups, looked up in {(time.perf_counter() - start) * 1000:.1f} ms:")
+    for symbol, note in notes.items():
+        print(f"{symbol} looks like {note}")
+    return notes
+
+
+# Function to point the latent index at the model the scanner scores with, re-encoding the training windows if it was built with another
+def sync_latent_index(latent_index, model_path, root):
+    if latent_index.model_path != model_path:
+        latent_index.use_model(model_path)
+    if len(latent_index) == 0:
+        start = time.perf_counter()
+        latent_index.update(root)
+        latent_index.save()
+        print(f"Latent index rebuilt for {model_path}, {len(latent_index)} historical setups in {time.perf_counter() - start:.1f}s.")
+
+
+# Function to pick up listings and delistings between cycles, only new symbols need a full window fetch
+async def refresh_universe(universe, store):
+    symbols, added, removed = await universe.refresh()
+    if not added and not removed:
+        return
+    store.set_symbols(symbols)
+    sync_concurrent_data(added, removed)
+    if added:
+        print(f"Now scanning {len(added)} new symbol(s): {', '.join(added[:20])}" + (" .." if len(added) > 20 else ""))
+    if removed:
+        print(f"Stopped scanning {len(removed)} delisted symbol(s): {', '.join(removed[:20])}" + (" .." if len(removed) > 20 else ""))
+
+
+# Function to run the scan at every 5m candle close, reusing one pooled Binance session
+async def scan_forever(store, model, args, dispatcher, metrics=NULL_METRICS, latent_index=None, watcher=None):
+    describe = None
+    if latent_index is not None:
+        describe = lambda symbols: nearest_setups(latent_index, store, symbols, args.neighbours)
+    async with BinanceFetcher(max_concurrency=args.concurrency, metrics=metrics) as fetcher:
+        universe = None if args.static_universe else UniverseManager(fetcher, store.symbols, args.universe_cache)
+        async for candle_close, skipped in CandleScheduler(grace=args.grace):
+            metrics.begin_cycle()
+            print("________________________________________________________________________")
+            print("Candle Close:", datetime.fromtimestamp(candle_close).strftime("%Y-%m-%d %H:%M"))
+            if skipped:
+                print(f"Previous cycle overran, skipped {skipped} candle(s).")
+
+            results, stats = await run_pipelined_cycle(fetcher, store, model, store.symbols, build_feature_rows, micro_batch=args.micro_batch, metrics=metrics)
+            store.flush()
+
+            if latent_index is not None and latent_index.reload_if_changed():
+                print(f"Latent index reloaded, {len(latent_index)} historical setups.")
+            report_results(results, dispatcher, candle_close, describe)
+
+            print(f"Highest Cosine Similarity: {highest_cosine_similarity}, Symbol: {highest_cosine_similarity_symbol}, Timestamp: {highest_cosine_similarity_timestamp}")
+            latency = f"{stats['last_score'] - candle_close:.1f}s" if stats['last_score'] else "n/a"
+            print(f"Round Complete: {stats['scored']} scored in {stats['batches']} batches, {stats['failed']} failed, "
+                  f"fetch {stats['fetch_done'] - stats['started']:.1f}s, candle close to last score {latency}")
+
+            metrics.end_cycle(candle_close=candle_close, skipped=skipped, fetched=stats['fetched'], failed=stats['failed'],
+                              scored=stats['scored'], batches=stats['batches'], fetch_seconds=stats['fetch_done'] - stats['started'])
+            if args.metrics_file:
+                metrics.write_prometheus(args.metrics_file)
+
+            if universe is not None:
+                await refresh_universe(universe, store)
+
+            # Swap in a newer fine-tuned checkpoint, the next cycle scores with it
+            reloaded = watcher.poll() if watcher is not None else None
+            if reloaded is not None:
+                model, pointer = reloaded
+                print(f"Hot-reloaded checkpoint v{pointer['version']} ({pointer['model']}).")
+                # The neighbour lookups have to encode with the same model the scanner now scores with
+                if latent_index is not None:
+                    sync_latent_index(latent_index, watcher.model_path, args.latent_root)
 
-                # Reshape the data to match the model's expected input shape for an autoencoder
-                data = data.reshape((1, 25, 12))
 
-                # Predict using the autoencoder model
-                decoded_data = model.predict(data, verbose=0)
-
-                # Get the symbol from the file name
-                symbol = csv_file.split('_')[0]
-
-                cosine_sim = calculate_cosine_similarity(data, decoded_data)
-
-                if cosine_sim > highest_cosine_similarity:
-                    highest_cosine_similarity = cosine_sim
-                    highest_cosine_similarity_symbol = symbol
-                    highest_cosine_similarity_timestamp = datetime.now().strftime('%Y-%m-%d %H:%M')
-
-                message = symbol + ' with Cosine Sim of: ' + str(cosine_sim)
-
-                print(message)
-
-                # Send the message to Discord webhook if Cosine Sim is greater than 0.98
-                if cosine_sim >= 0.94:
-                    send_to_discord_webhook(message)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scan every concurrent_data symbol with the autoencoder at every 5m candle close.")
+    parser.add_argument("--snapshot-dir", default=None, help="Directory to memory-map the window store into so restarts resume without refetching")
+    parser.add_argument("--concurrency", type=int, default=20, help="Maximum Binance requests in flight")
+    parser.add_argument("--model", default='autoencoder_model.h5', help="Autoencoder .h5 file to score with")
+    parser.add_argument("--backend", choices=['keras', 'numpy'], default='keras', help="Run the model with TensorFlow or the NumPy inference engine")
+    parser.add_argument("--resident", choices=RESIDENT_MODES, default='float32', help="For an int8 .npz from quantize_model.py, keep its kernels int8 in memory with 'quantized'")
+    parser.add_argument("--grace", type=float, default=GRACE_SECONDS, help="Seconds after each candle close to wait for openInterestHist to publish")
+    parser.add_argument("--micro-batch", type=int, default=MICRO_BATCH, help="Windows scored together while other fetches are still in flight")
+    parser.add_argument("--webhook-url", default=None, help="Discord webhook for alerts, defaults to the DISCORD_WEBHOOK_URL environment variable")
+    parser.add_argument("--alert-cooldown", type=float, default=COOLDOWN_SECONDS, help="Seconds before the same symbol is alerted again")
+    parser.add_argument("--static-universe", action='store_true', help="Only scan the concurrent_data symbols, never pick up new listings")
+    parser.add_argument("--universe-cache", default=CACHE_PATH, help="Exchange info and probe cache shared with create_concurrent_files.py")
+    parser.add_argument("--metrics-file", default=None, help="Write Prometheus text-format metrics here after every cycle")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on http://<host>:<port>/metrics")
+    parser.add_argument("--metrics-log", default=None, help="Append one JSON line of stage timings per cycle to this rolling log")
+    parser.add_argument("--latent-index", default=None, help="Latent index folder from latent_index.py, alerts then list their nearest historical setups")
+    parser.add_argument("--latent-root", default='.', help="Folder of training data the latent index is rebuilt from when the scoring model changes")
+    parser.add_argument("--neighbours", type=int, default=3, help="Historical setups listed per alert")
+    parser.add_argument("--checkpoint-pointer", default=None, help="Follow this latest.json from model_train.py --mode incremental, reloading the model between cycles when it moves")
+    args = parser.parse_args()
+
+    # Load the pre-trained autoencoder model, or the latest fine-tuned checkpoint when following a pointer
+    model = load_scoring_model(args.model, args.backend, args.resident)
+    model_path = args.model
+    watcher = CheckpointWatcher(args.checkpoint_pointer, args.backend, args.resident) if args.checkpoint_pointer else None
+    if watcher is not None:
+        loaded = watcher.poll()
+        if loaded is not None:
+            model, pointer = loaded
+            model_path = watcher.model_path
+            print(f"Scoring with checkpoint v{pointer['version']} ({pointer['model']}).")
+    latent_index = None
+    if args.latent_index:
+        latent_index = LatentIndex(args.latent_index, model_path)
+        sync_latent_index(latent_index, model_path, args.latent_root)
+
+    all_symbols = concurrent_data_symbols()
+    if args.snapshot_dir:
+        store = WindowStore.load(args.snapshot_dir, all_symbols)
+    else:
+        store = WindowStore(all_symbols)
 
-            except Exception as e:
-                print(f"Error processing {csv_file_path}: {str(e)}")
+    # Instrumentation stays disabled, and free, unless an output for it was asked for
+    metrics = ScanMetrics(enabled=bool(args.metrics_file or args.metrics_port or args.metrics_log), log_path=args.metrics_log)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
 
-        print(f"Highest Cosine Similarity: {highest_cosine_similarity}, Symbol: {highest_cosine_similarity_symbol}, Timestamp: {highest_cosine_similarity_timestamp}")
-        print('Round Complete')
-        time.sleep(300)  # Delay for 5 minutes before running again
+    with AlertDispatcher(args.webhook_url, cooldown=args.alert_cooldown, metrics=metrics) as dispatcher:
+        asyncio.run(scan_forever(store, model, args, dispatcher, metrics, latent_index, watcher))
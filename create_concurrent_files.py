@@ -1,52 +1,41 @@
 import os
-import csv
-import requests
-from binance.client import Client
+import asyncio
+import argparse
+from binance_fetcher import BinanceFetcher
+from universe import UniverseManager, concurrent_data_symbols, sync_concurrent_data, CACHE_PATH, CONCURRENT_DATA_DIR
 
 # Run this to create the concurrent files, based off avialble Binance tickers
-
-# Function to check if a symbol contains certain words
-def contains_invalid_words(symbol):
-    invalid_words = ['BULL', 'BEAR', 'UP', 'DOWN']
-    for word in invalid_words:
-        if word in symbol:
-            return True
-    return False
-
-# Function to check if the response is empty
-def is_empty_response(response):
-    return len(response.json()) == 0
+# Symbols are probed concurrently and the results cached in universe_cache.json, so a rerun only
+# probes new listings and only adds or removes the files that changed
 
 # Creates the concurrent tracking files
-def get_usdt_symbols():
-    client = Client()
-    info = client.futures_exchange_info()
-    symbols = [symbol['symbol'] for symbol in info['symbols'] if symbol['quoteAsset'] == 'USDT' and not contains_invalid_words(symbol['symbol'])]
-    return symbols
-
-def create_csv_file(symbol):
-    endpoint = f"https://www.binance.com/futures/data/openInterestHist?symbol={symbol}&period=5m&limit=1"
-    response = requests.get(endpoint)
-
-    if is_empty_response(response):
-        print(f"No data available for {symbol}. Skipping file creation.")
-        return
+async def update_universe(folder, cache_path, force, prune, concurrency):
+    async with BinanceFetcher(max_concurrency=concurrency) as fetcher:
+        universe = UniverseManager(fetcher, concurrent_data_symbols(folder), cache_path)
+        symbols, added, removed = await universe.refresh(force)
 
-    file_name = f"{symbol}_concurrent_data.csv"
-    file_path = os.path.join("concurrent_data", file_name)
+    sync_concurrent_data(added, removed if prune else [], folder)
+    for symbol in added:
+        print(f"CSV file created for {symbol}: {symbol}_concurrent_data.csv")
+    for symbol in removed:
+        if prune:
+            print(f"CSV file removed for delisted {symbol}.")
+        else:
+            print(f"{symbol} is no longer listed, rerun with --prune to remove its file.")
+    return symbols
 
-    with open(file_path, "w", newline="") as csvfile:
-        # Do not write any headers
-        pass
 
 if __name__ == "__main__":
-    # Ensure the 'concurrent_data' directory exists
-    os.makedirs("concurrent_data", exist_ok=True)
+    parser = argparse.ArgumentParser(description="Create a concurrent_data file for every listed USDT perpetual with open interest history.")
+    parser.add_argument("-o", "--folder", default=CONCURRENT_DATA_DIR, help="Folder for the tracking files")
+    parser.add_argument("--cache", default=CACHE_PATH, help="Exchange info and probe cache")
+    parser.add_argument("--force", action='store_true', help="Ignore the cache TTLs and probe every symbol again")
+    parser.add_argument("--prune", action='store_true', help="Remove the files of symbols that are no longer listed")
+    parser.add_argument("--concurrency", type=int, default=20, help="Maximum Binance requests in flight")
+    args = parser.parse_args()
 
-    # Get all USDT-traded symbols on Binance
-    usdt_symbols = get_usdt_symbols()
+    # Ensure the 'concurrent_data' directory exists
+    os.makedirs(args.folder, exist_ok=True)
 
-    # Create CSV files for each symbol
-    for symbol in usdt_symbols:
-        create_csv_file(symbol)
-        print(f"CSV file created for {symbol}: {symbol}_concurrent_data.csv")
+    symbols = asyncio.run(update_universe(args.folder, args.cache, args.force, args.prune, args.concurrency))
+    print(f"{len(symbols)} symbols in the universe.")
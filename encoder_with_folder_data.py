@@ -1,62 +1,240 @@
 import argparse
 import os
+import csv
+import glob
+import hashlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import pandas as pd
 import numpy as np
-from tensorflow.keras.models import load_model
-from sklearn.metrics.pairwise import cosine_similarity
+from scoring import load_scoring_model, reconstruction_metrics
+from generate_training_data import file_sha256
 
-# Run this with a specified folder contianing normalized data to test data with their MSE generated
+# Run this with one or more folders (or globs) containing normalized data to test data with their MSE generated
 # I.E If you have some training data you want to test or you create some new training data
+# Scores are cached per file content and model hash, so re-running an unchanged corpus only scores new windows
+
+CACHE_PATH = 'folder_score_cache.csv'
+RESULTS_PATH = 'mse_log.csv'
+BATCH_SIZE = 1024
+CACHE_COLUMNS = ["model_hash", "file_hash", "cosine_sim", "mse"]
+RESULT_COLUMNS = ["evaluated_at", "folder", "file", "symbol", "model", "model_hash", "file_hash", "cosine_sim", "mse", "cached"]
 
 def calculate_cosine_similarity(data, decoded_data):
     """
     Calculate cosine similarity between the input data and decoded data.
 
     Parameters:
-    data (ndarray): Input data with shape (1, 200, 12)
+    data (ndarray): Input data with shape (1, 25, 12)
     decoded_data (ndarray): Decoded output data with shape (1, 12)
 
     Returns:
     float: Cosine similarity
     """
-    # Flatten the input data and reshape the decoded data to match
-    data_flat = data.reshape(-1, data.shape[-1])  # reshape to (200, 12)
-    decoded_data_broadcasted = np.tile(decoded_data, (data.shape[1], 1))  # repeat decoded_data along axis 1 to match (200, 12)
-
-    # Calculate Cosine Similarity
-    cosine_sim = cosine_similarity(data_flat, decoded_data_broadcasted)
+    cosine_sim, _, _ = reconstruction_metrics(data.reshape(-1, data.shape[-2], data.shape[-1]), decoded_data.reshape(-1, data.shape[-1]))
 
     return cosine_sim.mean()  # Return the mean cosine similarity
 
-if __name__ == "__main__":
-    # Argument parsing
-    parser = argparse.ArgumentParser(description="Calculate MSE for CSV data using the autoencoder model.")
-    parser.add_argument("-d", "--folder", required=True, help="Folder containing CSV files")
-    args = parser.parse_args()
 
-    # Load the autoencoder model
-    model = load_model('autoencoder_model.h5')
+# Function to expand folders, globs and CSV paths into a sorted list of CSV files
+def expand_inputs(inputs):
+    paths = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            paths.update(glob.glob(os.path.join(pattern, '*.csv')))
+            continue
+        for match in glob.glob(pattern, recursive=True):
+            if os.path.isdir(match):
+                paths.update(glob.glob(os.path.join(match, '*.csv')))
+            elif match.endswith('.csv'):
+                paths.add(match)
+    return sorted(paths)
 
-    # Get a list of all CSV files in the specified folder
-    csv_files = [f for f in os.listdir(args.folder) if f.endswith('.csv')]
 
-    for csv_file in csv_files:
-        # Load the CSV data into a DataFrame
-        csv_path = os.path.join(args.folder, csv_file)
-        df = pd.read_csv(csv_path)
+# Function to hash a window file's content
+def content_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
 
-        # Assuming the input data is the first 200 rows and 12 columns
-        input_data = df.values[:25, :]
 
-        # Reshape the data to match the model's expected input shape for an autoencoder
-        input_data = input_data.reshape((1, 25, 12))
+# Function to parse a window CSV, the first rows of its numeric columns
+def read_window(path, sequence_length=25):
+    with open(path) as f:
+        lines = f.read().splitlines()
+    try:
+        # Plain comma separated numbers under one header row, parsed without pandas' per-file overhead
+        rows = [line.split(',') for line in lines[1:sequence_length + 1] if line]
+        return np.array(rows, dtype=np.float64)
+    except ValueError:
+        return pd.read_csv(path).select_dtypes('number').to_numpy(dtype=np.float64)[:sequence_length]
 
-        # Predict using the autoencoder model
-        decoded_data = model.predict(input_data)
 
-        # Get the symbol from the file name
-        symbol = os.path.basename(csv_file).split('_')[0]
+# Function to parse a chunk of window files inside a worker process
+def read_windows(paths, sequence_length=25):
+    return [read_window(path, sequence_length) for path in paths]
 
-        cs = calculate_cosine_similarity(input_data, decoded_data)
 
-        print(f"{symbol} - Cosine Sim: {cs:.4f}")
+class ScoreCache:
+    """
+    Append-only CSV of (model_hash, file_hash) -> scores.
+
+    Parameters:
+    path (str): Cache file, created on the first save
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.scores = {}
+        self.pending = []
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            cached = pd.read_csv(path, dtype={"model_hash": str, "file_hash": str})
+            self.scores = {(row.model_hash, row.file_hash): (row.cosine_sim, row.mse) for row in cached.itertuples(index=False)}
+
+    def get(self, model_hash, file_hash):
+        return self.scores.get((model_hash, file_hash))
+
+    def add(self, model_hash, file_hash, cosine_sim, mse):
+        self.scores[(model_hash, file_hash)] = (cosine_sim, mse)
+        self.pending.append((model_hash, file_hash, cosine_sim, mse))
+
+    def save(self):
+        if not self.pending:
+            return
+        write_header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if write_header:
+                writer.writerow(CACHE_COLUMNS)
+            writer.writerows(self.pending)
+        self.pending = []
+
+
+# Function to run the model over stacked windows in large batches
+def score_batches(model, windows, batch_size=BATCH_SIZE):
+    cosine_sim = np.empty(len(windows))
+    mse = np.empty(len(windows))
+    for start in range(0, len(windows), batch_size):
+        batch = windows[start:start + batch_size]
+        decoded_data = model.predict(batch, batch_size=len(batch), verbose=0)
+        cosine_sim[start:start + len(batch)], mse[start:start + len(batch)], _ = reconstruction_metrics(batch, decoded_data)
+    return cosine_sim, mse
+
+
+def evaluate_files(model, paths, model_hash=None, cache=None, workers=None, batch_size=BATCH_SIZE):
+    """
+    Score window CSVs, reusing cached scores for files the same model has already seen.
+
+    Parameters:
+    model: Object exposing predict(batch, batch_size=None, verbose=0)
+    paths (list): Window CSV files
+    model_hash (str): SHA-256 of the model file, required for caching
+    cache (ScoreCache): Cache to read from and add new scores to
+    workers (int): Processes parsing files in parallel
+    batch_size (int): Windows per predict call
+
+    Returns:
+    DataFrame: folder, file, symbol, file_hash, cosine_sim, mse and cached per file in path order
+    """
+    sequence_length = model.input_shape[1]
+    num_features = model.input_shape[2]
+    if cache is None or model_hash is None:
+        cache = None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashes = list(executor.map(content_hash, paths))
+
+    cosine_sim = np.full(len(paths), np.nan)
+    mse = np.full(len(paths), np.nan)
+    cached = np.zeros(len(paths), dtype=bool)
+    missing = []
+    for i, file_hash in enumerate(hashes):
+        hit = cache.get(model_hash, file_hash) if cache is not None else None
+        if hit is None:
+            missing.append(i)
+        else:
+            cosine_sim[i], mse[i] = hit
+            cached[i] = True
+
+    if missing:
+        # Parse the new files in chunks across processes, then score them together
+        chunk = max(1, len(missing) // (4 * (workers or os.cpu_count() or 1)))
+        chunks = [[paths[i] for i in missing[start:start + chunk]] for start in range(0, len(missing), chunk)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parsed = [window for windows in executor.map(read_windows, chunks, [sequence_length] * len(chunks)) for window in windows]
+
+        valid = [j for j, window in enumerate(parsed) if window.shape == (sequence_length, num_features)]
+        for j in set(range(len(parsed))) - set(valid):
+            print(f"Skipping {paths[missing[j]]}, expected {sequence_length} rows of {num_features} features but found {parsed[j].shape}.")
+
+        if valid:
+            windows = np.stack([parsed[j] for j in valid]).astype(np.float32)
+            new_cosine_sim, new_mse = score_batches(model, windows, batch_size)
+            for j, cs, error in zip(valid, new_cosine_sim, new_mse):
+                i = missing[j]
+                cosine_sim[i], mse[i] = cs, error
+                if cache is not None:
+                    cache.add(model_hash, hashes[i], cs, error)
+
+    return pd.DataFrame({
+        "folder": [os.path.dirname(path) for path in paths],
+        "file": [os.path.basename(path) for path in paths],
+        "symbol": [os.path.basename(path).split('_')[0] for path in paths],
+        "file_hash": hashes,
+        "cosine_sim": cosine_sim,
+        "mse": mse,
+        "cached": cached,
+    })
+
+
+# Function to score every CSV window in a folder
+def score_folder(model, folder, verbose=1):
+    results = evaluate_files(model, expand_inputs([folder]))
+    if verbose:
+        for row in results.itertuples(index=False):
+            print(f"{row.symbol} - Cosine Sim: {row.cosine_sim:.4f}")
+    return results
+
+
+# Function to append a run's results to the structured results file
+def append_results(results, path, model_path, model_hash):
+    results = results.assign(evaluated_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'), model=model_path, model_hash=model_hash)
+    write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+    results[RESULT_COLUMNS].to_csv(path, mode='a', header=write_header, index=False)
+
+
+if __name__ == "__main__":
+    # Argument parsing
+    parser = argparse.ArgumentParser(description="Calculate MSE for CSV data using the autoencoder model.")
+    parser.add_argument("-d", "--folder", required=True, nargs='+', help="Folders, globs or CSV files to score, e.g. '*USDT/*_training_data'")
+    parser.add_argument("--model", default='autoencoder_model.h5', help="Autoencoder .h5 file to score with")
+    parser.add_argument("--backend", choices=['keras', 'numpy'], default='keras', help="Run the model with TensorFlow or the NumPy inference engine")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="Processes parsing files in parallel")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Windows per predict call")
+    parser.add_argument("--results", default=RESULTS_PATH, help="CSV the results are appended to")
+    parser.add_argument("--cache", default=CACHE_PATH, help="Score cache keyed by file and model hash")
+    parser.add_argument("--no-cache", action='store_true', help="Score every file even if it is cached")
+    parser.add_argument("-v", "--verbose", action='store_true', help="Print every file's score")
+    args = parser.parse_args()
+
+    paths = expand_inputs(args.folder)
+    if not paths:
+        parser.error("No CSV files matched " + " ".join(args.folder))
+
+    # Load the autoencoder model
+    model = load_scoring_model(args.model, args.backend)
+    model_hash = file_sha256(args.model)
+    cache = None if args.no_cache else ScoreCache(args.cache)
+
+    results = evaluate_files(model, paths, model_hash, cache, args.workers, args.batch_size)
+    if cache is not None:
+        cache.save()
+    append_results(results, args.results, args.model, model_hash)
+
+    if args.verbose:
+        for row in results.itertuples(index=False):
+            print(f"{row.symbol} - Cosine Sim: {row.cosine_sim:.4f}")
+
+    summary = results.groupby("folder").agg(files=("file", "size"), cached=("cached", "sum"), mean_cosine_sim=("cosine_sim", "mean"),
+                                            min_cosine_sim=("cosine_sim", "min"), mean_mse=("mse", "mean"))
+    print(summary.to_string(float_format='{:.4f}'.format))
+    print(f"{len(results)} files scored ({int(results['cached'].sum())} from cache), results appended to {args.results}.")
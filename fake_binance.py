@@ -0,0 +1,223 @@
+import json
+import time
+import random
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from aiohttp import web
+
+# Local stand-in for the fapi.binance.com klines and futures/data openInterestHist endpoints,
+# used to benchmark the fetch layer without touching the real exchange, plus a stand-in Discord
+# webhook for the alert tests and local sharded runs
+
+CANDLE_INTERVAL_MS = 5 * 60 * 1000
+
+
+# Function to build a synthetic klines payload ending at the last closed 5m candle
+def make_klines(symbol, limit, now_ms=None):
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    rng = random.Random(symbol)
+    last_open = now_ms - now_ms % CANDLE_INTERVAL_MS - CANDLE_INTERVAL_MS
+    price = rng.uniform(0.1, 100.0)
+    klines = []
+    for i in range(limit):
+        open_time = last_open - (limit - 1 - i) * CANDLE_INTERVAL_MS
+        close = price * (1 + rng.gauss(0, 0.002))
+        high = max(price, close) * (1 + abs(rng.gauss(0, 0.001)))
+        low = min(price, close) * (1 - abs(rng.gauss(0, 0.001)))
+        volume = rng.uniform(1e3, 1e6)
+        taker_buy_volume = volume * rng.uniform(0.3, 0.7)
+        klines.append([open_time, f"{price:.6f}", f"{high:.6f}", f"{low:.6f}", f"{close:.6f}", f"{volume:.1f}",
+                       open_time + CANDLE_INTERVAL_MS - 1, f"{volume * close:.4f}", rng.randint(100, 10000),
+                       f"{taker_buy_volume:.1f}", f"{taker_buy_volume * close:.4f}", "0"])
+        price = close
+    return klines
+
+
+# Function to build a synthetic openInterestHist payload aligned with make_klines
+def make_open_interest(symbol, limit, now_ms=None):
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    rng = random.Random(symbol + 'oi')
+    last_open = now_ms - now_ms % CANDLE_INTERVAL_MS - CANDLE_INTERVAL_MS
+    open_interest = rng.uniform(1e5, 1e8)
+    price = rng.uniform(0.1, 100.0)
+    data = []
+    for i in range(limit):
+        open_interest *= 1 + rng.gauss(0, 0.001)
+        data.append({"symbol": symbol, "sumOpenInterest": f"{open_interest:.8f}",
+                     "sumOpenInterestValue": f"{open_interest * price:.8f}",
+                     "timestamp": last_open - (limit - 1 - i) * CANDLE_INTERVAL_MS})
+    return data
+
+
+class FakeBinance:
+    """
+    Serve synthetic klines/openInterestHist responses from a background thread.
+
+    Parameters:
+    latency (float): Seconds to wait before answering each request
+    port (int): Port to bind, 0 picks a free one
+    error_rate (float): Fraction of requests answered with 429 Too Many Requests
+    retry_after (int): Retry-After seconds sent with each 429
+    listed (list): Perpetuals returned by exchangeInfo, edit it to simulate listings and delistings
+    no_data (set): Symbols whose openInterestHist comes back empty
+    """
+
+    def __init__(self, latency=0.0, port=0, error_rate=0.0, retry_after=0, seed=0, listed=(), no_data=()):
+        self.latency = latency
+        self.port = port
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.rate_limited = 0
+        self.listed = list(listed)
+        self.no_data = set(no_data)
+        self.loop = None
+        self.runner = None
+        self.thread = None
+        self.started = threading.Event()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    async def _delay(self):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.rate_limited += 1
+            return web.json_response({"code": -1003, "msg": "Too many requests."}, status=429, headers={'Retry-After': str(self.retry_after)})
+        return None
+
+    async def klines(self, request):
+        limited = await self._delay()
+        if limited is not None:
+            return limited
+        return web.json_response(make_klines(request.query['symbol'], int(request.query.get('limit', 500))))
+
+    async def open_interest(self, request):
+        limited = await self._delay()
+        if limited is not None:
+            return limited
+        if request.query['symbol'] in self.no_data:
+            return web.json_response([])
+        return web.json_response(make_open_interest(request.query['symbol'], int(request.query.get('limit', 30))))
+
+    async def exchange_info(self, request):
+        limited = await self._delay()
+        if limited is not None:
+            return limited
+        symbols = [{"symbol": symbol, "pair": symbol, "contractType": "PERPETUAL", "status": "TRADING",
+                    "baseAsset": symbol[:-4], "quoteAsset": "USDT"} for symbol in self.listed]
+        return web.json_response({"timezone": "UTC", "serverTime": int(time.time() * 1000), "symbols": symbols})
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get('/fapi/v1/klines', self.klines)
+        app.router.add_get('/futures/data/openInterestHist', self.open_interest)
+        app.router.add_get('/fapi/v1/exchangeInfo', self.exchange_info)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._start())
+        self.started.set()
+        self.loop.run_forever()
+        self.loop.run_until_complete(self.runner.cleanup())
+        self.loop.close()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.started.wait()
+        return self
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+class WebhookSink:
+    """
+    Local HTTP stand-in for a Discord webhook that records every payload.
+
+    Parameters:
+    rate_limit_first (int): Answer this many requests with 429 before accepting any
+    error_first (int): Then answer this many with 503
+    retry_after (float): Retry-After seconds sent with each 429
+    port (int): Port to bind, 0 picks a free one
+    """
+
+    def __init__(self, rate_limit_first=0, error_first=0, retry_after=0.1, port=0):
+        self.rate_limit_first = rate_limit_first
+        self.error_first = error_first
+        self.retry_after = retry_after
+        self.port = port
+        self.received = []
+        self.requests = 0
+        self.statuses = []
+        self.server = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/webhook"
+
+    def start(self):
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status, payload=None, headers=()):
+                sink.statuses.append(status)
+                body = json.dumps(payload).encode() if payload is not None else b''
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                if body:
+                    self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                sink.requests += 1
+                if sink.requests <= sink.rate_limit_first:
+                    self._reply(429, {"message": "You are being rate limited.", "retry_after": sink.retry_after},
+                                [('Retry-After', str(sink.retry_after))])
+                    return
+                if sink.requests <= sink.rate_limit_first + sink.error_first:
+                    self._reply(503, {"message": "Service unavailable."})
+                    return
+                sink.received.append(json.loads(body))
+                self._reply(204)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
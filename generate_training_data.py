@@ -1,16 +1,93 @@
 import os
+import json
+import hashlib
+import numpy as np
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
+from numpy.lib.stride_tricks import sliding_window_view
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from training_dataset import write_shard, INDEX_COLUMNS
+from history_store import HistorySource, read_source, source_name, source_folder, history_sources, STORE_ROOT
 
-def analyze_data(input_csv):
-    # Read the CSV into a DataFrame
-    df = pd.read_csv(input_csv)
+SEQUENCE_LENGTH = 25
+# A surge is a close more than SURGE_THRESHOLD above the close SURGE_HORIZON - 1 candles earlier
+SURGE_THRESHOLD = 0.05
+SURGE_HORIZON = 6
 
-    # Select columns of interest
-    columns_of_interest = ["create_time", "symbol", "sum_open_interest", "sum_open_interest_value",
-                           "open", "high", "low", "close", "volume", "quote_volume", "count",
-                           "taker_buy_volume", "taker_buy_quote_volume", "volume_delta"]
+columns_of_interest = ["create_time", "symbol", "sum_open_interest", "sum_open_interest_value",
+                       "open", "high", "low", "close", "volume", "quote_volume", "count",
+                       "taker_buy_volume", "taker_buy_quote_volume", "volume_delta"]
+feature_columns = columns_of_interest[2:]
+
+
+# Function to find every surge start point with shifted-array comparisons
+def detect_surges(close, threshold=SURGE_THRESHOLD, horizon=SURGE_HORIZON):
+    close = np.asarray(close, dtype=np.float64)
+    if len(close) < horizon:
+        return np.empty(0, dtype=np.int64)
+    return np.flatnonzero(close[horizon - 1:] > close[:len(close) - horizon + 1] * (1 + threshold))
+
+
+# Function to resolve non-overlapping windows from the surge start points with a single interval scan
+def select_windows(starts, sequence_length=SEQUENCE_LENGTH):
+    """
+    Greedily keep surge starts whose reserved interval [i - 24, i] does not overlap an earlier kept one.
+
+    Parameters:
+    starts (ndarray): Sorted surge start indices
+    sequence_length (int): Candles in each training window
+
+    Returns:
+    ndarray: Kept start indices, each with at least sequence_length rows before it
+    """
+    selected = []
+    last = -sequence_length
+    for i in starts[starts >= sequence_length]:
+        if i - last >= sequence_length:
+            selected.append(i)
+            last = i
+    return np.array(selected, dtype=np.int64)
+
+
+# Function to build the windows preceding each start point at once from a strided view
+def extract_windows(values, starts, sequence_length=SEQUENCE_LENGTH):
+    # Sources shorter than one window, or without a surge, have no windows to cut
+    if len(values) < sequence_length or len(starts) == 0:
+        return np.empty((0, sequence_length, values.shape[1]), dtype=values.dtype)
+    views = sliding_window_view(values, sequence_length, axis=0)  # (rows - 24, features, 25)
+    return views[starts - sequence_length].transpose(0, 2, 1)
+
+
+# Function to min-max normalize every window along its time axis, constant columns become 0 like MinMaxScaler
+def normalize_windows(windows):
+    mins = windows.min(axis=1, keepdims=True)
+    ranges = windows.max(axis=1, keepdims=True) - mins
+    ranges[ranges == 0] = 1.0
+    return (windows - mins) / ranges
+
+
+# Function to name the training folder for a surge definition, the default keeps the original folder name
+def training_folder_name(symbol, threshold=SURGE_THRESHOLD, horizon=SURGE_HORIZON):
+    if threshold == SURGE_THRESHOLD and horizon == SURGE_HORIZON:
+        return f"{symbol}_training_data"
+    return f"{symbol}_training_data_{threshold * 100:g}pct_{horizon}"
+
+
+def analyze_data(input_csv, surge_params=((SURGE_THRESHOLD, SURGE_HORIZON),), output_format='both', verbose=True):
+    """
+    Write normalized training windows preceding each surge for every surge definition in one pass.
+
+    Parameters:
+    input_csv (str or HistorySource): Merged <SYMBOL>_<start>_<end>.csv from ticker_data_retrieval.py, or a history store range
+    surge_params (iterable): (threshold, horizon) pairs, e.g. ((0.05, 6), (0.1, 12))
+    output_format (str): 'csv' for one CSV per window, 'npy' for a packed shard per folder, or 'both'
+    verbose (bool): Print every file written
+
+    Returns:
+    dict: Number of windows written per (threshold, horizon)
+    """
+    # Read the CSV, or only the needed columns of the store range, into a DataFrame
+    df = read_source(input_csv, columns_of_interest if isinstance(input_csv, HistorySource) else None)
 
     # Ensure the required columns are present in the CSV
     for col in columns_of_interest:
@@ -20,60 +97,167 @@ def analyze_data(input_csv):
 
     # Sort the DataFrame by create_time in ascending order
     df.sort_values(by='create_time', ascending=True, inplace=True)
-
-    # Initialize variables to track used indices and count for output CSV names
-    used_indices = set()
-    count = 0
+    values = df[feature_columns].to_numpy(dtype=np.float64)
+    close = df['close'].to_numpy(dtype=np.float64)
+    create_time = df['create_time'].to_numpy()
 
     # Get the base filename (without extension) from the input CSV path
-    base_filename = os.path.splitext(os.path.basename(input_csv))[0]
-    subfolder_name = f"{base_filename.split('_')[0]}_training_data"  # First element when split by '_' with "_training_data" appended
+    base_filename = source_name(input_csv)
+    symbol = base_filename.split('_')[0]
 
-    # Create a subfolder based on the base filename (first element)
-    subfolder_path = os.path.join(os.path.dirname(input_csv), subfolder_name)
-    os.makedirs(subfolder_path, exist_ok=True)
+    counts = {}
+    for threshold, horizon in surge_params:
+        starts = select_windows(detect_surges(close, threshold, horizon))
+        windows = normalize_windows(extract_windows(values, starts))
 
-    # Iterate through the DataFrame with a rolling window of 6 rows
-    for i in range(len(df) - 5):
-        window = df.iloc[i:i+6]
-        first_close = window['close'].iloc[0]
-        sixth_close = window['close'].iloc[-1]
+        # Create a subfolder based on the base filename (first element)
+        subfolder_path = os.path.join(source_folder(input_csv), training_folder_name(symbol, threshold, horizon))
+        os.makedirs(subfolder_path, exist_ok=True)
 
-        # Check for an increase of more than 5% between the 1st and 6th close values
-        if sixth_close > first_close * 1.05:
-            # Check if there are at least 200 rows before the 1st row of the rolling window
-            if i >= 25:
-                # Check if the 200 rows have not been used in previous rolling windows
-                if all(idx not in used_indices for idx in range(i-24, i+1)):
-                    used_indices.update(range(i-24, i+1))
+        if output_format in ('csv', 'both'):
+            for count, window in enumerate(windows):
+                # Create the output CSV filename
+                output_csv = os.path.join(subfolder_path, f"{base_filename}_{count}_training_data.csv")
 
-                    # Extract the previous 200 rows of data
-                    training_data = df.iloc[i-25:i]  # Original 200 rows
-                    training_data = training_data.sort_values(by='create_time', ascending=True).copy()
+                # Save the training data to the CSV file
+                pd.DataFrame(window, columns=feature_columns).to_csv(output_csv, index=False, header=True)
 
-                    # Remove 'create_time' and 'symbol' columns
-                    training_data = training_data.drop(columns=['create_time', 'symbol'])
+                if verbose:
+                    print(f"Training data saved to {output_csv}.")
 
-                    # Apply Min-Max scaling to normalize between 0 and 1
-                    scaler = MinMaxScaler()
-                    training_data[columns_of_interest[2:]] = scaler.fit_transform(training_data[columns_of_interest[2:]])
+        if output_format in ('npy', 'both'):
+            index = pd.DataFrame({"symbol": symbol, "window_start": create_time[starts - SEQUENCE_LENGTH],
+                                  "surge_threshold": threshold, "surge_horizon": horizon,
+                                  "source": [f"{base_filename}_{count}_training_data.csv" for count in range(len(windows))]},
+                                 columns=INDEX_COLUMNS)
+            shard_path = write_shard(subfolder_path, windows, index)
+            if verbose:
+                print(f"{len(windows)} training windows packed into {shard_path}.")
 
-                    # Create the output CSV filename
-                    output_csv = os.path.join(subfolder_path, f"{base_filename}_{count}_training_data.csv")
+        counts[(threshold, horizon)] = len(windows)
 
-                    # Save the training data to the CSV file
-                    training_data.to_csv(output_csv, index=False, header=True)
+    return counts
 
-                    count += 1
+# Function to hash a source CSV so unchanged symbols can be skipped on the next run
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-                    print(f"Training data saved to {output_csv}.")
+
+# Function to generate one symbol's training data inside a worker process
+def generate_symbol(input_csv, surge_params, output_format, source_hash):
+    counts = analyze_data(input_csv, surge_params, output_format, verbose=False)
+    if counts is None:
+        raise ValueError("source is missing required columns")
+    symbol = source_name(input_csv).split('_')[0]
+    outputs = [os.path.join(source_folder(input_csv), training_folder_name(symbol, threshold, horizon)) for threshold, horizon in surge_params]
+    return {
+        "symbol": symbol,
+        "source": str(input_csv),
+        "source_hash": source_hash,
+        "windows": {f"{threshold:g}_{horizon}": count for (threshold, horizon), count in counts.items()},
+        "outputs": outputs,
+    }
+
+
+def generate_all(input_csvs, surge_params, output_format='both', workers=None, manifest_path='training_manifest.json', force=False):
+    """
+    Fan symbols out across a process pool and merge their outputs into one dataset manifest.
+
+    Symbols whose source hash and generation parameters match the manifest, and whose output folders
+    still exist, are skipped. A symbol is only recorded once it produced windows, so failed or empty
+    runs are retried next time.
+
+    Parameters:
+    input_csvs (list): Merged <SYMBOL>_<start>_<end>.csv paths or HistorySource ranges
+    surge_params (list): (threshold, horizon) pairs
+    output_format (str): 'csv', 'npy' or 'both'
+    workers (int): Processes to use, defaults to the CPU count
+    manifest_path (str): JSON manifest to read and update
+    force (bool): Regenerate every symbol regardless of the manifest
+
+    Returns:
+    dict: The updated manifest
+    """
+    params = {"sequence_length": SEQUENCE_LENGTH, "surge_params": [[threshold, horizon] for threshold, horizon in surge_params], "format": output_format}
+
+    manifest = {"symbols": {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    pending = []
+    for input_csv in input_csvs:
+        symbol = source_name(input_csv).split('_')[0]
+        # Store ranges are hashed by their partitions, appending a day changes it without rereading any data
+        source_hash = input_csv.fingerprint() if isinstance(input_csv, HistorySource) else file_sha256(input_csv)
+        previous = manifest["symbols"].get(symbol)
+        if (not force and previous and previous.get("source_hash") == source_hash and previous.get("params") == params
+                and previous.get("outputs") and all(os.path.isdir(output) for output in previous["outputs"])):
+            print(f"{symbol} unchanged since the last run. Skipping.")
+            continue
+        pending.append((input_csv, source_hash))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(generate_symbol, input_csv, surge_params, output_format, source_hash): input_csv for input_csv, source_hash in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                record = future.result()
+            except Exception as e:
+                print(f"[{done}/{len(futures)}] Failed to generate training data for {futures[future]}: {str(e)}")
+                continue
+            if not sum(record["windows"].values()):
+                manifest["symbols"].pop(record["symbol"], None)
+                print(f"[{done}/{len(futures)}] {record['symbol']}: no windows produced, not recorded so the next run retries it.")
+                continue
+            record["params"] = params
+            manifest["symbols"][record["symbol"]] = record
+            print(f"[{done}/{len(futures)}] {record['symbol']}: " + ", ".join(f"{key} -> {count} windows" for key, count in record["windows"].items()))
+
+    manifest["total_windows"] = sum(sum(record["windows"].values()) for record in manifest["symbols"].values())
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate normalized training windows preceding price surges.")
+    parser.add_argument("--start-date", default="2022-09-01", help="Start date in the source CSV names (YYYY-MM-DD)")
+    parser.add_argument("--end-date", default="2023-09-01", help="End date in the source CSV names (YYYY-MM-DD)")
+    parser.add_argument("--thresholds", type=float, nargs='+', default=[SURGE_THRESHOLD], help="Surge thresholds to sweep, 0.05 is a 5%% rise")
+    parser.add_argument("--horizons", type=int, nargs='+', default=[SURGE_HORIZON], help="Surge horizons in candles to sweep")
+    parser.add_argument("--format", choices=['csv', 'npy', 'both'], default='both', help="Write per-window CSVs, packed .npy shards, or both")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="Symbols generated in parallel")
+    parser.add_argument("--manifest", default="training_manifest.json", help="Dataset manifest merged across symbols")
+    parser.add_argument("--force", action="store_true", help="Regenerate symbols even if their source and parameters are unchanged")
+    parser.add_argument("--store", nargs='?', const=STORE_ROOT, default=None, help="Read the date range from the columnar history store instead of merged CSVs")
+    parser.add_argument("--symbols", nargs='+', default=None, help="Symbols to read from the store, defaults to all of them")
+    parser.add_argument("--latent-index", default=None, help="Add the new windows to this latent index from latent_index.py afterwards")
+    parser.add_argument("--model", default='autoencoder_model.h5', help="Autoencoder the latent index is built with")
+    args = parser.parse_args()
+    surge_params = [(threshold, horizon) for threshold in args.thresholds for horizon in args.horizons]
+
     root_folder = os.getcwd()  # Assuming the script is run from the project root folder
 
-    # Look for CSV files that match the specified name pattern in all subfolders
-    for root, dirs, files in os.walk(root_folder):
-        for file in files:
-            if file.endswith('_2022-09-01_2023-09-01.csv'):
-                input_csv = os.path.join(root, file)
-                analyze_data(input_csv)
+    input_csvs = []
+    if args.store:
+        input_csvs = history_sources(args.store, args.start_date, args.end_date, args.symbols)
+    else:
+        # Look for CSV files that match the specified date range in all subfolders
+        for root, dirs, files in os.walk(root_folder):
+            for file in files:
+                if file.endswith(f'_{args.start_date}_{args.end_date}.csv'):
+                    input_csvs.append(os.path.join(root, file))
+
+    manifest = generate_all(sorted(input_csvs), surge_params, args.format, args.workers, args.manifest, args.force)
+    print(f"{manifest['total_windows']} training windows across {len(manifest['symbols'])} symbols, manifest saved to {args.manifest}.")
+
+    if args.latent_index:
+        from latent_index import LatentIndex
+        latent_index = LatentIndex(args.latent_index, args.model)
+        added = latent_index.update(root_folder)
+        latent_index.save()
+        print(f"{added} new window(s) added to the latent index, {len(latent_index)} indexed.")
@@ -0,0 +1,218 @@
+import os
+import re
+import shutil
+import hashlib
+import argparse
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+# Columnar store of the merged historical data, partitioned by symbol and day:
+#   history/<SYMBOL>/<YYYY-MM-DD>/<column>.npy
+# Every column is a typed .npy array, so a range query memory-maps only the days and columns it asks for,
+# and new days are added as new partitions without reading or rewriting the existing ones.
+# Run this to import merged CSVs from ticker_data_retrieval.py or to list what the store holds, e.g.
+# python3 history_store.py import AGIXUSDT/AGIXUSDT_2022-09-01_2023-09-01.csv
+
+STORE_ROOT = 'history'
+# create_time is stored as epoch milliseconds, the symbol is the partition itself
+STORE_DTYPES = {"create_time": "int64", "sum_open_interest": "float64", "sum_open_interest_value": "float64",
+                "open": "float64", "high": "float64", "low": "float64", "close": "float64", "volume": "float64",
+                "quote_volume": "float64", "count": "int64", "taker_buy_volume": "float64",
+                "taker_buy_quote_volume": "float64", "volume_delta": "float64"}
+OUTPUT_COLUMNS = ["create_time", "symbol"] + list(STORE_DTYPES)[1:]
+DAY_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+class HistoryStore:
+    """
+    Day partitioned, column per file store of merged metrics and klines.
+
+    Partitions are immutable once written, a day is built in a temporary folder and renamed into
+    place, so readers never see half a day and an interrupted append leaves nothing behind.
+
+    Parameters:
+    root (str): Folder holding one sub folder per symbol
+    """
+
+    def __init__(self, root=STORE_ROOT):
+        self.root = root
+
+    def symbols(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if self.days(name))
+
+    def days(self, symbol, start=None, end=None):
+        """
+        List the stored days of a symbol, optionally limited to an inclusive YYYY-MM-DD range.
+        """
+        folder = os.path.join(self.root, symbol)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(day for day in os.listdir(folder)
+                      if DAY_PATTERN.match(day) and (start is None or day >= start) and (end is None or day <= end))
+
+    def has_day(self, symbol, day):
+        return os.path.isdir(os.path.join(self.root, symbol, day))
+
+    def append_day(self, symbol, day, df):
+        """
+        Write one day of merged rows as a new partition.
+
+        Parameters:
+        symbol (str): Ticker symbol, e.g. AGIXUSDT
+        day (str): YYYY-MM-DD the rows belong to
+        df (DataFrame): Rows with OUTPUT_COLUMNS, create_time as text or datetimes
+
+        Returns:
+        bool: False if the day was already stored and nothing was written
+        """
+        if self.has_day(symbol, day):
+            return False
+
+        timestamps = pd.to_datetime(df["create_time"]).to_numpy(dtype="datetime64[ms]").astype(np.int64)
+        order = np.argsort(timestamps, kind="stable")
+
+        folder = os.path.join(self.root, symbol)
+        os.makedirs(folder, exist_ok=True)
+        temporary_folder = os.path.join(folder, f".{day}.tmp-{os.getpid()}")
+        shutil.rmtree(temporary_folder, ignore_errors=True)
+        os.makedirs(temporary_folder)
+        np.save(os.path.join(temporary_folder, "create_time.npy"), timestamps[order])
+        for column, dtype in list(STORE_DTYPES.items())[1:]:
+            np.save(os.path.join(temporary_folder, f"{column}.npy"), df[column].to_numpy(dtype=dtype)[order])
+
+        try:
+            os.rename(temporary_folder, os.path.join(folder, day))
+        except OSError:
+            # Another writer stored the day first
+            shutil.rmtree(temporary_folder, ignore_errors=True)
+            return False
+        return True
+
+    def read(self, symbol, start=None, end=None, columns=None):
+        """
+        Read a symbol's rows for an inclusive day range, loading only the requested columns.
+
+        Parameters:
+        symbol (str): Ticker symbol
+        start (str): First day, YYYY-MM-DD, defaults to the first stored day
+        end (str): Last day, YYYY-MM-DD, defaults to the last stored day
+        columns (list): Columns to return, defaults to OUTPUT_COLUMNS
+
+        Returns:
+        DataFrame: Rows in time order, create_time as datetimes
+        """
+        columns = list(columns) if columns is not None else OUTPUT_COLUMNS
+        for column in columns:
+            if column != "symbol" and column not in STORE_DTYPES:
+                raise KeyError(f"Column '{column}' is not in the history store")
+
+        days = self.days(symbol, start, end)
+        data = {}
+        for column in columns:
+            if column == "symbol":
+                continue
+            parts = [np.load(os.path.join(self.root, symbol, day, f"{column}.npy"), mmap_mode='r') for day in days]
+            data[column] = np.concatenate(parts) if parts else np.empty(0, dtype=STORE_DTYPES[column])
+        if "create_time" in data:
+            data["create_time"] = data["create_time"].astype("datetime64[ms]")
+
+        df = pd.DataFrame(data)
+        if "symbol" in columns:
+            df.insert(0, "symbol", symbol)
+        return df[columns]
+
+    def fingerprint(self, symbol, start=None, end=None):
+        """
+        Hash of the partitions a range covers, it only changes when days are added or rewritten.
+        """
+        digest = hashlib.sha256()
+        for day in self.days(symbol, start, end):
+            size = os.path.getsize(os.path.join(self.root, symbol, day, "close.npy"))
+            digest.update(f"{day}:{size};".encode())
+        return digest.hexdigest()
+
+    def import_csv(self, input_csv, symbol=None):
+        """
+        Split a merged <SYMBOL>_<start>_<end>.csv into day partitions, days already stored are left alone.
+
+        Returns:
+        int: Days added
+        """
+        symbol = symbol or os.path.basename(input_csv).split('_')[0]
+        df = pd.read_csv(input_csv, dtype={"create_time": str})
+        df = df.dropna(subset=list(STORE_DTYPES))
+        added = 0
+        for day, rows in df.groupby(df["create_time"].str[:10], sort=True):
+            added += self.append_day(symbol, day, rows)
+        return added
+
+
+class HistorySource(namedtuple('HistorySource', ['root', 'symbol', 'start', 'end'])):
+    """
+    One symbol's date range in a HistoryStore, accepted wherever a merged CSV path is.
+    """
+
+    @property
+    def name(self):
+        # Same stem as the merged CSV for the range, so outputs are named the same either way
+        return f"{self.symbol}_{self.start}_{self.end}"
+
+    def read(self, columns=None):
+        return HistoryStore(self.root).read(self.symbol, self.start, self.end, columns)
+
+    def fingerprint(self):
+        return HistoryStore(self.root).fingerprint(self.symbol, self.start, self.end)
+
+    def __str__(self):
+        return f"{os.path.join(self.root, self.symbol)}[{self.start}:{self.end}]"
+
+
+# Function to read a merged CSV or a store range into a DataFrame
+def read_source(source, columns=None):
+    if isinstance(source, HistorySource):
+        return source.read(columns)
+    return pd.read_csv(source, usecols=columns)
+
+
+# Function to get the <SYMBOL>_<start>_<end> stem of a merged CSV or a store range
+def source_name(source):
+    if isinstance(source, HistorySource):
+        return source.name
+    return os.path.splitext(os.path.basename(source))[0]
+
+
+# Function to get the folder a source's outputs go in, next to the CSV or in the symbol folder for the store
+def source_folder(source):
+    if isinstance(source, HistorySource):
+        return source.symbol
+    return os.path.dirname(source)
+
+
+# Function to list the store ranges of some or all symbols
+def history_sources(root, start, end, symbols=None):
+    store = HistoryStore(root)
+    return [HistorySource(root, symbol, start, end) for symbol in (symbols or store.symbols()) if store.days(symbol, start, end)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import merged ticker CSVs into the columnar history store or list its contents.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Split merged CSVs into day partitions")
+    import_parser.add_argument("inputs", nargs='+', help="Merged <SYMBOL>_<start>_<end>.csv files")
+    import_parser.add_argument("--store", default=STORE_ROOT, help="History store folder")
+    info_parser = subparsers.add_parser("info", help="List the stored symbols and their day ranges")
+    info_parser.add_argument("--store", default=STORE_ROOT, help="History store folder")
+    args = parser.parse_args()
+
+    store = HistoryStore(args.store)
+    if args.command == "import":
+        for input_csv in args.inputs:
+            added = store.import_csv(input_csv)
+            print(f"{input_csv}: {added} day(s) added to {args.store}.")
+    else:
+        for symbol in store.symbols():
+            days = store.days(symbol)
+            print(f"{symbol}: {len(days)} day(s), {days[0]} to {days[-1]}")
@@ -0,0 +1,422 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+from scoring import load_scoring_model
+from training_dataset import find_shards, load_shard, parse_training_folder
+from encoder_with_folder_data import expand_inputs, read_windows, content_hash
+
+# Run this to index the encoder's latent vector (the LSTM(64) output) of every training window, so a live
+# setup can be matched to the past pre-surge setups it most resembles, e.g.
+# python3 latent_index.py update
+# python3 latent_index.py search AGIXUSDT/AGIXUSDT_training_data/AGIXUSDT_2022-09-01_2023-09-01_0_training_data.csv -k 5
+# Vectors are L2 normalized so a dot product is the cosine similarity. Exact search is one batched matrix
+# multiply, approximate search probes only the closest k-means clusters (an inverted file index)
+
+INDEX_DIR = 'latent_index'
+METADATA_COLUMNS = ["key", "symbol", "window_start", "surge_threshold", "surge_horizon", "folder", "source"]
+SEQUENCE_LENGTH = 25
+KMEANS_ITERATIONS = 20
+# The clusters are retrained once the index has grown this much since they were last trained
+RETRAIN_GROWTH = 2.0
+
+
+# Function to find the encoder's output layer, the last LSTM that returns a single vector
+def latent_layer_name(model):
+    names = [layer.name for layer in model.layers if hasattr(layer, 'recurrent_kernel') and not layer.return_sequences]
+    if not names:
+        raise ValueError("The model has no LSTM layer returning a single latent vector")
+    return names[-1]
+
+
+# Function to scale rows to unit length, zero rows stay zero
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+# Function to key a window by its content, the same digest model_train uses to tell windows apart
+def window_key(folder, window):
+    return f"{folder}/{hashlib.blake2b(np.ascontiguousarray(window, dtype=np.float32).tobytes(), digest_size=12).hexdigest()}"
+
+
+# Function to pick the k best columns of every row of a similarity matrix, best first
+def top_k(similarities, k):
+    k = min(k, similarities.shape[1])
+    if k == 0:
+        return np.empty((len(similarities), 0), dtype=similarities.dtype), np.empty((len(similarities), 0), dtype=np.int64)
+    best = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    scores = np.take_along_axis(similarities, best, axis=1)
+    order = np.argsort(-scores, axis=1, kind='stable')
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(best, order, axis=1)
+
+
+def spherical_kmeans(vectors, clusters, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    k-means on unit vectors with cosine similarity, the clustering behind the approximate search.
+
+    Returns:
+    tuple: unit centroids (clusters, dim) and the cluster of every vector (N,)
+    """
+    rng = np.random.default_rng(seed)
+    clusters = max(1, min(clusters, len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    assignments = np.zeros(len(vectors), dtype=np.int32)
+    for _ in range(iterations):
+        assignments = (vectors @ centroids.T).argmax(axis=1).astype(np.int32)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = ~sums.any(axis=1)
+        # Re-seed empty clusters so every centroid keeps covering part of the data
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids, (vectors @ centroids.T).argmax(axis=1).astype(np.int32)
+
+
+class LatentIndex:
+    """
+    Persistent cosine similarity index over the latent vectors of the training windows.
+
+    Saved as vectors.npy, metadata.csv (symbol and window start per vector), ivf.npz (cluster
+    centroids and assignments) and index.json under one folder. It is tied to the model the
+    vectors were encoded with, a different model file re-encodes everything on the next update.
+
+    Parameters:
+    path (str): Index folder
+    model_path (str): Autoencoder .h5 or quantized .npz, always run with the NumPy engine
+    """
+
+    def __init__(self, path=INDEX_DIR, model_path='autoencoder_model.h5'):
+        self.path = path
+        self.use_model(model_path)
+
+    def use_model(self, model_path):
+        """
+        Switch the encoder, e.g. to a hot-reloaded checkpoint. Vectors from the previous model are
+        dropped, the index on disk is only picked up if it was built with the new one.
+        """
+        self.model_path = model_path
+        self.model = load_scoring_model(model_path, 'numpy')
+        self.layer = latent_layer_name(self.model)
+        self.model_hash = content_hash(model_path)
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+        self.metadata = pd.DataFrame(columns=METADATA_COLUMNS)
+        self.centroids = None
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.trained_size = 0
+        self._lists = None
+        self.loaded_mtime = None
+        self._load()
+
+    def _load(self):
+        info_path = os.path.join(self.path, 'index.json')
+        if not os.path.exists(info_path):
+            return
+        self.loaded_mtime = os.path.getmtime(info_path)
+        with open(info_path) as f:
+            info = json.load(f)
+        if info["model_hash"] != self.model_hash:
+            print(f"{self.path} was built with another model, it will be rebuilt on the next update.")
+            return
+        count = info["count"]
+        self.vectors = np.load(os.path.join(self.path, 'vectors.npy'))[:count]
+        self.metadata = pd.read_csv(os.path.join(self.path, 'metadata.csv'), keep_default_na=False, dtype={"window_start": str}).iloc[:count]
+        self.centroids = None
+        self.assignments = np.empty(0, dtype=np.int32)
+        ivf_path = os.path.join(self.path, 'ivf.npz')
+        if os.path.exists(ivf_path):
+            with np.load(ivf_path) as ivf:
+                self.centroids = ivf['centroids']
+                self.assignments = ivf['assignments'][:count]
+            self.trained_size = info.get("trained_size", count)
+        self._lists = None
+
+    def reload_if_changed(self):
+        """
+        Pick up windows another process added since this index was loaded, used by the scanner between cycles.
+
+        Returns:
+        bool: True if the index was reloaded
+        """
+        info_path = os.path.join(self.path, 'index.json')
+        if not os.path.exists(info_path) or os.path.getmtime(info_path) == self.loaded_mtime:
+            return False
+        self._load()
+        return True
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def encode(self, windows, batch_size=1024):
+        """
+        Latent vectors of normalized (N, 25, 12) windows, unit length.
+        """
+        windows = np.asarray(windows, dtype=np.float32)
+        parts = [self.model.forward(windows[i:i + batch_size], until=self.layer) for i in range(0, len(windows), batch_size)]
+        return normalize_rows(np.concatenate(parts) if parts else np.empty((0, self.vectors.shape[1] or 64)))
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        # Data files first and index.json last, a reader only trusts the first `count` rows
+        temporary_path = os.path.join(self.path, 'vectors.tmp.npy')
+        np.save(temporary_path, self.vectors)
+        os.replace(temporary_path, os.path.join(self.path, 'vectors.npy'))
+        temporary_path = os.path.join(self.path, 'metadata.tmp.csv')
+        self.metadata[METADATA_COLUMNS].to_csv(temporary_path, index=False)
+        os.replace(temporary_path, os.path.join(self.path, 'metadata.csv'))
+        if self.centroids is not None:
+            temporary_path = os.path.join(self.path, 'ivf.tmp.npz')
+            np.savez(temporary_path, centroids=self.centroids, assignments=self.assignments)
+            os.replace(temporary_path, os.path.join(self.path, 'ivf.npz'))
+        info = {"model": os.path.basename(self.model_path), "model_hash": self.model_hash, "layer": self.layer,
+                "dim": int(self.vectors.shape[1]) if len(self) else 0, "count": len(self), "trained_size": self.trained_size,
+                "clusters": 0 if self.centroids is None else len(self.centroids), "updated_at": time.strftime('%Y-%m-%d %H:%M:%S')}
+        temporary_path = os.path.join(self.path, 'index.tmp.json')
+        with open(temporary_path, 'w') as f:
+            json.dump(info, f, indent=2)
+        os.replace(temporary_path, os.path.join(self.path, 'index.json'))
+        self.loaded_mtime = os.path.getmtime(os.path.join(self.path, 'index.json'))
+
+    def add(self, windows, metadata):
+        """
+        Encode and append windows, new vectors join their closest existing cluster.
+
+        Parameters:
+        windows (ndarray): Normalized (N, 25, 12) windows
+        metadata (DataFrame): One row per window with METADATA_COLUMNS
+        """
+        vectors = self.encode(windows)
+        self.vectors = vectors if len(self) == 0 else np.concatenate([self.vectors, vectors])
+        self.metadata = pd.concat([self.metadata, metadata[METADATA_COLUMNS]], ignore_index=True) if len(self) else metadata[METADATA_COLUMNS].reset_index(drop=True)
+        if self.centroids is not None:
+            self.assignments = np.concatenate([self.assignments, (vectors @ self.centroids.T).argmax(axis=1).astype(np.int32)])
+        self._lists = None
+
+    def train(self, clusters=None, seed=0):
+        """
+        Cluster the vectors for approximate search, about sqrt(N) clusters by default.
+        """
+        if len(self) == 0:
+            return
+        clusters = clusters or int(np.sqrt(len(self)))
+        self.centroids, self.assignments = spherical_kmeans(self.vectors, clusters, seed=seed)
+        self.trained_size = len(self)
+        self._lists = None
+
+    def remove(self, drop):
+        """
+        Drop the rows flagged in a boolean mask, the clusters are kept.
+        """
+        keep = ~np.asarray(drop, dtype=bool)
+        self.vectors = self.vectors[keep]
+        self.metadata = self.metadata[keep].reset_index(drop=True)
+        if self.centroids is not None:
+            self.assignments = self.assignments[keep]
+        self._lists = None
+
+    def update(self, root='.', rebuild=False):
+        """
+        Bring the index in line with the training windows under root.
+
+        Windows come from the packed shards, which carry window timestamps, and from the
+        per-window CSV folders that have no shard. A window is keyed by its folder and a hash
+        of its content, not by file name: regenerating a folder reuses the file names for
+        different windows, so its changed windows are re-encoded with their new metadata and
+        the rows of windows no longer in it are dropped. Folders missing under root are kept.
+
+        Returns:
+        int: Windows added
+        """
+        if rebuild:
+            self.vectors = np.empty((0, 0), dtype=np.float32)
+            self.metadata = pd.DataFrame(columns=METADATA_COLUMNS)
+            self.centroids = None
+            self.assignments = np.empty(0, dtype=np.int32)
+        known = set(self.metadata["key"])
+        current = set()
+        additions = []
+
+        sharded_folders = set()
+        for shard_path in find_shards(root):
+            folder = os.path.basename(shard_path)[:-4]
+            sharded_folders.add(folder)
+            windows, index = load_shard(shard_path)
+            keys = pd.Series([window_key(folder, window) for window in windows], dtype=object)
+            current.update(keys)
+            # A window repeated within a folder is indexed once
+            new = (~keys.isin(known) & ~keys.duplicated()).to_numpy()
+            if not new.any():
+                continue
+            metadata = index.loc[new, ["symbol", "window_start", "surge_threshold", "surge_horizon", "source"]].copy()
+            metadata["key"] = keys[new].to_numpy()
+            metadata["folder"] = folder
+            additions.append((windows[new], metadata))
+
+        pending = []
+        for path in expand_inputs([os.path.join(root, '*USDT', '*_training_data*')]):
+            folder = os.path.basename(os.path.dirname(path))
+            if folder not in sharded_folders and parse_training_folder(folder) is not None:
+                pending.append((path, folder))
+        csv_folders = {folder for _, folder in pending}
+        if pending:
+            windows = read_windows([path for path, _ in pending], SEQUENCE_LENGTH)
+            rows = []
+            parsed = []
+            for (path, folder), window in zip(pending, windows):
+                if window.shape != (SEQUENCE_LENGTH, 12):
+                    continue
+                key = window_key(folder, window)
+                current.add(key)
+                if key in known:
+                    continue
+                known.add(key)
+                symbol, threshold, horizon = parse_training_folder(folder)
+                # Window CSVs carry no timestamps, only the range of the merged CSV they were cut from
+                rows.append({"key": key, "symbol": symbol, "window_start": "", "surge_threshold": threshold,
+                             "surge_horizon": horizon, "folder": folder, "source": os.path.basename(path)})
+                parsed.append(window)
+            if parsed:
+                additions.append((np.stack(parsed), pd.DataFrame(rows, columns=METADATA_COLUMNS)))
+
+        # Rows of a scanned folder whose window is gone were regenerated away or cut
+        stale = (self.metadata["folder"].isin(sharded_folders | csv_folders) & ~self.metadata["key"].isin(current)).to_numpy()
+        if stale.any():
+            self.remove(stale)
+        added = 0
+        for windows, metadata in additions:
+            self.add(windows, metadata)
+            added += len(metadata)
+
+        if (self.centroids is None or len(self) >= RETRAIN_GROWTH * max(self.trained_size, 1)
+                or RETRAIN_GROWTH * len(self) <= self.trained_size):
+            self.train()
+        return added
+
+    def _inverted_lists(self):
+        # Vector ids grouped by cluster, rebuilt lazily after adds
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind='stable')
+            offsets = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+            self._lists = (order, offsets)
+        return self._lists
+
+    def search(self, vectors, k=5, approximate=False, nprobe=None, block=4096):
+        """
+        k nearest indexed vectors of each query vector by cosine similarity.
+
+        Parameters:
+        vectors (ndarray): Unit query vectors (Q, dim)
+        k (int): Neighbours per query
+        approximate (bool): Only search the nprobe closest clusters
+        nprobe (int): Clusters probed per query, defaults to an eighth of them
+        block (int): Indexed vectors multiplied at a time by the exact search
+
+        Returns:
+        tuple: similarities (Q, k) and row ids into metadata (Q, k), best first
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not approximate or self.centroids is None:
+            best_scores = np.full((len(vectors), 0), -np.inf, dtype=np.float32)
+            best_ids = np.empty((len(vectors), 0), dtype=np.int64)
+            for start in range(0, len(self), block):
+                scores, ids = top_k(vectors @ self.vectors[start:start + block].T, k)
+                scores, order = top_k(np.concatenate([best_scores, scores], axis=1), k)
+                best_ids = np.take_along_axis(np.concatenate([best_ids, ids + start], axis=1), order, axis=1)
+                best_scores = scores
+            return best_scores, best_ids
+
+        order, offsets = self._inverted_lists()
+        nprobe = nprobe or max(1, len(self.centroids) // 8)
+        _, probes = top_k(vectors @ self.centroids.T, nprobe)
+        similarities = np.full((len(vectors), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(vectors), k), -1, dtype=np.int64)
+        for q, clusters in enumerate(probes):
+            candidates = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in clusters])
+            scores, best = top_k((self.vectors[candidates] @ vectors[q])[None, :], k)
+            similarities[q, :scores.shape[1]] = scores[0]
+            ids[q, :best.shape[1]] = candidates[best[0]]
+        return similarities, ids
+
+    def neighbours(self, windows, k=5, approximate=False, nprobe=None):
+        """
+        Nearest historical setups of normalized (N, 25, 12) windows.
+
+        Returns:
+        list: One DataFrame per window with the neighbours' metadata and similarity
+        """
+        similarities, ids = self.search(self.encode(windows), k, approximate, nprobe)
+        results = []
+        for scores, rows in zip(similarities, ids):
+            keep = rows >= 0
+            result = self.metadata.iloc[rows[keep]].reset_index(drop=True)
+            result.insert(0, "similarity", scores[keep])
+            results.append(result)
+        return results
+
+    def recall(self, k=10, sample=200, nprobe=None, seed=0):
+        """
+        Share of the exact k nearest neighbours the approximate search finds, over indexed vectors as queries.
+        """
+        if len(self) == 0 or self.centroids is None:
+            return np.nan
+        queries = self.vectors[np.random.default_rng(seed).choice(len(self), min(sample, len(self)), replace=False)]
+        _, exact = self.search(queries, k)
+        _, approximate = self.search(queries, k, approximate=True, nprobe=nprobe)
+        return float(np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(approximate, exact)]))
+
+
+# Function to describe a neighbour by symbol and date, or its source range when the window has no timestamp
+def describe_neighbour(row):
+    if row.window_start:
+        when = str(row.window_start)[:16]
+    else:
+        parts = os.path.splitext(row.source)[0].split('_')
+        when = f"{parts[1]}..{parts[2]} #{parts[3]}" if len(parts) > 3 else row.source
+    return f"{row.symbol} {when} ({row.similarity:.3f})"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query the latent vector index of the training windows.")
+    parser.add_argument("--index", default=INDEX_DIR, help="Index folder")
+    parser.add_argument("--model", default='autoencoder_model.h5', help="Autoencoder the latent vectors come from")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    update_parser = subparsers.add_parser("update", help="Index the training windows that are not indexed yet")
+    update_parser.add_argument("-r", "--root", default='.', help="Folder searched for training data")
+    update_parser.add_argument("--rebuild", action='store_true', help="Re-encode every window and retrain the clusters")
+    search_parser = subparsers.add_parser("search", help="Find the nearest indexed setups of normalized window CSVs")
+    search_parser.add_argument("inputs", nargs='+', help="Window CSVs, folders or globs")
+    search_parser.add_argument("-k", type=int, default=5, help="Neighbours per window")
+    search_parser.add_argument("--approximate", action='store_true', help="Probe only the closest clusters")
+    search_parser.add_argument("--nprobe", type=int, default=None, help="Clusters probed by the approximate search")
+    args = parser.parse_args()
+
+    index = LatentIndex(args.index, args.model)
+    if args.command == "update":
+        start = time.perf_counter()
+        added = index.update(args.root, args.rebuild)
+        index.save()
+        clusters = 0 if index.centroids is None else len(index.centroids)
+        print(f"{added} window(s) added in {time.perf_counter() - start:.1f}s, {len(index)} indexed in {clusters} clusters.")
+        if len(index):
+            print(f"Approximate search recall@10: {index.recall():.3f}")
+    else:
+        found = expand_inputs(args.inputs)
+        paths, windows = [], []
+        for path, window in zip(found, read_windows(found, SEQUENCE_LENGTH)):
+            if window.shape == (SEQUENCE_LENGTH, 12):
+                paths.append(path)
+                windows.append(window)
+        if not windows:
+            parser.error("No 25 row window CSVs found")
+        start = time.perf_counter()
+        results = index.neighbours(np.stack(windows), args.k, args.approximate, args.nprobe)
+        elapsed = time.perf_counter() - start
+        for path, result in zip(paths, results):
+            print(f"{path}:")
+            for row in result.itertuples(index=False):
+                print(f"  {describe_neighbour(row)}")
+        print(f"{len(windows)} window(s) searched in {elapsed * 1000:.1f} ms.")
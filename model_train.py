@@ -1,10 +1,17 @@
 import os
+import json
+import time
+import hashlib
+import argparse
 import numpy as np
 import pandas as pd
+import tensorflow as tf
 from sklearn.preprocessing import MinMaxScaler
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import LSTM, Dense, Input
 from tensorflow.keras.models import Model
+from tensorflow.keras.callbacks import Callback, EarlyStopping, ModelCheckpoint
+from training_dataset import load_corpus, convert_all
 
 # Train the model from all the training data folder's files
 
@@ -13,6 +20,14 @@ SEQUENCE_LENGTH = 25
 NUM_FEATURES = 12
 BATCH_SIZE = 32
 EPOCHS = 20  # Increased epochs for better training
+VALIDATION_SPLIT = 0.1
+PATIENCE = 5
+# Incremental fine-tuning, replayed old windows per new window and a gentler learning rate than a fresh fit
+REPLAY_RATIO = 1.0
+FINE_TUNE_LEARNING_RATE = 1e-4
+POINTER_NAME = 'latest.json'
+MANIFEST_NAME = 'trained_windows.json'
+DRIFT_PROBE_WINDOWS = 1024
 
 # Function to load and preprocess a single CSV file
 def load_and_preprocess_data(file_path):
@@ -29,33 +44,343 @@ def load_and_preprocess_data(file_path):
     data = data.reshape(1, SEQUENCE_LENGTH, NUM_FEATURES)
     return data
 
-# Get the project root directory
-project_root = os.path.dirname(os.path.abspath(__file__))
-
-# Define the model
-model = Sequential([
-    Input(shape=(SEQUENCE_LENGTH, NUM_FEATURES)),  # Input layer for sequences
-    LSTM(units=128, activation='relu', return_sequences=True),  # Encoder
-    LSTM(units=64, activation='relu', return_sequences=False),  # Encoder
-    Dense(units=64, activation='relu'),  # Decoder
-    Dense(units=128, activation='relu'),  # Decoder
-    Dense(units=NUM_FEATURES, activation='linear')  # Output layer
-])
-
-model.compile(loss='mean_squared_error', optimizer='adam')
-model.summary()
-
-# Train the model on each CSV file
-for root, dirs, files in os.walk(project_root):
-    if 'training_data' in root:
-        for file_name in files:
-            if file_name.endswith('.csv'):
-                file_path = os.path.join(root, file_name)
-                print(f"Loading and preprocessing data from file: {file_name}")
-                data = load_and_preprocess_data(file_path)
-                # Train the model on the current file
-                model.fit(data, data, epochs=EPOCHS, batch_size=BATCH_SIZE, shuffle=True)
-
-# Save the trained model
-model.save('autoencoder_model.h5')
-print("Model saved as 'autoencoder_model.h5'.")
+# Function to define the model
+def build_model():
+    model = Sequential([
+        Input(shape=(SEQUENCE_LENGTH, NUM_FEATURES)),  # Input layer for sequences
+        LSTM(units=128, activation='relu', return_sequences=True),  # Encoder
+        LSTM(units=64, activation='relu', return_sequences=False),  # Encoder
+        Dense(units=64, activation='relu'),  # Decoder
+        Dense(units=128, activation='relu'),  # Decoder
+        Dense(units=NUM_FEATURES, activation='linear')  # Output layer
+    ])
+
+    model.compile(loss='mean_squared_error', optimizer='adam')
+    return model
+
+
+class ThroughputLogger(Callback):
+    """
+    Print how many windows per second each epoch pushed through training.
+    """
+
+    def __init__(self, windows_per_epoch):
+        super().__init__()
+        self.windows_per_epoch = windows_per_epoch
+        self.epoch_start = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = time.perf_counter() - self.epoch_start
+        print(f"Epoch {epoch + 1}: {self.windows_per_epoch} windows in {elapsed:.2f}s ({self.windows_per_epoch / elapsed:.0f} windows/s)")
+
+
+def make_dataset(shards, rows, batch_size, shuffle):
+    """
+    Build a tf.data pipeline that gathers shuffled mini-batches straight from the memory-mapped shards.
+
+    The target is each window's mean over time, not the window itself as in the original fit(data, data).
+    mean_t((y - x_t)^2) = (y - mean_t(x))^2 + var_t(x), so the gradients are the same but every reported
+    loss, including val_loss, is lower than the original per-timestep loss by the mean time variance of
+    the windows it covers. That offset is fixed for a given set of windows, so EarlyStopping with the
+    default min_delta of 0 stops at the same epoch, but loss values from before and after this change
+    are not comparable.
+
+    Parameters:
+    shards (list): Memory-mapped (n, 25, 12) window arrays
+    rows (ndarray): Global row ids across the shards to serve
+    batch_size (int): Windows per mini-batch
+    shuffle (bool): Reshuffle the rows every epoch
+
+    Returns:
+    Dataset: (windows, window means) batches
+    """
+    offsets = np.cumsum([0] + [len(shard) for shard in shards])
+
+    def gather(batch_rows):
+        batch = np.empty((len(batch_rows), SEQUENCE_LENGTH, NUM_FEATURES), dtype=np.float32)
+        shard_ids = np.searchsorted(offsets, batch_rows, side='right') - 1
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            batch[mask] = shards[shard_id][batch_rows[mask] - offsets[shard_id]]
+        return batch
+
+    def load_batch(batch_rows):
+        batch = tf.numpy_function(gather, [batch_rows], tf.float32)
+        batch.set_shape((None, SEQUENCE_LENGTH, NUM_FEATURES))
+        # The model decodes one (12,) vector, the window mean keeps the plain MSE loss working with batches larger than 1
+        return batch, tf.reduce_mean(batch, axis=1)
+
+    dataset = tf.data.Dataset.from_tensor_slices(rows.astype(np.int64))
+    if shuffle:
+        # Shuffle the global row ids across every shard, reshuffled each epoch
+        dataset = dataset.shuffle(len(rows), reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size).map(load_batch, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def train_streaming(model, root, epochs=EPOCHS, batch_size=BATCH_SIZE, validation_split=VALIDATION_SPLIT, patience=PATIENCE, checkpoint_dir='checkpoints', checkpoint_every=5, seed=42):
+    """
+    Train on every window in the packed shards in one fit call with real mini-batches.
+
+    Parameters:
+    model: Compiled Keras model
+    root (str): Folder searched for training shards, CSV folders are packed first if none exist
+    epochs (int): Maximum number of passes over the corpus
+    batch_size (int): Windows per mini-batch
+    validation_split (float): Fraction of windows held out for early stopping
+    patience (int): Epochs without val_loss improvement before stopping
+    checkpoint_dir (str): Folder for periodic checkpoints
+    checkpoint_every (int): Epochs between checkpoints
+
+    Returns:
+    History: Keras training history, losses are against the window mean, see make_dataset()
+    """
+    shards, index = load_corpus(root)
+    if not shards:
+        print("No training shards found, packing the training data folders first..")
+        convert_all(root)
+        shards, index = load_corpus(root)
+
+    total = len(index)
+    rows = np.random.default_rng(seed).permutation(total)
+    validation_count = int(total * validation_split)
+    validation_rows, train_rows = rows[:validation_count], rows[validation_count:]
+    print(f"Training on {len(train_rows)} windows from {len(shards)} shards, validating on {len(validation_rows)}.")
+
+    train_dataset = make_dataset(shards, train_rows, batch_size, shuffle=True)
+    validation_dataset = make_dataset(shards, validation_rows, batch_size, shuffle=False) if validation_count else None
+
+    steps_per_epoch = int(np.ceil(len(train_rows) / batch_size))
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    callbacks = [
+        ThroughputLogger(len(train_rows)),
+        ModelCheckpoint(os.path.join(checkpoint_dir, 'autoencoder_epoch_{epoch:03d}.h5'), save_freq=steps_per_epoch * checkpoint_every),
+    ]
+    if validation_dataset is not None:
+        callbacks.append(EarlyStopping(monitor='val_loss', patience=patience, restore_best_weights=True))
+
+    return model.fit(train_dataset, validation_data=validation_dataset, epochs=epochs, callbacks=callbacks, verbose=2)
+
+
+# Function to fingerprint every window by content, so the manifest survives renames and re-packing
+def window_hashes(shards):
+    return [hashlib.blake2b(np.ascontiguousarray(window, dtype=np.float32).tobytes(), digest_size=12).hexdigest()
+            for shard in shards for window in shard]
+
+
+# Function to read the latest checkpoint pointer, None before the first incremental run
+def read_pointer(checkpoint_dir):
+    pointer_path = os.path.join(checkpoint_dir, POINTER_NAME)
+    if not os.path.exists(pointer_path):
+        return None
+    with open(pointer_path) as f:
+        return json.load(f)
+
+
+# Function to write JSON atomically so the scanner never reads half a pointer
+def write_json(path, data):
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(temporary_path, path)
+
+
+# Function to move the latest.json pointer to a saved checkpoint and its metadata
+def publish_checkpoint(checkpoint_dir, version):
+    with open(os.path.join(checkpoint_dir, f"autoencoder_v{version:04d}.json")) as f:
+        metadata = json.load(f)
+    pointer = {"version": version, "model": metadata["model"], "metadata": f"autoencoder_v{version:04d}.json", "created_at": metadata["created_at"]}
+    write_json(os.path.join(checkpoint_dir, POINTER_NAME), pointer)
+    return pointer
+
+
+# Function to get the mean reconstruction loss over some windows, NaN without any
+def evaluate_rows(model, shards, rows, batch_size):
+    if len(rows) == 0:
+        return float('nan')
+    return float(model.evaluate(make_dataset(shards, rows, batch_size, shuffle=False), verbose=0))
+
+
+def train_incremental(root, base_model=None, checkpoint_dir='checkpoints', manifest_path=None, epochs=EPOCHS, batch_size=BATCH_SIZE,
+                      validation_split=VALIDATION_SPLIT, patience=PATIENCE, replay_ratio=REPLAY_RATIO,
+                      learning_rate=FINE_TUNE_LEARNING_RATE, bootstrap=False, seed=42):
+    """
+    Fine-tune the current model on the windows it has not been trained on yet.
+
+    New windows are found by content hash against a manifest of every window the model line has
+    seen. A random sample of old windows is replayed alongside them to limit drift, and the
+    loss on held out old windows is recorded before and after. Each run writes a versioned
+    checkpoint with a metadata JSON, records its windows in the manifest and only then moves
+    the latest.json pointer the scanner follows. A checkpoint a crash left unpublished between
+    those two writes is published by the next run.
+
+    Parameters:
+    root (str): Folder searched for training shards, CSV folders without one are packed first
+    base_model (str): Model to start from, defaults to the latest checkpoint, then autoencoder_model.h5
+    checkpoint_dir (str): Folder for the versioned checkpoints, pointer and manifest
+    manifest_path (str): Trained window manifest, defaults to <checkpoint_dir>/trained_windows.json
+    replay_ratio (float): Old windows replayed per new window
+    learning_rate (float): Adam learning rate for the fine-tune
+    bootstrap (bool): Without a manifest, record every current window as already trained by the base model and stop
+
+    Returns:
+    dict: The new checkpoint's metadata, or None if there was nothing to train on
+    """
+    manifest_path = manifest_path or os.path.join(checkpoint_dir, MANIFEST_NAME)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+
+    # New windows may only exist as CSV folders, pack whatever has no shard yet
+    convert_all(root)
+    shards, index = load_corpus(root)
+    hashes = window_hashes(shards)
+
+    if not os.path.exists(manifest_path):
+        if not bootstrap:
+            print(f"No manifest of trained windows at {manifest_path}. Run with --bootstrap to record the {len(set(hashes))} "
+                  f"current windows as already trained by the base model, then rerun after generating new windows.")
+            return None
+        write_json(manifest_path, {"windows": sorted(set(hashes)), "updated_at": time.strftime('%Y-%m-%d %H:%M:%S')})
+        print(f"Recorded the {len(set(hashes))} current windows as trained in {manifest_path}. Rerun after generating new windows.")
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    trained = set(manifest["windows"])
+
+    pointer = read_pointer(checkpoint_dir)
+    if manifest.get("version", 0) > (pointer["version"] if pointer else 0):
+        # A previous run recorded its windows but stopped before moving the pointer
+        pointer = publish_checkpoint(checkpoint_dir, manifest["version"])
+        print(f"Published checkpoint v{pointer['version']}, an earlier run stopped before moving {POINTER_NAME}.")
+
+    seen = set()
+    new_rows = []
+    for row, digest in enumerate(hashes):
+        if digest not in trained and digest not in seen:
+            seen.add(digest)
+            new_rows.append(row)
+    new_rows = np.array(new_rows, dtype=np.int64)
+    old_rows = np.flatnonzero([digest in trained for digest in hashes])
+    if len(new_rows) == 0:
+        print(f"All {len(hashes)} windows are already in {manifest_path}, nothing to fine-tune on.")
+        return None
+
+    rng = np.random.default_rng(seed)
+    new_rows = rng.permutation(new_rows)
+    old_rows = rng.permutation(old_rows)
+    # Old windows held out to measure drift are never replayed
+    probe_count = min(DRIFT_PROBE_WINDOWS, len(old_rows) // 2)
+    probe_rows, old_rows = old_rows[:probe_count], old_rows[probe_count:]
+    replay_rows = old_rows[:min(len(old_rows), int(round(len(new_rows) * replay_ratio)))]
+    validation_count = int(len(new_rows) * validation_split)
+    validation_rows, train_new_rows = new_rows[:validation_count], new_rows[validation_count:]
+    train_rows = np.concatenate([train_new_rows, replay_rows])
+
+    if base_model is None:
+        base_model = os.path.join(checkpoint_dir, pointer["model"]) if pointer else 'autoencoder_model.h5'
+    version = (pointer["version"] if pointer else 0) + 1
+    print(f"Fine-tuning {base_model} on {len(train_new_rows)} new windows with {len(replay_rows)} replayed, "
+          f"validating on {len(validation_rows)} new and probing drift on {len(probe_rows)} old.")
+
+    model = tf.keras.models.load_model(base_model, compile=False)
+    model.compile(loss='mean_squared_error', optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate))
+    drift = {"old_loss_before": evaluate_rows(model, shards, probe_rows, batch_size),
+             "new_loss_before": evaluate_rows(model, shards, validation_rows, batch_size)}
+
+    callbacks = [ThroughputLogger(len(train_rows))]
+    validation_dataset = make_dataset(shards, validation_rows, batch_size, shuffle=False) if len(validation_rows) else None
+    if validation_dataset is not None:
+        callbacks.append(EarlyStopping(monitor='val_loss', patience=patience, restore_best_weights=True))
+    history = model.fit(make_dataset(shards, train_rows, batch_size, shuffle=True), validation_data=validation_dataset,
+                        epochs=epochs, callbacks=callbacks, verbose=2)
+
+    drift["old_loss_after"] = evaluate_rows(model, shards, probe_rows, batch_size)
+    drift["new_loss_after"] = evaluate_rows(model, shards, validation_rows, batch_size)
+
+    model_name = f"autoencoder_v{version:04d}.h5"
+    model_path = os.path.join(checkpoint_dir, model_name)
+    model.save(model_path)
+    with open(model_path, 'rb') as f:
+        model_hash = hashlib.sha256(f.read()).hexdigest()
+
+    metadata = {
+        "version": version,
+        "model": model_name,
+        "sha256": model_hash,
+        "parent": base_model,
+        "created_at": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "new_windows": int(len(new_rows)),
+        "replayed_windows": int(len(replay_rows)),
+        "validation_windows": int(len(validation_rows)),
+        "drift_probe_windows": int(len(probe_rows)),
+        "trained_windows_total": len(trained) + len(new_rows),
+        "epochs_run": len(history.history["loss"]),
+        "learning_rate": learning_rate,
+        "replay_ratio": replay_ratio,
+        "loss": float(history.history["loss"][-1]),
+        "loss_target": "window_mean",
+        **drift,
+    }
+    write_json(os.path.join(checkpoint_dir, f"autoencoder_v{version:04d}.json"), metadata)
+    # Manifest before pointer, the scanner never follows a checkpoint whose windows are not recorded
+    write_json(manifest_path, {"windows": sorted(trained | {hashes[row] for row in new_rows}), "updated_at": metadata["created_at"], "version": version})
+    publish_checkpoint(checkpoint_dir, version)
+
+    print(f"Checkpoint v{version} saved to {model_path}, old window loss {drift['old_loss_before']:.6f} -> {drift['old_loss_after']:.6f}, "
+          f"new window loss {drift['new_loss_before']:.6f} -> {drift['new_loss_after']:.6f}.")
+    return metadata
+
+
+# Function to train the model on each CSV file separately, the original behaviour
+def train_per_file(model, root):
+    for dirpath, dirs, files in os.walk(root):
+        if 'training_data' in dirpath:
+            for file_name in files:
+                if file_name.endswith('.csv'):
+                    file_path = os.path.join(dirpath, file_name)
+                    print(f"Loading and preprocessing data from file: {file_name}")
+                    data = load_and_preprocess_data(file_path)
+                    # Train the model on the current file
+                    model.fit(data, data, epochs=EPOCHS, batch_size=BATCH_SIZE, shuffle=True)
+
+
+if __name__ == "__main__":
+    # Get the project root directory
+    project_root = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(description="Train the autoencoder on the generated training data.")
+    parser.add_argument("--mode", choices=['stream', 'per-file', 'incremental'], default='stream',
+                        help="Stream every window through one shuffled pipeline, fit each CSV file separately, or fine-tune the current model on new windows only")
+    parser.add_argument("-r", "--root", default=project_root, help="Folder containing the training data")
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--validation-split", type=float, default=VALIDATION_SPLIT)
+    parser.add_argument("--patience", type=int, default=PATIENCE, help="Epochs without improvement before early stopping")
+    parser.add_argument("--checkpoint-dir", default='checkpoints')
+    parser.add_argument("--checkpoint-every", type=int, default=5, help="Epochs between checkpoints")
+    parser.add_argument("-o", "--output", default='autoencoder_model.h5', help="Where to save the trained model")
+    parser.add_argument("--base-model", default=None, help="Incremental mode: model to fine-tune, defaults to the latest checkpoint, then autoencoder_model.h5")
+    parser.add_argument("--manifest", default=None, help="Incremental mode: manifest of trained windows, defaults to <checkpoint-dir>/trained_windows.json")
+    parser.add_argument("--replay-ratio", type=float, default=REPLAY_RATIO, help="Incremental mode: old windows replayed per new window")
+    parser.add_argument("--learning-rate", type=float, default=FINE_TUNE_LEARNING_RATE, help="Incremental mode: fine-tuning learning rate")
+    parser.add_argument("--bootstrap", action='store_true', help="Incremental mode: without a manifest yet, record every current window as already trained by the base model")
+    args = parser.parse_args()
+
+    if args.mode == 'incremental':
+        # Writes versioned checkpoints and moves checkpoints/latest.json instead of overwriting --output
+        train_incremental(args.root, args.base_model, args.checkpoint_dir, args.manifest, args.epochs, args.batch_size,
+                          args.validation_split, args.patience, args.replay_ratio, args.learning_rate, args.bootstrap)
+    else:
+        model = build_model()
+        model.summary()
+
+        if args.mode == 'stream':
+            train_streaming(model, args.root, args.epochs, args.batch_size, args.validation_split, args.patience, args.checkpoint_dir, args.checkpoint_every)
+        else:
+            train_per_file(model, args.root)
+
+        # Save the trained model
+        model.save(args.output)
+        print(f"Model saved as '{args.output}'.")
@@ -0,0 +1,177 @@
+import json
+import h5py
+import numpy as np
+
+# Lightweight inference backend, reads the layer config and weights straight out of a Keras .h5 file
+# and runs the LSTM/Dense forward pass in batched NumPy so the scanner does not need TensorFlow
+
+
+def _sigmoid(x):
+    with np.errstate(over='ignore'):
+        return 1.0 / (1.0 + np.exp(-x))
+
+
+def _hard_sigmoid(x):
+    return np.clip(0.2 * x + 0.5, 0.0, 1.0)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0.0),
+    'tanh': np.tanh,
+    'sigmoid': _sigmoid,
+    'hard_sigmoid': _hard_sigmoid,
+}
+
+
+class LSTMLayer:
+    """
+    Keras LSTM inference with gates packed in i, f, c, o order.
+    """
+
+    def __init__(self, name, kernel, recurrent_kernel, bias, activation='tanh', recurrent_activation='sigmoid', return_sequences=False):
+        self.name = name
+        self.kernel = kernel
+        self.recurrent_kernel = recurrent_kernel
+        self.bias = bias
+        self.units = recurrent_kernel.shape[0]
+        self.activation = ACTIVATIONS[activation]
+        self.recurrent_activation = ACTIVATIONS[recurrent_activation]
+        self.return_sequences = return_sequences
+
+    def __call__(self, x):
+        batch, steps, _ = x.shape
+        units = self.units
+        # Project every timestep's input at once, only the recurrent part stays in the loop
+        projected = x @ self.kernel
+        if self.bias is not None:
+            projected += self.bias
+
+        h = np.zeros((batch, units), dtype=x.dtype)
+        c = np.zeros((batch, units), dtype=x.dtype)
+        sequence = np.empty((batch, steps, units), dtype=x.dtype) if self.return_sequences else None
+        for t in range(steps):
+            z = projected[:, t] + h @ self.recurrent_kernel
+            i = self.recurrent_activation(z[:, :units])
+            f = self.recurrent_activation(z[:, units:2 * units])
+            g = self.activation(z[:, 2 * units:3 * units])
+            o = self.recurrent_activation(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * self.activation(c)
+            if sequence is not None:
+                sequence[:, t] = h
+
+        return sequence if self.return_sequences else h
+
+
+class DenseLayer:
+    def __init__(self, name, kernel, bias, activation='linear'):
+        self.name = name
+        self.kernel = kernel
+        self.bias = bias
+        self.activation = ACTIVATIONS[activation]
+
+    def __call__(self, x):
+        out = x @ self.kernel
+        if self.bias is not None:
+            out += self.bias
+        return self.activation(out)
+
+
+# Function to read a layer's weight arrays in the order Keras saved them
+def _layer_weights(model_weights, layer_name):
+    group = model_weights[layer_name]
+    names = [name.decode() if isinstance(name, bytes) else name for name in group.attrs['weight_names']]
+    return {name.split('/')[-1].split(':')[0]: np.asarray(group[name]) for name in names}
+
+
+# Function to read the input shape and each layer's type, settings and weights from a Keras 2 .h5 file
+def read_layer_specs(path):
+    """
+    Parameters:
+    path (str): Path to e.g. autoencoder_model.h5
+
+    Returns:
+    tuple: Keras-style input shape and a list of layer specs, dicts with class_name, name, config and weights
+    """
+    with h5py.File(path, 'r') as f:
+        config = f.attrs['model_config']
+        config = json.loads(config.decode() if isinstance(config, bytes) else config)
+        model_weights = f['model_weights']
+
+        specs = []
+        input_shape = None
+        for layer in config['config']['layers']:
+            layer_config = layer['config']
+            if layer['class_name'] == 'InputLayer':
+                # Keras 3 saves the same shape as batch_shape
+                input_shape = tuple(layer_config.get('batch_input_shape') or layer_config['batch_shape'])
+                continue
+            if layer['class_name'] not in ('LSTM', 'Dense'):
+                raise ValueError(f"Unsupported layer type {layer['class_name']} in {path}")
+            settings = {key: layer_config[key] for key in ('activation', 'recurrent_activation', 'return_sequences') if key in layer_config}
+            specs.append({"class_name": layer['class_name'], "name": layer_config['name'], "config": settings,
+                          "weights": _layer_weights(model_weights, layer_config['name'])})
+
+    return input_shape, specs
+
+
+# Function to build the NumPy layers from layer specs
+def build_layers(specs, dtype=np.float32):
+    layers = []
+    for spec in specs:
+        weights = {name: np.asarray(array).astype(dtype) for name, array in spec['weights'].items()}
+        config = spec['config']
+        if spec['class_name'] == 'LSTM':
+            layers.append(LSTMLayer(spec['name'], weights['kernel'], weights['recurrent_kernel'], weights.get('bias'),
+                                    config.get('activation', 'tanh'), config.get('recurrent_activation', 'sigmoid'),
+                                    config.get('return_sequences', False)))
+        else:
+            layers.append(DenseLayer(spec['name'], weights['kernel'], weights.get('bias'), config.get('activation', 'linear')))
+    return layers
+
+
+class NumpyAutoencoder:
+    """
+    Sequential LSTM/Dense model evaluated with NumPy.
+
+    predict() and input_shape mirror Keras so it can stand in for a loaded Keras model anywhere
+    the scanner calls model.predict(batch, verbose=0).
+    """
+
+    def __init__(self, layers, input_shape, dtype=np.float32):
+        self.layers = layers
+        self.input_shape = input_shape
+        self.dtype = dtype
+
+    @classmethod
+    def from_h5(cls, path, dtype=np.float32):
+        """
+        Build the model from a Keras 2 .h5 file.
+
+        Parameters:
+        path (str): Path to e.g. autoencoder_model.h5
+        dtype: Compute dtype for weights and activations
+
+        Returns:
+        NumpyAutoencoder: Model ready for predict()
+        """
+        input_shape, specs = read_layer_specs(path)
+        return cls(build_layers(specs, dtype), input_shape, dtype)
+
+    def forward(self, batch, until=None):
+        """
+        Run the layers in order, stopping after the layer named `until` if given.
+        """
+        x = np.asarray(batch, dtype=self.dtype)
+        for layer in self.layers:
+            x = layer(x)
+            if layer.name == until:
+                break
+        return x
+
+    def predict(self, batch, batch_size=None, verbose=0):
+        batch = np.asarray(batch, dtype=self.dtype)
+        if batch_size is None or batch_size >= len(batch):
+            return self.forward(batch)
+        return np.concatenate([self.forward(batch[i:i + batch_size]) for i in range(0, len(batch), batch_size)], axis=0)
@@ -0,0 +1,263 @@
+import os
+
+# Workers are processes, keep each one's BLAS single threaded so they do not fight over the cores
+for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(variable, '1')
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+import time
+import argparse
+import itertools
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import backtest
+from backtest import MAX_LEAD, BATCH_SIZE, CANDLE_MINUTES
+from generate_training_data import detect_surges, select_windows, file_sha256, SURGE_THRESHOLD, SURGE_HORIZON
+from encoder_with_folder_data import content_hash
+from history_store import HistorySource, source_name, history_sources, STORE_ROOT
+
+# Run this to tune the alert threshold, surge definition and alert lead span without rerunning the model.
+# Every window is scored once per model and source and cached in sweep_cache/ as an .npz of close prices,
+# cosine similarity, MSE and the decoded output, the grid is then evaluated over the cached scores with every
+# alert threshold handled in one vectorized pass per surge definition
+
+CACHE_DIR = 'sweep_cache'
+DEFAULT_THRESHOLDS = [0.90, 0.91, 0.92, 0.93, 0.94, 0.95, 0.96, 0.97, 0.98]
+RESULT_COLUMNS = ["model", "sequence_length", "alert_threshold", "surge_threshold", "horizon", "max_lead", "symbols", "windows",
+                  "alerts", "alert_rate", "alerts_per_day", "true_alerts", "surges", "detected", "precision", "recall",
+                  "lead_mean_min", "lead_median_min"]
+
+
+# Function to hash a merged CSV, or a store range by its partitions
+def source_hash(source):
+    return source.fingerprint() if isinstance(source, HistorySource) else file_sha256(source)
+
+
+# Function to get the cache file of one source scored by one model
+def cache_path(cache_dir, source, model_hash):
+    return os.path.join(cache_dir, f"{source_name(source)}_{model_hash[:12]}.npz")
+
+
+# Function to check a cached score file was written for the current source data
+def is_cached(path, expected_hash):
+    if not os.path.exists(path):
+        return False
+    with np.load(path) as data:
+        return str(data['source_hash']) == expected_hash
+
+
+# Function to score one source inside a worker process and cache the outputs
+def score_source(source, path, source_digest, batch_size):
+    start = time.perf_counter()
+    sequence_length = backtest.model.input_shape[1]
+    close, cosine, mse, decoded = backtest.score_csv(backtest.model, source, batch_size, sequence_length, all_metrics=True)
+    temporary_path = path + ".tmp.npz"
+    np.savez_compressed(temporary_path, close=close, cosine=cosine, mse=mse.astype(np.float32),
+                        decoded=decoded.astype(np.float16), sequence_length=sequence_length, source_hash=source_digest)
+    os.replace(temporary_path, path)
+    return path, len(cosine), time.perf_counter() - start
+
+
+def score_all(sources, model_path, backend='numpy', workers=None, batch_size=BATCH_SIZE, cache_dir=CACHE_DIR):
+    """
+    Score every source once with one model, reusing cached scores whose source data is unchanged.
+
+    Parameters:
+    sources (list): Merged CSV paths or HistorySource ranges
+    model_path (str): Model file, .h5 or a quantized .npz
+    backend (str): 'numpy' or 'keras' inference
+    workers (int): Processes to use, defaults to the CPU count
+
+    Returns:
+    list: Cache file paths, one per source that could be scored
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    model_hash = content_hash(model_path)
+    paths = []
+    pending = []
+    for source in sources:
+        digest = source_hash(source)
+        path = cache_path(cache_dir, source, model_hash)
+        if is_cached(path, digest):
+            paths.append(path)
+        else:
+            pending.append((source, path, digest))
+    print(f"{os.path.basename(model_path)}: {len(paths)} source(s) cached, {len(pending)} to score.")
+    if not pending:
+        return paths
+
+    # Spawned workers so a TensorFlow backend never inherits a forked runtime
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=backtest.init_worker, initargs=(model_path, backend)) as executor:
+        futures = {executor.submit(score_source, source, path, digest, batch_size): source for source, path, digest in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                path, windows, seconds = future.result()
+            except Exception as e:
+                print(f"[{done}/{len(futures)}] Failed to score {futures[future]}: {str(e)}")
+                continue
+            paths.append(path)
+            print(f"[{done}/{len(futures)}] {source_name(futures[future])}: {windows} windows scored in {seconds:.1f}s")
+    return sorted(paths)
+
+
+def evaluate_thresholds(close, cosine, thresholds, surge_threshold=SURGE_THRESHOLD, horizon=SURGE_HORIZON, max_lead=MAX_LEAD,
+                        sequence_length=backtest.SEQUENCE_LENGTH):
+    """
+    backtest.evaluate for a whole array of alert thresholds at once.
+
+    Whether a window is a true alert does not depend on the threshold, so alert and true alert
+    counts come from sorted scores. Each surge's lead span is gathered into one row so detection
+    and the earliest alert are found for every threshold with a single comparison.
+
+    Parameters:
+    close (ndarray): Close prices
+    cosine (ndarray): Score of the window ending at each candle from sequence_length - 1 on
+    thresholds (ndarray): Alert thresholds (T,)
+
+    Returns:
+    dict: alerts and true_alerts (T,), surges, and detected (T, surges) with lead (T, surges) in minutes
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    ends = np.arange(len(cosine)) + sequence_length - 1
+    surges = select_windows(detect_surges(close, surge_threshold, horizon))
+
+    # Next surge strictly after each window, the same rule backtest.evaluate applies to alerts
+    following = np.searchsorted(surges, ends, side='right')
+    has_following = following < len(surges)
+    true_windows = np.zeros(len(ends), dtype=bool)
+    true_windows[has_following] = surges[following[has_following]] - ends[has_following] <= max_lead
+
+    valid = ~np.isnan(cosine)
+    all_scores = np.sort(cosine[valid])
+    true_scores = np.sort(cosine[valid & true_windows])
+    alerts = len(all_scores) - np.searchsorted(all_scores, thresholds, side='left')
+    true_alerts = len(true_scores) - np.searchsorted(true_scores, thresholds, side='left')
+
+    # Scores of the windows ending 1 to max_lead candles before each surge, earliest first
+    span_ends = surges[:, None] - max_lead + np.arange(max_lead)
+    span_windows = span_ends - (sequence_length - 1)
+    # Spans reaching before the first window point at a trailing -inf that never alerts
+    padded = np.append(cosine, -np.inf)
+    span_scores = padded[np.where((span_windows >= 0) & (span_windows < len(cosine)), span_windows, len(cosine))]
+    hits = span_scores[None, :, :] >= thresholds[:, None, None]  # (T, surges, max_lead)
+    detected = hits.any(axis=2)
+    lead = (max_lead - hits.argmax(axis=2)) * CANDLE_MINUTES
+
+    return {"alerts": alerts, "true_alerts": true_alerts, "surges": len(surges), "detected": detected, "lead": lead}
+
+
+# Function to evaluate one surge definition and lead span over every cached source, run in a worker process
+def evaluate_grid_point(paths, thresholds, surge_threshold, horizon, max_lead):
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    windows = 0
+    alerts = np.zeros(len(thresholds), dtype=np.int64)
+    true_alerts = np.zeros(len(thresholds), dtype=np.int64)
+    surges = 0
+    detected = []
+    lead = []
+    for path in paths:
+        with np.load(path) as data:
+            close, cosine, sequence_length = data['close'], data['cosine'], int(data['sequence_length'])
+        result = evaluate_thresholds(close, cosine, thresholds, surge_threshold, horizon, max_lead, sequence_length)
+        windows += len(cosine)
+        alerts += result["alerts"]
+        true_alerts += result["true_alerts"]
+        surges += result["surges"]
+        detected.append(result["detected"])
+        lead.append(result["lead"])
+
+    detected = np.concatenate(detected, axis=1) if detected else np.zeros((len(thresholds), 0), dtype=bool)
+    lead = np.where(detected, np.concatenate(lead, axis=1) if lead else 0, np.nan)
+    detected_counts = detected.sum(axis=1)
+    days = windows * CANDLE_MINUTES / (24 * 60)
+
+    rows = []
+    for i, threshold in enumerate(thresholds):
+        leads = lead[i][~np.isnan(lead[i])]
+        rows.append({
+            "alert_threshold": threshold, "surge_threshold": surge_threshold, "horizon": horizon, "max_lead": max_lead,
+            "symbols": len(paths), "windows": windows, "alerts": int(alerts[i]),
+            "alert_rate": alerts[i] / windows if windows else np.nan,
+            # Per symbol day, so the rate reads the same however many symbols were swept
+            "alerts_per_day": alerts[i] / days if days else np.nan,
+            "true_alerts": int(true_alerts[i]), "surges": surges, "detected": int(detected_counts[i]),
+            "precision": true_alerts[i] / alerts[i] if alerts[i] else np.nan,
+            "recall": detected_counts[i] / surges if surges else np.nan,
+            "lead_mean_min": leads.mean() if len(leads) else np.nan,
+            "lead_median_min": np.median(leads) if len(leads) else np.nan,
+        })
+    return rows
+
+
+def sweep(paths, thresholds, surge_thresholds, horizons, max_leads, workers=None):
+    """
+    Evaluate the full grid over cached scores, one process per surge definition and lead span.
+
+    Returns:
+    DataFrame: One row per (alert threshold, surge threshold, horizon, max lead)
+    """
+    grid = list(itertools.product(surge_thresholds, horizons, max_leads))
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(evaluate_grid_point, paths, thresholds, surge_threshold, horizon, max_lead): (surge_threshold, horizon, max_lead)
+                   for surge_threshold, horizon, max_lead in grid}
+        for future in as_completed(futures):
+            rows.extend(future.result())
+    results = pd.DataFrame(rows)
+    return results.sort_values(by=["surge_threshold", "horizon", "max_lead", "alert_threshold"], ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep alert thresholds and surge definitions over cached model scores.")
+    parser.add_argument("inputs", nargs='*', help="Merged CSVs to sweep over, defaults to every file matching the date range")
+    parser.add_argument("--start-date", default="2022-09-01", help="Start date in the source CSV names (YYYY-MM-DD)")
+    parser.add_argument("--end-date", default="2023-09-01", help="End date in the source CSV names (YYYY-MM-DD)")
+    parser.add_argument("--store", nargs='?', const=STORE_ROOT, default=None, help="Read the date range from the columnar history store instead of merged CSVs")
+    parser.add_argument("--symbols", nargs='+', default=None, help="Symbols to read from the store, defaults to all of them")
+    parser.add_argument("--models", nargs='+', default=['autoencoder_model.h5'], help="Models to sweep, each one's input length is its window length")
+    parser.add_argument("--backend", choices=['keras', 'numpy'], default='numpy', help="Run the model with TensorFlow or the NumPy inference engine")
+    parser.add_argument("--thresholds", type=float, nargs='+', default=DEFAULT_THRESHOLDS, help="Cosine similarity alert thresholds")
+    parser.add_argument("--surge-thresholds", type=float, nargs='+', default=[SURGE_THRESHOLD], help="Surge rises, 0.05 is a 5%% rise")
+    parser.add_argument("--horizons", type=int, nargs='+', default=[SURGE_HORIZON], help="Surge horizons in candles")
+    parser.add_argument("--max-leads", type=int, nargs='+', default=[MAX_LEAD], help="Candles before a surge an alert is credited to it")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Windows per predict call")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="Processes for scoring and for the grid")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Folder for the cached scores")
+    parser.add_argument("-o", "--output", default="sweep_results.csv", help="CSV to write the results table to")
+    args = parser.parse_args()
+    if min(args.max_leads) < 1:
+        parser.error("--max-leads must be at least 1 candle")
+
+    sources = args.inputs
+    if args.store:
+        sources = history_sources(args.store, args.start_date, args.end_date, args.symbols)
+    elif not sources:
+        for root, dirs, files in os.walk(os.getcwd()):
+            for file in files:
+                if file.endswith(f'_{args.start_date}_{args.end_date}.csv'):
+                    sources.append(os.path.join(root, file))
+    sources = sorted(sources, key=str)
+
+    start = time.perf_counter()
+    tables = []
+    for model_path in args.models:
+        paths = score_all(sources, model_path, args.backend, args.workers, args.batch_size, args.cache_dir)
+        if not paths:
+            continue
+        results = sweep(paths, sorted(args.thresholds), args.surge_thresholds, args.horizons, args.max_leads, args.workers)
+        with np.load(paths[0]) as data:
+            results.insert(0, "sequence_length", int(data['sequence_length']))
+        results.insert(0, "model", model_path)
+        tables.append(results)
+
+    if not tables:
+        print("Nothing was scored.")
+    else:
+        results = pd.concat(tables, ignore_index=True)[RESULT_COLUMNS]
+        results.to_csv(args.output, index=False)
+        with pd.option_context('display.max_rows', None, 'display.width', 200, 'display.float_format', '{:.3f}'.format):
+            print(results.drop(columns=["model", "symbols", "windows"]).to_string(index=False))
+        print(f"Swept {len(results)} configurations over {len(sources)} source(s) in {time.perf_counter() - start:.1f}s, results saved to {args.output}.")
@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from numpy_autoencoder import NumpyAutoencoder, read_layer_specs, build_layers
+from scoring import reconstruction_metrics
+
+# Run this to write float16 and int8 weight-quantized copies of the autoencoder and report how far their scores
+# drift from the float32 model on the training windows. NumPy has no int8 or float16 matrix multiply fast path,
+# so the quantized weights are expanded back to float32 when loaded (or per multiply with --resident quantized);
+# the saving is in file size and resident weight memory, the report shows what it costs in accuracy and latency
+
+QUANTIZED_WEIGHTS = ('kernel', 'recurrent_kernel')
+ALERT_THRESHOLD = 0.94
+MODES = ('float16', 'int8')
+RESIDENT_MODES = ('float32', 'quantized')
+
+
+# Function to quantize a kernel symmetrically per output channel
+def quantize_int8(kernel):
+    """
+    Parameters:
+    kernel (ndarray): (inputs, outputs) weights
+
+    Returns:
+    tuple: int8 values and float32 scales of shape (outputs,), kernel ~= values * scales
+    """
+    scale = np.abs(kernel).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    values = np.clip(np.round(kernel / scale), -127, 127).astype(np.int8)
+    return values, scale.astype(np.float32)
+
+
+class QuantizedKernel:
+    """
+    int8 kernel kept in memory as int8, x @ kernel expands it one multiply at a time.
+    """
+
+    # Makes ndarray @ QuantizedKernel defer to __rmatmul__
+    __array_ufunc__ = None
+
+    def __init__(self, values, scale):
+        self.values = values
+        self.scale = scale
+        self.shape = values.shape
+        self.nbytes = values.nbytes + scale.nbytes
+
+    def __rmatmul__(self, x):
+        return (x @ self.values.astype(x.dtype)) * self.scale
+
+
+def quantize_model(h5_path, mode, output_path):
+    """
+    Write a quantized copy of a Keras .h5 autoencoder as an .npz file.
+
+    Parameters:
+    h5_path (str): Float model, e.g. autoencoder_model.h5
+    mode (str): 'float16' or 'int8'
+    output_path (str): Destination .npz
+
+    Returns:
+    str: output_path
+    """
+    input_shape, specs = read_layer_specs(h5_path)
+    arrays = {}
+    layers = []
+    for i, spec in enumerate(specs):
+        for name, weights in spec['weights'].items():
+            key = f"{i}/{name}"
+            if name not in QUANTIZED_WEIGHTS:
+                arrays[key] = weights.astype(np.float32)
+            elif mode == 'float16':
+                arrays[key] = weights.astype(np.float16)
+            elif mode == 'int8':
+                arrays[key], arrays[key + '/scale'] = quantize_int8(weights)
+            else:
+                raise ValueError(f"Unknown quantization mode '{mode}', expected one of {', '.join(MODES)}")
+        layers.append({"class_name": spec['class_name'], "name": spec['name'], "config": spec['config'], "weights": list(spec['weights'])})
+
+    config = {"source": os.path.basename(h5_path), "mode": mode, "input_shape": list(input_shape), "layers": layers}
+    # Uncompressed so the file size reflects the storage dtype
+    np.savez(output_path, config=np.array(json.dumps(config)), **arrays)
+    return output_path
+
+
+def load_quantized(path, resident='float32'):
+    """
+    Load a quantized .npz written by quantize_model as a NumpyAutoencoder.
+
+    Parameters:
+    path (str): Quantized .npz
+    resident (str): 'float32' expands the weights once at load, 'quantized' keeps int8 kernels in memory
+
+    Returns:
+    NumpyAutoencoder: Model ready for predict()
+    """
+    if resident not in RESIDENT_MODES:
+        raise ValueError(f"Unknown resident mode '{resident}', expected one of {', '.join(RESIDENT_MODES)}")
+    with np.load(path) as data:
+        config = json.loads(str(data['config']))
+        specs = []
+        quantized = {}
+        for i, layer in enumerate(config['layers']):
+            weights = {}
+            for name in layer['weights']:
+                key = f"{i}/{name}"
+                if key + '/scale' in data:
+                    values, scale = data[key], data[key + '/scale']
+                    if resident == 'quantized':
+                        quantized[(i, name)] = QuantizedKernel(values, scale)
+                    weights[name] = values.astype(np.float32) * scale
+                else:
+                    weights[name] = data[key].astype(np.float32)
+            specs.append({"class_name": layer['class_name'], "name": layer['name'], "config": layer['config'], "weights": weights})
+
+    layers = build_layers(specs, np.float32)
+    for (i, name), kernel in quantized.items():
+        setattr(layers[i], name, kernel)
+    return NumpyAutoencoder(layers, tuple(config['input_shape']), np.float32)
+
+
+# Function to sum the bytes of every weight array a model keeps in memory
+def weight_bytes(model):
+    total = 0
+    for layer in model.layers:
+        for name in ('kernel', 'recurrent_kernel', 'bias'):
+            weights = getattr(layer, name, None)
+            if weights is not None:
+                total += weights.nbytes
+    return total
+
+
+# Function to time a predict over one batch, best of a few repeats
+def batch_latency(model, batch, repeats=5):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict(batch, batch_size=len(batch), verbose=0)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# Function to rank scores, ties broken by position, for a rank correlation
+def ranks(values):
+    order = np.argsort(values, kind='stable')
+    result = np.empty(len(values))
+    result[order] = np.arange(len(values))
+    return result
+
+
+def compare(reference_scores, scores, threshold=ALERT_THRESHOLD, top_k=10):
+    """
+    Drift of a variant's cosine similarities from the float model's.
+
+    Returns:
+    dict: Absolute drift, threshold decision agreement, rank correlation and top-k overlap
+    """
+    drift = np.abs(scores - reference_scores)
+    reference_alerts = reference_scores >= threshold
+    alerts = scores >= threshold
+    top_k = min(top_k, len(scores))
+    top_reference = set(np.argsort(-reference_scores)[:top_k])
+    top_variant = set(np.argsort(-scores)[:top_k])
+    return {
+        "max_cosine_drift": float(drift.max()),
+        "mean_cosine_drift": float(drift.mean()),
+        "decision_agreement": float((reference_alerts == alerts).mean()),
+        "alerts_reference": int(reference_alerts.sum()),
+        "alerts_variant": int(alerts.sum()),
+        "decision_flips": int((reference_alerts != alerts).sum()),
+        "rank_correlation": float(np.corrcoef(ranks(reference_scores), ranks(scores))[0, 1]) if len(scores) > 1 else 1.0,
+        f"top_{top_k}_overlap": len(top_reference & top_variant) / top_k if top_k else 1.0,
+    }
+
+
+# Function to gather the training windows the report is run on
+def load_training_windows(root, sequence_length, limit=None):
+    from training_dataset import load_corpus, corpus_array
+    shards, _ = load_corpus(root)
+    windows = corpus_array(shards) if shards else np.empty((0, sequence_length, 12), dtype=np.float32)
+    if len(windows) == 0:
+        # No packed shards yet, read the per-window CSVs instead
+        from encoder_with_folder_data import expand_inputs, read_windows
+        paths = expand_inputs([os.path.join(root, '*USDT', '*_training_data')])
+        parsed = [window for window in read_windows(paths, sequence_length) if window.shape == (sequence_length, 12)]
+        windows = np.stack(parsed).astype(np.float32) if parsed else windows
+    if limit:
+        windows = windows[:limit]
+    return np.ascontiguousarray(windows, dtype=np.float32)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantize the autoencoder weights and report the accuracy drift against the float model.")
+    parser.add_argument("-m", "--model", default='autoencoder_model.h5', help="Float Keras .h5 model")
+    parser.add_argument("--modes", nargs='+', choices=MODES, default=list(MODES), help="Quantized variants to write")
+    parser.add_argument("-o", "--output-dir", default='.', help="Folder for the quantized .npz files")
+    parser.add_argument("-r", "--root", default='.', help="Folder searched for training windows")
+    parser.add_argument("--limit", type=int, default=None, help="Use at most this many windows")
+    parser.add_argument("--threshold", type=float, default=ALERT_THRESHOLD, help="Cosine similarity alert threshold")
+    parser.add_argument("--batch-size", type=int, default=256, help="Batch size for the latency measurement")
+    parser.add_argument("--report", default='quantization_report.json', help="JSON report path")
+    args = parser.parse_args()
+
+    reference = NumpyAutoencoder.from_h5(args.model)
+    windows = load_training_windows(args.root, reference.input_shape[1], args.limit)
+    if len(windows) == 0:
+        parser.error(f"No training windows found under {args.root}")
+    latency_batch = np.resize(windows, (args.batch_size,) + windows.shape[1:])
+
+    reference_scores, _, _ = reconstruction_metrics(windows, reference.predict(windows, batch_size=1024))
+    variants = [("float32", args.model, reference)]
+    base_name = os.path.splitext(os.path.basename(args.model))[0]
+    for mode in args.modes:
+        path = quantize_model(args.model, mode, os.path.join(args.output_dir, f"{base_name}_{mode}.npz"))
+        variants.append((mode, path, load_quantized(path)))
+        if mode == 'int8':
+            variants.append(("int8 (resident int8)", path, load_quantized(path, resident='quantized')))
+
+    report = {"model": args.model, "windows": len(windows), "threshold": args.threshold, "variants": []}
+    print(f"{len(windows)} windows, {int((reference_scores >= args.threshold).sum())} at or above {args.threshold} with the float model")
+    print(f"{'variant':<22} {'file KB':>8} {'weights KB':>10} {'batch ms':>9} {'max drift':>10} {'agree':>8} {'flips':>6} {'rank corr':>10}")
+    for name, path, model in variants:
+        scores, _, _ = reconstruction_metrics(windows, model.predict(windows, batch_size=1024))
+        entry = {"variant": name, "path": path, "file_bytes": os.path.getsize(path), "weight_bytes": weight_bytes(model),
+                 "batch_size": args.batch_size, "batch_seconds": batch_latency(model, latency_batch)}
+        entry.update(compare(reference_scores, scores, args.threshold))
+        report["variants"].append(entry)
+        print(f"{name:<22} {entry['file_bytes'] / 1024:>8.0f} {entry['weight_bytes'] / 1024:>10.0f} {entry['batch_seconds'] * 1000:>9.2f} "
+              f"{entry['max_cosine_drift']:>10.2e} {entry['decision_agreement']:>8.2%} {entry['decision_flips']:>6} {entry['rank_correlation']:>10.6f}")
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to {args.report}.")
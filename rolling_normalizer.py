@@ -0,0 +1,86 @@
+import operator
+from collections import deque
+import numpy as np
+
+# Incremental min-max normalization for live windows, one candle enters and one leaves each cycle so the
+# per-feature min and max are kept in monotonic deques instead of refitting a MinMaxScaler per column
+
+
+class RollingMinMax:
+    """
+    Per-feature rolling min and max over the last `size` rows.
+
+    Each feature keeps a deque of (sequence number, value) that is increasing for the min and
+    decreasing for the max, so push is amortized O(1) and the current bounds sit at the front.
+    What the last push evicted is kept so replace_last() can undo it without a rebuild.
+    """
+
+    def __init__(self, size, num_features):
+        self.size = size
+        self.num_features = num_features
+        self.reset()
+
+    def reset(self, rows=()):
+        self.seq = 0
+        self.min_deques = [deque() for _ in range(self.num_features)]
+        self.max_deques = [deque() for _ in range(self.num_features)]
+        self.last_evicted = None
+        for row in rows:
+            self.push(row)
+
+    @staticmethod
+    def _push_value(value_deque, seq, value, expired, dominated):
+        popped = []
+        while value_deque and dominated(value_deque[-1][1], value):
+            popped.append(value_deque.pop())
+        value_deque.append((seq, value))
+        front = value_deque.popleft() if value_deque[0][0] <= expired else None
+        return popped, front
+
+    @staticmethod
+    def _undo_value(value_deque, evicted):
+        popped, front = evicted
+        value_deque.pop()
+        if front is not None:
+            value_deque.appendleft(front)
+        value_deque.extend(reversed(popped))
+
+    def push(self, row):
+        seq = self.seq
+        self.seq += 1
+        expired = seq - self.size
+        evicted = []
+        for feature, value in enumerate(row):
+            value = float(value)
+            evicted.append((self._push_value(self.min_deques[feature], seq, value, expired, operator.ge),
+                            self._push_value(self.max_deques[feature], seq, value, expired, operator.le)))
+        self.last_evicted = evicted
+
+    def replace_last(self, row):
+        """
+        Replace the newest row, e.g. a still-open candle that was refetched.
+
+        The newest value always sits at the tail of both deques, so it is popped and whatever
+        its push evicted is put back before the new value is pushed in its place.
+        """
+        if self.last_evicted is None:
+            self.push(row)
+            return
+        for feature, (min_evicted, max_evicted) in enumerate(self.last_evicted):
+            self._undo_value(self.min_deques[feature], min_evicted)
+            self._undo_value(self.max_deques[feature], max_evicted)
+        self.seq -= 1
+        self.push(row)
+
+    def bounds(self):
+        mins = np.array([d[0][1] for d in self.min_deques])
+        maxs = np.array([d[0][1] for d in self.max_deques])
+        return mins, maxs
+
+
+# Function to min-max scale a window with given bounds, same arithmetic as sklearn's MinMaxScaler
+def scale_window(window, mins, maxs):
+    ranges = maxs - mins
+    ranges[ranges < 10 * np.finfo(ranges.dtype).eps] = 1.0  # Constant columns scale to 0
+    scale = 1.0 / ranges
+    return window * scale - mins * scale
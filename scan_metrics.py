@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Instrumentation for the live scan loop, counters, gauges and latency histograms exported in the Prometheus
+# text format (file or HTTP endpoint) plus a rolling JSON log with one line per cycle
+
+CYCLE_BUDGET_SECONDS = 300
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+
+HELP = {
+    "scan_fetch_seconds": ("histogram", "Per-symbol request latency by endpoint"),
+    "scan_fetch_failures_total": ("counter", "Requests that returned no usable data after retries, by endpoint"),
+    "scan_fetch_retries_total": ("counter", "Retried requests by endpoint and reason"),
+    "scan_stage_seconds": ("histogram", "Time spent in each hot-path stage (build, normalize, predict, score)"),
+    "scan_batch_size": ("histogram", "Windows per scoring call"),
+    "scan_cycle_seconds": ("histogram", "Candle close cycle duration"),
+    "scan_cycle_budget_ratio": ("gauge", "Last cycle duration as a fraction of the 300s candle budget"),
+    "scan_cycle_overruns_total": ("counter", "Cycles that took longer than the candle budget"),
+    "scan_cycles_total": ("counter", "Completed scan cycles"),
+    "scan_symbols": ("gauge", "Symbols in the last cycle by outcome"),
+    "scan_alerts_total": ("counter", "Alerts by delivery outcome"),
+}
+
+
+# Function to turn a label dict into a hashable, ordered key
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+# Function to render a label key in Prometheus syntax
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+NULL_TIMER = nullcontext()
+
+
+class ScanMetrics:
+    """
+    Thread-safe metric registry for the scan loop.
+
+    When disabled every call returns straight away and timer() hands back a shared no-op
+    context manager, so instrumented code costs one attribute check per call site.
+
+    Parameters:
+    enabled (bool): Record anything at all
+    log_path (str): Rolling JSON log, one line per cycle
+    log_max_bytes (int): Size at which the JSON log is rotated to <log_path>.1
+    """
+
+    def __init__(self, enabled=True, log_path=None, log_max_bytes=10 * 1024 * 1024):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.log_max_bytes = log_max_bytes
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.cycle_start = None
+        self.cycle_snapshot = None
+        self.server = None
+
+    def timer(self, name, **labels):
+        if not self.enabled:
+            return NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(BATCH_SIZE_BUCKETS if name == "scan_batch_size" else LATENCY_BUCKETS)
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.gauges[(name, _label_key(labels))] = value
+
+    def _totals(self):
+        with self.lock:
+            return ({key: (histogram.count, histogram.sum) for key, histogram in self.histograms.items()}, dict(self.counters))
+
+    def begin_cycle(self):
+        if not self.enabled:
+            return
+        self.cycle_start = time.perf_counter()
+        self.cycle_snapshot = self._totals()
+
+    def end_cycle(self, **fields):
+        """
+        Close the current cycle, updating the cycle metrics and appending a line to the JSON log.
+
+        Parameters:
+        fields: Extra values for the log line, e.g. candle_close, fetched, failed, scored
+
+        Returns:
+        dict: The log record, None when disabled
+        """
+        if not self.enabled or self.cycle_start is None:
+            return None
+        duration = time.perf_counter() - self.cycle_start
+        self.observe("scan_cycle_seconds", duration)
+        self.set("scan_cycle_budget_ratio", duration / CYCLE_BUDGET_SECONDS)
+        self.inc("scan_cycles_total")
+        if duration > CYCLE_BUDGET_SECONDS:
+            self.inc("scan_cycle_overruns_total")
+
+        # Everything recorded since begin_cycle, summed per metric and label set
+        previous_histograms, previous_counters = self.cycle_snapshot
+        histograms, counters = self._totals()
+        stages = {}
+        for (name, labels), (count, total) in histograms.items():
+            before_count, before_total = previous_histograms.get((name, labels), (0, 0.0))
+            if count > before_count and name != "scan_cycle_seconds":
+                label = name + "".join(f".{label_value}" for _, label_value in labels)
+                stages[label] = {"count": count - before_count, "sum": round(total - before_total, 6)}
+        events = {}
+        for (name, labels), value in counters.items():
+            delta = value - previous_counters.get((name, labels), 0)
+            if delta and name not in ("scan_cycles_total", "scan_cycle_overruns_total"):
+                events[name + "".join(f".{label_value}" for _, label_value in labels)] = delta
+
+        record = {"time": time.time(), "duration": round(duration, 6), "budget_ratio": round(duration / CYCLE_BUDGET_SECONDS, 6)}
+        record.update(fields)
+        record["stages"] = stages
+        record["events"] = events
+        self.cycle_start = None
+        self._log(record)
+        return record
+
+    def _log(self, record):
+        if self.log_path is None:
+            return
+        if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > self.log_max_bytes:
+            os.replace(self.log_path, self.log_path + ".1")
+        with open(self.log_path, 'a') as f:
+            f.write(json.dumps(record, default=float) + "\n")
+
+    def prometheus_text(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+
+            lines = []
+            described = set()
+
+            def describe(name):
+                if name not in described and name in HELP:
+                    kind, text = HELP[name]
+                    lines.append(f"# HELP {name} {text}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    described.add(name)
+
+            for (name, labels), value in counters + gauges:
+                describe(name)
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+            maxima = []
+            for (name, labels), histogram in histograms:
+                describe(name)
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+                maxima.append((name, labels, histogram.max))
+
+            # Worst case per histogram, exported as its own gauge family
+            for name, labels, value in maxima:
+                if name + "_max" not in described:
+                    lines.append(f"# TYPE {name}_max gauge")
+                    described.add(name + "_max")
+                lines.append(f"{name}_max{_format_labels(labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """
+        Write the metrics for a node_exporter textfile collector, atomically so it never reads half a file.
+        """
+        if not self.enabled:
+            return
+        temporary_path = path + ".tmp"
+        with open(temporary_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(temporary_path, path)
+
+    def serve(self, port, host='0.0.0.0'):
+        """
+        Serve /metrics over HTTP from a background thread.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server.server_address[1]
+
+
+# Shared disabled instance, the default wherever metrics are optional
+NULL_METRICS = ScanMetrics(enabled=False)
@@ -0,0 +1,146 @@
+import time
+import asyncio
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from scoring import score_windows
+from scan_metrics import NULL_METRICS
+
+# Candle-close-aligned scheduling for the live scanner, each cycle wakes just after a 5m candle closes and
+# scores symbols in micro-batches as their data arrives instead of waiting for the slowest fetch
+
+CANDLE_SECONDS = 300
+GRACE_SECONDS = 10.0  # openInterestHist publishes a few seconds after the candle closes
+MICRO_BATCH = 64
+
+
+# Function to get the open time of the latest candle boundary at or before a timestamp
+def latest_candle_close(now, interval=CANDLE_SECONDS):
+    return int(now // interval) * interval
+
+
+class CandleScheduler:
+    """
+    Async iterator yielding (candle_close, skipped) once per candle boundary.
+
+    Each wake-up happens at candle_close + grace. If a cycle overruns past the next wake-up
+    time, the scheduler runs immediately for the most recent closed candle and reports how
+    many boundaries were skipped, rather than queueing a backlog of stale cycles.
+    """
+
+    def __init__(self, interval=CANDLE_SECONDS, grace=GRACE_SECONDS, clock=time.time, sleep=asyncio.sleep):
+        self.interval = interval
+        self.grace = grace
+        self.clock = clock
+        self.sleep = sleep
+        self.last_close = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        latest = latest_candle_close(self.clock() - self.grace, self.interval)
+        if self.last_close is None:
+            # Start straight away on the latest candle whose data should be published
+            self.last_close = latest
+            return latest, 0
+
+        target = self.last_close + self.interval
+        skipped = 0
+        if latest >= target:
+            skipped = (latest - target) // self.interval
+            target = latest
+        else:
+            await self.sleep(max(0.0, target + self.grace - self.clock()))
+
+        self.last_close = target
+        return target, skipped
+
+
+async def run_pipelined_cycle(fetcher, store, model, symbols, build_rows, now_ms=None, micro_batch=MICRO_BATCH, executor=None, metrics=NULL_METRICS):
+    """
+    Fetch every symbol and score ready windows in micro-batches while slower fetches are still in flight.
+
+    Parameters:
+    fetcher (BinanceFetcher): Open async fetcher
+    store (WindowStore): Live window store, updated in place
+    model: Object exposing predict(batch, batch_size=None, verbose=0)
+    symbols (list): Symbols to scan
+    build_rows (callable): Turns (open_interest_data, kline_data) into (timestamps, rows)
+    now_ms (int): Reference time for how many candles each symbol is missing
+    micro_batch (int): Windows per scoring call
+    executor (ThreadPoolExecutor): Single worker that runs the model off the event loop
+    metrics (ScanMetrics): Records build, normalize, predict and score stage timings
+
+    Returns:
+    tuple: (ranked result DataFrame, stats dict with stage timings as epoch seconds)
+    """
+    loop = asyncio.get_running_loop()
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=1)
+
+    stats = {"started": time.time(), "fetched": 0, "failed": 0, "scored": 0, "batches": 0, "first_score": None, "last_score": None}
+    pending_symbols = []
+    pending_windows = []
+    scoring_tasks = []
+
+    def score(batch_symbols, batch_windows):
+        results = score_windows(model, batch_symbols, batch_windows, metrics)
+        return results, time.time()
+
+    def flush():
+        if pending_symbols:
+            scoring_tasks.append(loop.run_in_executor(executor, score, list(pending_symbols), list(pending_windows)))
+            pending_symbols.clear()
+            pending_windows.clear()
+
+    fetches = [fetcher.fetch_symbol(symbol, store.missing_candles(symbol, now_ms)) for symbol in symbols]
+    try:
+        for next_fetch in asyncio.as_completed(fetches):
+            symbol, open_interest_data, kline_data = await next_fetch
+            if open_interest_data is None or kline_data is None:
+                stats["failed"] += 1
+                continue
+            try:
+                with metrics.timer("scan_stage_seconds", stage='build'):
+                    timestamps, rows = build_rows(open_interest_data, kline_data)
+                    store.extend(symbol, timestamps, rows)
+            except Exception as e:
+                print(f"Failed to build data for {symbol}: {str(e)}")
+                stats["failed"] += 1
+                continue
+            stats["fetched"] += 1
+
+            if store.is_ready(symbol):
+                pending_symbols.append(symbol)
+                with metrics.timer("scan_stage_seconds", stage='normalize'):
+                    pending_windows.append(store.normalized_window(symbol))
+                if len(pending_symbols) >= micro_batch:
+                    flush()
+
+        stats["fetch_done"] = time.time()
+        flush()
+        scored = await asyncio.gather(*scoring_tasks)
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False)
+
+    frames = [results for results, _ in scored]
+    finished = [finished_at for _, finished_at in scored]
+    if finished:
+        stats["first_score"] = min(finished)
+        stats["last_score"] = max(finished)
+    stats["batches"] = len(frames)
+
+    if frames:
+        results = pd.concat(frames, ignore_index=True)
+        results.sort_values(by="cosine_sim", ascending=False, inplace=True)
+        results.reset_index(drop=True, inplace=True)
+    else:
+        results = score_windows(model, [], [])
+    stats["scored"] = len(results)
+    metrics.set("scan_symbols", stats["fetched"], outcome='fetched')
+    metrics.set("scan_symbols", stats["failed"], outcome='failed')
+    metrics.set("scan_symbols", stats["scored"], outcome='scored')
+    return results, stats
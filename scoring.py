@@ -0,0 +1,173 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from scan_metrics import NULL_METRICS
+
+# Batched scoring engine, stacks every ready symbol window and runs the autoencoder once per cycle
+
+SEQUENCE_LENGTH = 25
+NUM_FEATURES = 12
+FEATURE_COLUMNS = ["sum_open_interest", "sum_open_interest_value", "open", "high", "low", "close", "volume",
+                   "quote_volume", "count", "taker_buy_volume", "taker_buy_quote_volume", "volume_delta"]
+
+
+# Function to load the autoencoder with the chosen inference backend
+def load_scoring_model(path='autoencoder_model.h5', backend='keras', resident='float32'):
+    """
+    Load a model exposing predict(batch, batch_size=None, verbose=0).
+
+    Parameters:
+    path (str): Keras .h5 model file, or a quantized .npz from quantize_model.py which always runs with NumPy
+    backend (str): 'keras' loads it with TensorFlow, 'numpy' runs it with NumpyAutoencoder
+    resident (str): For an int8 .npz, 'float32' expands the weights once at load, 'quantized' keeps them int8 in memory
+
+    Returns:
+    Model ready for score_windows
+    """
+    if path.endswith('.npz'):
+        from quantize_model import load_quantized
+        return load_quantized(path, resident)
+    if backend == 'numpy':
+        from numpy_autoencoder import NumpyAutoencoder
+        return NumpyAutoencoder.from_h5(path)
+    if backend == 'keras':
+        # Imported lazily so the numpy backend never pays TensorFlow's startup cost
+        from tensorflow.keras.models import load_model
+        return load_model(path)
+    raise ValueError(f"Unknown inference backend '{backend}', expected 'keras' or 'numpy'")
+
+
+class CheckpointWatcher:
+    """
+    Follow the checkpoints/latest.json pointer model_train.py --mode incremental writes.
+
+    poll() loads the checkpoint the pointer names once it changes, so a running scanner can
+    swap models between cycles. A checkpoint that fails to load, e.g. one still being written,
+    is reported and retried on the next poll while the current model keeps scoring.
+
+    Parameters:
+    pointer_path (str): Pointer JSON, its model path is relative to the pointer's folder
+    backend (str): 'keras' or 'numpy', as for load_scoring_model
+    resident (str): 'float32' or 'quantized', as for load_scoring_model
+    """
+
+    def __init__(self, pointer_path, backend='keras', resident='float32'):
+        self.pointer_path = pointer_path
+        self.backend = backend
+        self.resident = resident
+        self.mtime = None
+        self.pointer = None
+        self.model_path = None
+
+    def poll(self):
+        """
+        Returns:
+        tuple: (model, pointer dict) if a new checkpoint was loaded, otherwise None
+        """
+        try:
+            mtime = os.path.getmtime(self.pointer_path)
+        except OSError:
+            return None
+        if mtime == self.mtime:
+            return None
+
+        try:
+            with open(self.pointer_path) as f:
+                pointer = json.load(f)
+            if self.pointer is not None and pointer["version"] == self.pointer["version"]:
+                self.mtime = mtime
+                return None
+            model_path = os.path.join(os.path.dirname(self.pointer_path), pointer["model"])
+            model = load_scoring_model(model_path, self.backend, self.resident)
+        except Exception as e:
+            # mtime is left alone so the next poll tries again
+            print(f"Could not load the checkpoint named by {self.pointer_path}, keeping the current model and retrying next cycle: {str(e)}")
+            return None
+        self.mtime = mtime
+        self.pointer = pointer
+        self.model_path = model_path
+        return model, pointer
+
+
+# Function to stack per-symbol windows into one contiguous float32 batch
+def stack_windows(windows):
+    """
+    Stack the per-symbol windows into a single model batch.
+
+    Parameters:
+    windows (list): Arrays with shape (25, 12) or (1, 25, 12)
+
+    Returns:
+    ndarray: float32 batch with shape (N, 25, 12)
+    """
+    batch = np.empty((len(windows), SEQUENCE_LENGTH, NUM_FEATURES), dtype=np.float32)
+    for i, window in enumerate(windows):
+        batch[i] = np.reshape(window, (SEQUENCE_LENGTH, NUM_FEATURES))
+    return batch
+
+
+def reconstruction_metrics(data, decoded_data):
+    """
+    Calculate cosine similarity, MSE and per-feature reconstruction error for a whole batch.
+
+    The decoded vector is compared against every timestep of its window via broadcasting,
+    which matches the tiled sklearn cosine_similarity used previously without the copies.
+
+    Parameters:
+    data (ndarray): Input data with shape (N, 25, 12)
+    decoded_data (ndarray): Decoded output data with shape (N, 12)
+
+    Returns:
+    tuple: cosine similarity (N,), MSE (N,) and per-feature error (N, 12)
+    """
+    data = np.asarray(data, dtype=np.float64)
+    decoded_data = np.asarray(decoded_data, dtype=np.float64)
+
+    diff = data - decoded_data[:, None, :]
+    feature_error = np.einsum('ntf,ntf->nf', diff, diff) / data.shape[1]
+    mse = feature_error.mean(axis=1)
+
+    dots = np.einsum('ntf,nf->nt', data, decoded_data)
+    denom = np.sqrt(np.einsum('ntf,ntf->nt', data, data)) * np.linalg.norm(decoded_data, axis=1)[:, None]
+    # Zero vectors score 0, the same as sklearn's normalize-then-dot behaviour
+    cosine_rows = np.divide(dots, denom, out=np.zeros_like(dots), where=denom > 0)
+
+    return cosine_rows.mean(axis=1), mse, feature_error
+
+
+def score_windows(model, symbols, windows, metrics=NULL_METRICS):
+    """
+    Run a single predict over every window and return a ranked result table.
+
+    Parameters:
+    model: Object exposing a Keras style predict(batch) method
+    symbols (list): Symbol names, one per window
+    windows (list or ndarray): Windows with shape (25, 12) each, or an (N, 25, 12) batch
+    metrics (ScanMetrics): Records the predict and score stage timings and batch size
+
+    Returns:
+    DataFrame: symbol, cosine_sim, mse and per-feature errors sorted by cosine_sim descending
+    """
+    if len(symbols) == 0:
+        return pd.DataFrame(columns=["symbol", "cosine_sim", "mse"] + [f"error_{col}" for col in FEATURE_COLUMNS])
+
+    if isinstance(windows, np.ndarray) and windows.ndim == 3 and windows.dtype == np.float32:
+        batch = windows
+    else:
+        batch = stack_windows(windows)
+
+    metrics.observe("scan_batch_size", len(batch))
+    with metrics.timer("scan_stage_seconds", stage='predict'):
+        decoded_data = model.predict(batch, batch_size=len(batch), verbose=0)
+
+    with metrics.timer("scan_stage_seconds", stage='score'):
+        cosine_sim, mse, feature_error = reconstruction_metrics(batch, decoded_data)
+
+        results = pd.DataFrame({"symbol": list(symbols), "cosine_sim": cosine_sim, "mse": mse})
+        for i, col in enumerate(FEATURE_COLUMNS):
+            results[f"error_{col}"] = feature_error[:, i]
+
+        results.sort_values(by="cosine_sim", ascending=False, inplace=True)
+        results.reset_index(drop=True, inplace=True)
+    return results
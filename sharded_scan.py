@@ -0,0 +1,360 @@
+import os
+import time
+import queue
+import bisect
+import asyncio
+import hashlib
+import secrets
+import argparse
+import threading
+import multiprocessing
+from datetime import datetime
+from multiprocessing.connection import Listener, Client
+import pandas as pd
+from scoring import load_scoring_model, CheckpointWatcher
+from quantize_model import RESIDENT_MODES
+from window_store import WindowStore
+from binance_fetcher import BinanceFetcher
+from scan_scheduler import CandleScheduler, run_pipelined_cycle, CANDLE_SECONDS, GRACE_SECONDS, MICRO_BATCH
+from universe import concurrent_data_symbols, CONCURRENT_DATA_DIR
+from alert_dispatcher import AlertDispatcher
+import concurrent_data_fetcher
+
+# Run this to split the scan across several scanner processes or hosts. Each worker scans the consistent-hash
+# shard of the concurrent_data symbols that belongs to its id and sends its scores to one coordinator, which
+# keeps the global ranking and highest score and owns alerting
+#
+#   SCAN_AUTHKEY=<shared secret> python3 sharded_scan.py coordinator --workers w0 w1 w2 --coordinator 0.0.0.0:6000
+#   SCAN_AUTHKEY=<shared secret> python3 sharded_scan.py worker --id w0 --workers w0 w1 w2 --coordinator 10.0.0.5:6000
+#   python3 sharded_scan.py local --workers 3 --fake --interval 10 --cycles 3   (everything on this host)
+#
+# multiprocessing.connection unpickles whatever an authenticated peer sends, so the coordinator and workers
+# refuse to start without SCAN_AUTHKEY, local mode generates a fresh key for its own processes
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+COORDINATOR_ADDRESS = ('127.0.0.1', 6000)
+AUTHKEY_ENV = 'SCAN_AUTHKEY'
+VIRTUAL_NODES = 128
+COLLECT_TIMEOUT = 120.0
+
+
+# Function to hash a key onto the ring
+def ring_hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """
+    Consistent-hash ring with virtual nodes.
+
+    Every worker owns VIRTUAL_NODES points on the ring and a symbol belongs to the first point
+    clockwise from its hash, so adding or removing a worker only moves about 1/N of the symbols.
+    """
+
+    def __init__(self, nodes, virtual_nodes=VIRTUAL_NODES):
+        self.nodes = sorted(set(nodes))
+        points = sorted((ring_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(virtual_nodes))
+        self.hashes = [point for point, _ in points]
+        self.owners = [node for _, node in points]
+
+    def node_for(self, symbol):
+        i = bisect.bisect(self.hashes, ring_hash(symbol)) % len(self.hashes)
+        return self.owners[i]
+
+    def assign(self, symbols):
+        shards = {node: [] for node in self.nodes}
+        for symbol in symbols:
+            shards[self.node_for(symbol)].append(symbol)
+        return shards
+
+    def shard(self, symbols, node):
+        return [symbol for symbol in symbols if self.node_for(symbol) == node]
+
+
+# Function to parse host:port into a listener address
+def parse_address(address):
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+# Function to send a message to the coordinator, reconnecting if the previous connection dropped
+def send_to_coordinator(connection, address, message, authkey):
+    try:
+        if connection is None:
+            connection = Client(address, authkey=authkey)
+        connection.send(message)
+        return connection
+    except (OSError, EOFError) as e:
+        print(f"Could not reach the coordinator at {address[0]}:{address[1]}: {str(e)}")
+        if connection is not None:
+            connection.close()
+        return None
+
+
+async def run_worker(worker_id, workers, address, args):
+    """
+    Scan this worker's shard at every candle close and report the scores to the coordinator.
+
+    The shard is recomputed from concurrent_data every cycle, so symbols added by
+    create_concurrent_files.py are picked up by whichever worker owns them.
+    """
+    model = load_scoring_model(args.model, args.backend, args.resident)
+    watcher = CheckpointWatcher(args.checkpoint_pointer, args.backend, args.resident) if args.checkpoint_pointer else None
+    ring = HashRing(workers)
+    shard = ring.shard(concurrent_data_symbols(args.folder), worker_id)
+    snapshot_dir = os.path.join(args.snapshot_dir, worker_id) if args.snapshot_dir else None
+    store = WindowStore.load(snapshot_dir, shard) if snapshot_dir else WindowStore(shard)
+    print(f"[{worker_id}] Scanning {len(shard)} symbols.")
+
+    connection = send_to_coordinator(None, address, {"type": "hello", "worker": worker_id, "symbols": len(shard)}, args.authkey)
+    cycles = 0
+    async with BinanceFetcher(args.fapi_url, args.futures_data_url, max_concurrency=args.concurrency) as fetcher:
+        async for candle_close, skipped in CandleScheduler(args.interval, args.grace):
+            reloaded = watcher.poll() if watcher is not None else None
+            if reloaded is not None:
+                model, pointer = reloaded
+                print(f"[{worker_id}] Scoring with checkpoint v{pointer['version']} ({pointer['model']}).")
+            store.set_symbols(ring.shard(concurrent_data_symbols(args.folder), worker_id))
+            results, stats = await run_pipelined_cycle(fetcher, store, model, store.symbols, concurrent_data_fetcher.build_feature_rows,
+                                                       micro_batch=args.micro_batch)
+            store.flush()
+
+            message = {"type": "cycle", "worker": worker_id, "candle_close": candle_close, "skipped": skipped,
+                       "results": results[["symbol", "cosine_sim", "mse"]].to_dict('list'),
+                       "stats": {key: stats[key] for key in ("fetched", "failed", "scored", "batches")}}
+            connection = send_to_coordinator(connection, address, message, args.authkey)
+            print(f"[{worker_id}] {datetime.fromtimestamp(candle_close).strftime('%Y-%m-%d %H:%M:%S')}: "
+                  f"{stats['scored']} scored, {stats['failed']} failed")
+
+            cycles += 1
+            if args.cycles and cycles >= args.cycles:
+                break
+
+    if connection is not None:
+        connection.close()
+
+
+class Coordinator:
+    """
+    Collect per-shard scores, rank each candle globally and alert once.
+
+    A candle is finalized when every expected worker has reported it, or collect_timeout
+    seconds after its first report so a dead worker cannot hold up alerting. Reports that
+    arrive after their candle was finalized are dropped.
+
+    Parameters:
+    address (tuple): (host, port) to listen on
+    workers (list): Worker ids expected every cycle
+    dispatcher (AlertDispatcher): Started dispatcher that owns alert delivery
+    authkey (bytes): Shared secret workers must authenticate with
+    collect_timeout (float): Seconds to wait for stragglers
+    """
+
+    def __init__(self, address, workers, dispatcher, authkey, collect_timeout=COLLECT_TIMEOUT):
+        if not authkey:
+            raise ValueError("The coordinator needs an authkey, without one anyone reaching its port can make it unpickle anything")
+        self.address = address
+        self.workers = set(workers)
+        self.dispatcher = dispatcher
+        self.collect_timeout = collect_timeout
+        self.authkey = authkey
+        self.inbox = queue.Queue()
+        self.pending = {}
+        self.finalized_candles = set()
+        self.finalized = 0
+        self.listener = None
+
+    def start(self):
+        self.listener = Listener(self.address, authkey=self.authkey)
+        self.address = self.listener.address
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def _accept(self):
+        while True:
+            try:
+                connection = self.listener.accept()
+            except multiprocessing.AuthenticationError:
+                print("Rejected a connection with the wrong SCAN_AUTHKEY.")
+                continue
+            except OSError:
+                return
+            threading.Thread(target=self._read, args=(connection,), daemon=True).start()
+
+    def _read(self, connection):
+        with connection:
+            while True:
+                try:
+                    self.inbox.put(connection.recv())
+                except (EOFError, OSError):
+                    return
+
+    def handle(self, message):
+        if message["type"] == "hello":
+            print(f"Worker {message['worker']} connected with {message['symbols']} symbols.")
+            return
+        if message["candle_close"] in self.finalized_candles:
+            print(f"Dropped a late report from {message['worker']} for the already finalized "
+                  f"{datetime.fromtimestamp(message['candle_close']).strftime('%Y-%m-%d %H:%M')} candle.")
+            return
+        candle = self.pending.setdefault(message["candle_close"], {"first_report": time.monotonic(), "parts": {}})
+        candle["parts"][message["worker"]] = message
+        if self.workers <= set(candle["parts"]):
+            self.finalize(message["candle_close"])
+
+    def finalize(self, candle_close):
+        parts = self.pending.pop(candle_close)["parts"]
+        self.finalized_candles.add(candle_close)
+        missing = sorted(self.workers - set(parts))
+        results = pd.concat([pd.DataFrame(part["results"]) for part in parts.values()], ignore_index=True)
+        results.sort_values(by="cosine_sim", ascending=False, inplace=True)
+        results.reset_index(drop=True, inplace=True)
+
+        print("________________________________________________________________________")
+        print("Candle Close:", datetime.fromtimestamp(candle_close).strftime("%Y-%m-%d %H:%M"))
+        if missing:
+            print(f"No scores from {', '.join(missing)} for this candle.")
+
+        # The coordinator is the only process reporting, so the scanner's highest score tracking is global here
+        concurrent_data_fetcher.report_results(results, self.dispatcher, candle_close)
+        print(f"Highest Cosine Similarity: {concurrent_data_fetcher.highest_cosine_similarity}, "
+              f"Symbol: {concurrent_data_fetcher.highest_cosine_similarity_symbol}, "
+              f"Timestamp: {concurrent_data_fetcher.highest_cosine_similarity_timestamp}")
+        failed = sum(part["stats"]["failed"] for part in parts.values())
+        print(f"Round Complete: {len(results)} scored across {len(parts)} shard(s), {failed} failed")
+        self.finalized += 1
+        return results
+
+    def run(self, cycles=None):
+        while cycles is None or self.finalized < cycles:
+            try:
+                self.handle(self.inbox.get(timeout=1.0))
+            except queue.Empty:
+                pass
+            now = time.monotonic()
+            for candle_close in sorted(self.pending):
+                if now - self.pending[candle_close]["first_report"] >= self.collect_timeout:
+                    self.finalize(candle_close)
+
+    def close(self):
+        self.listener.close()
+
+
+# Function to run one worker in its own process
+def worker_process(worker_id, workers, address, args):
+    asyncio.run(run_worker(worker_id, workers, address, args))
+
+
+# Function to run the coordinator and N worker processes on this host, optionally against local stand-ins
+def run_local(args):
+    worker_ids = [f"w{i}" for i in range(args.workers)]
+    server = sink = None
+    if args.fake:
+        from fake_binance import FakeBinance, WebhookSink
+        server = FakeBinance(latency=0.02).start()
+        sink = WebhookSink().start()
+        args.fapi_url = args.futures_data_url = server.base_url
+        args.webhook_url = sink.url
+
+    with AlertDispatcher(args.webhook_url) as dispatcher:
+        coordinator = Coordinator(parse_address(args.coordinator), worker_ids, dispatcher, args.authkey, args.collect_timeout).start()
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=worker_process, args=(worker_id, worker_ids, coordinator.address, args)) for worker_id in worker_ids]
+        for process in processes:
+            process.start()
+        try:
+            coordinator.run(args.cycles or None)
+        finally:
+            for process in processes:
+                process.join(timeout=30)
+            coordinator.close()
+
+    if server is not None:
+        print(f"Stand-in served {server.requests} requests, the webhook sink received {len(sink.received)} message(s).")
+        server.stop()
+        sink.stop()
+
+
+# Function to show how a symbol list splits across workers and how many symbols move when one is added
+def show_ring(args):
+    symbols = concurrent_data_symbols(args.folder)
+    ring = HashRing(args.workers)
+    for node, shard in ring.assign(symbols).items():
+        print(f"{node}: {len(shard)} symbols")
+    if args.add:
+        grown = HashRing(list(args.workers) + [args.add])
+        moved = sum(ring.node_for(symbol) != grown.node_for(symbol) for symbol in symbols)
+        print(f"Adding {args.add} moves {moved} of {len(symbols)} symbols ({moved / max(len(symbols), 1):.0%}).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded scanning across several processes or hosts with one result coordinator.")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    def add_scan_arguments(subparser):
+        subparser.add_argument("--folder", default=CONCURRENT_DATA_DIR, help="Folder of concurrent_data files defining the universe")
+        subparser.add_argument("--model", default='autoencoder_model.h5', help="Autoencoder .h5 file to score with")
+        subparser.add_argument("--backend", choices=['keras', 'numpy'], default='keras', help="Run the model with TensorFlow or the NumPy inference engine")
+        subparser.add_argument("--resident", choices=RESIDENT_MODES, default='float32', help="For an int8 .npz from quantize_model.py, keep its kernels int8 in memory with 'quantized'")
+        subparser.add_argument("--concurrency", type=int, default=20, help="Maximum Binance requests in flight per worker")
+        subparser.add_argument("--micro-batch", type=int, default=MICRO_BATCH, help="Windows scored together while other fetches are still in flight")
+        subparser.add_argument("--snapshot-dir", default=None, help="Directory for per-worker window snapshots")
+        subparser.add_argument("--interval", type=int, default=CANDLE_SECONDS, help="Seconds between cycles")
+        subparser.add_argument("--grace", type=float, default=GRACE_SECONDS, help="Seconds after each candle close to wait for openInterestHist to publish")
+        subparser.add_argument("--cycles", type=int, default=0, help="Stop after this many cycles, 0 runs forever")
+        subparser.add_argument("--fapi-url", default=None, help="Override the fapi base URL")
+        subparser.add_argument("--futures-data-url", default=None, help="Override the futures/data base URL")
+        subparser.add_argument("--checkpoint-pointer", default=None, help="Follow this latest.json from model_train.py --mode incremental between cycles")
+
+    def add_coordinator_arguments(subparser, address=f"{COORDINATOR_ADDRESS[0]}:{COORDINATOR_ADDRESS[1]}"):
+        subparser.add_argument("--coordinator", default=address, help="host:port the coordinator listens on")
+        subparser.add_argument("--collect-timeout", type=float, default=COLLECT_TIMEOUT, help="Seconds to wait for every shard of a candle")
+        subparser.add_argument("--webhook-url", default=None, help="Discord webhook for alerts, defaults to DISCORD_WEBHOOK_URL")
+
+    coordinator_parser = subparsers.add_parser("coordinator", help="Collect shard scores, rank globally and alert")
+    coordinator_parser.add_argument("--workers", nargs='+', required=True, help="Worker ids expected every cycle")
+    coordinator_parser.add_argument("--cycles", type=int, default=0, help="Stop after this many candles, 0 runs forever")
+    add_coordinator_arguments(coordinator_parser)
+
+    worker_parser = subparsers.add_parser("worker", help="Scan one shard and report to the coordinator")
+    worker_parser.add_argument("--id", required=True, help="This worker's id, one of --workers")
+    worker_parser.add_argument("--workers", nargs='+', required=True, help="Every worker id, the same list on every host")
+    worker_parser.add_argument("--coordinator", default=f"{COORDINATOR_ADDRESS[0]}:{COORDINATOR_ADDRESS[1]}", help="Coordinator host:port")
+    add_scan_arguments(worker_parser)
+
+    local_parser = subparsers.add_parser("local", help="Run a coordinator and several worker processes on this host")
+    local_parser.add_argument("--workers", type=int, default=2, help="Worker processes to start")
+    local_parser.add_argument("--fake", action='store_true', help="Scan a local Binance stand-in and alert into a local webhook sink")
+    add_scan_arguments(local_parser)
+    # Any free port, the workers are handed the address directly
+    add_coordinator_arguments(local_parser, "127.0.0.1:0")
+
+    ring_parser = subparsers.add_parser("ring", help="Show how the symbols split across workers")
+    ring_parser.add_argument("--workers", nargs='+', required=True, help="Worker ids")
+    ring_parser.add_argument("--add", default=None, help="Worker id to add, reports how many symbols would move")
+    ring_parser.add_argument("--folder", default=CONCURRENT_DATA_DIR, help="Folder of concurrent_data files defining the universe")
+
+    args = parser.parse_args()
+
+    args.authkey = os.environ.get(AUTHKEY_ENV, '').encode() or None
+    if args.mode in ("coordinator", "worker") and args.authkey is None:
+        parser.error(f"set {AUTHKEY_ENV} to a secret shared by the coordinator and its workers, "
+                     f"the coordinator unpickles whatever authenticated workers send it")
+    if args.mode == "local" and args.authkey is None:
+        # Only this process and the workers it spawns need the key
+        args.authkey = secrets.token_bytes(32)
+
+    if args.mode == "coordinator":
+        with AlertDispatcher(args.webhook_url) as dispatcher:
+            coordinator = Coordinator(parse_address(args.coordinator), args.workers, dispatcher, args.authkey, args.collect_timeout).start()
+            print(f"Coordinator listening on {args.coordinator} for {', '.join(args.workers)}.")
+            coordinator.run(args.cycles or None)
+    elif args.mode == "worker":
+        if args.id not in args.workers:
+            parser.error(f"--id {args.id} must be one of --workers")
+        asyncio.run(run_worker(args.id, args.workers, parse_address(args.coordinator), args))
+    elif args.mode == "local":
+        run_local(args)
+    else:
+        show_ring(args)
@@ -0,0 +1,81 @@
+from alert_dispatcher import AlertDispatcher, MAX_MESSAGE_LENGTH
+from fake_binance import WebhookSink
+
+
+class FakeClock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def sample_alerts(count, prefix="TEST"):
+    return [(f"{prefix}{i}USDT", 0.94 + 0.0005 * i) for i in range(count)]
+
+
+def test_a_cycle_is_batched_into_messages_sorted_by_score():
+    with WebhookSink() as sink:
+        with AlertDispatcher(sink.url) as dispatcher:
+            assert dispatcher.submit_cycle(sample_alerts(200)) == 200
+        lines = [line for payload in sink.received for line in payload["content"].split("\n")[1:]]
+
+    assert 1 < len(sink.received) < 200
+    assert all(len(payload["content"]) <= MAX_MESSAGE_LENGTH for payload in sink.received)
+    assert len(lines) == 200
+    assert lines[0].startswith("TEST199USDT") and lines[-1].startswith("TEST0USDT")
+    assert dispatcher.sent == len(sink.received)
+
+
+def test_cooldown_starts_at_delivery():
+    clock = FakeClock()
+    with WebhookSink() as sink:
+        with AlertDispatcher(sink.url, cooldown=60, clock=clock) as dispatcher:
+            assert dispatcher.submit_cycle(sample_alerts(3)) == 3
+            dispatcher.join()
+            clock.now += 30
+            assert dispatcher.submit_cycle(sample_alerts(5)) == 2
+            dispatcher.join()
+            clock.now += 31
+            assert dispatcher.submit_cycle(sample_alerts(3)) == 3
+    assert len(sink.received) == 3
+
+
+def test_rate_limits_and_server_errors_are_retried():
+    with WebhookSink(rate_limit_first=2, error_first=2, retry_after=0.05) as sink:
+        with AlertDispatcher(sink.url, max_retries=5, backoff=0.01) as dispatcher:
+            dispatcher.submit_cycle(sample_alerts(3))
+    assert sink.statuses == [429, 429, 503, 503, 204]
+    assert len(sink.received) == 1
+    assert dispatcher.sent == 1 and dispatcher.failed == 0
+
+
+def test_failed_delivery_does_not_start_the_cooldown():
+    clock = FakeClock()
+    with WebhookSink(error_first=2) as sink:
+        with AlertDispatcher(sink.url, cooldown=60, max_retries=1, backoff=0.01, clock=clock) as dispatcher:
+            dispatcher.submit_cycle(sample_alerts(3))
+            dispatcher.join()
+            assert dispatcher.failed == 1
+            assert dispatcher.submit_cycle(sample_alerts(3)) == 3
+    assert dispatcher.sent == 1
+    assert len(sink.received) == 1
+
+
+def test_dropped_messages_do_not_start_the_cooldown():
+    dispatcher = AlertDispatcher("http://127.0.0.1:9/webhook", max_queue=1)
+    # Not started, so the second message pushes the first out of the bounded queue
+    dispatcher.submit_cycle(sample_alerts(1, "A"))
+    dispatcher.submit_cycle(sample_alerts(1, "B"))
+    assert dispatcher.dropped == 1
+    assert dispatcher.in_flight == {"B0USDT"}
+    assert not dispatcher.last_alerted
+    assert dispatcher.submit_cycle(sample_alerts(1, "A")) == 1
+
+
+def test_without_a_webhook_alerting_is_off(monkeypatch):
+    monkeypatch.setattr("alert_dispatcher.WEBHOOK_URL", None)
+    with AlertDispatcher() as dispatcher:
+        assert not dispatcher.enabled
+        assert dispatcher.submit_cycle(sample_alerts(3)) == 0
+    assert dispatcher.thread is None
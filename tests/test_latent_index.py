@@ -0,0 +1,49 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("h5py", reason="h5py is needed to read the autoencoder weights")
+
+from latent_index import LatentIndex
+from training_dataset import INDEX_COLUMNS, write_shard
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_PATH = os.path.join(PROJECT_ROOT, "autoencoder_model.h5")
+FOLDER = os.path.join("SYNUSDT", "SYNUSDT_training_data")
+
+
+def write_training_folder(root, seed, starts):
+    windows = np.random.default_rng(seed).random((len(starts), 25, 12), dtype=np.float32)
+    # generate_training_data numbers the windows by count, so a rerun reuses the same names
+    index = pd.DataFrame({"symbol": "SYNUSDT", "window_start": starts, "surge_threshold": 0.05, "surge_horizon": 6,
+                          "source": [f"SYNUSDT_2023-01-01_2023-06-01_{i}_training_data.csv" for i in range(len(starts))]},
+                         columns=INDEX_COLUMNS)
+    os.makedirs(os.path.join(root, FOLDER), exist_ok=True)
+    write_shard(os.path.join(root, FOLDER), windows, index)
+    return windows
+
+
+def test_update_reencodes_a_regenerated_folder(tmp_path):
+    root = str(tmp_path / "data")
+    first = write_training_folder(root, 0, ["2023-01-02 00:00:00", "2023-01-03 00:00:00", "2023-01-04 00:00:00"])
+    index = LatentIndex(str(tmp_path / "index"), MODEL_PATH)
+    assert index.update(root) == 3
+    index.save()
+
+    # The rerun finds one window fewer, under the same file names, at other dates
+    second = write_training_folder(root, 1, ["2023-02-05 00:00:00", "2023-02-06 00:00:00"])
+    index = LatentIndex(str(tmp_path / "index"), MODEL_PATH)
+    assert len(index) == 3
+    assert index.update(root) == 2
+
+    assert len(index) == 2
+    assert list(index.metadata["window_start"]) == ["2023-02-05 00:00:00", "2023-02-06 00:00:00"]
+    assert np.allclose(index.vectors, index.encode(second), atol=1e-6)
+    assert len(index.assignments) == 2
+    scores, ids = index.search(index.encode(first[:1]), k=2)
+    assert set(ids[0]) == {0, 1}
+
+    # Nothing changed since, so nothing is re-encoded
+    assert index.update(root) == 0
+    assert len(index) == 2
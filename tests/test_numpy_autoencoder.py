@@ -0,0 +1,40 @@
+import os
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow", reason="TensorFlow is needed for the Keras parity check")
+
+from numpy_autoencoder import NumpyAutoencoder
+from scoring import load_scoring_model
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def random_windows(shape, count=256):
+    return np.random.default_rng(0).random((count,) + tuple(shape), dtype=np.float32)
+
+
+def test_predict_matches_keras_for_a_freshly_built_model(tmp_path):
+    from model_train import build_model
+    model = build_model()
+    path = str(tmp_path / "autoencoder.h5")
+    model.save(path)
+
+    numpy_model = NumpyAutoencoder.from_h5(path)
+    windows = random_windows(model.input_shape[1:])
+    assert tuple(numpy_model.input_shape[1:]) == tuple(model.input_shape[1:])
+    assert np.allclose(numpy_model.predict(windows), model.predict(windows, verbose=0), rtol=1e-4, atol=1e-5)
+    assert np.allclose(numpy_model.predict(windows, batch_size=32), model.predict(windows, verbose=0), rtol=1e-4, atol=1e-5)
+
+
+@pytest.mark.parametrize("name", ["autoencoder_model.h5", "autoencoder_model_200_0025.h5"])
+def test_predict_matches_keras_for_the_shipped_models(name):
+    path = os.path.join(PROJECT_ROOT, name)
+    try:
+        keras_model = load_scoring_model(path, 'keras')
+    except (TypeError, ValueError) as e:
+        pytest.skip(f"This TensorFlow cannot load {name}: {e}")
+
+    numpy_model = NumpyAutoencoder.from_h5(path)
+    windows = random_windows(numpy_model.input_shape[1:])
+    assert np.allclose(numpy_model.predict(windows), keras_model.predict(windows, verbose=0), rtol=1e-4, atol=1e-5)
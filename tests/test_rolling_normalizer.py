@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+from sklearn.preprocessing import MinMaxScaler
+from rolling_normalizer import RollingMinMax, scale_window
+from window_store import WindowStore, SEQUENCE_LENGTH, NUM_FEATURES
+
+
+def random_window(rng, constant_columns=()):
+    window = rng.uniform(-1e3, 1e6, size=(SEQUENCE_LENGTH, NUM_FEATURES))
+    for column in constant_columns:
+        window[:, column] = rng.uniform(-10, 10)
+    return window
+
+
+@pytest.mark.parametrize("constant_columns", [(), (0,), (3, 7, 11), tuple(range(NUM_FEATURES))])
+def test_scale_window_matches_minmaxscaler(constant_columns):
+    rng = np.random.default_rng(len(constant_columns))
+    for _ in range(20):
+        window = random_window(rng, constant_columns)
+        bounds = RollingMinMax(SEQUENCE_LENGTH, NUM_FEATURES)
+        bounds.reset(window)
+        mins, maxs = bounds.bounds()
+
+        np.testing.assert_array_equal(mins, window.min(axis=0))
+        np.testing.assert_array_equal(maxs, window.max(axis=0))
+        np.testing.assert_allclose(scale_window(window, mins, maxs), MinMaxScaler().fit_transform(window), rtol=1e-12, atol=1e-12)
+        for column in constant_columns:
+            assert not scale_window(window, mins, maxs)[:, column].any()
+
+
+def test_rolling_bounds_follow_the_last_rows():
+    rng = np.random.default_rng(1)
+    rows = rng.integers(0, 10, size=(200, NUM_FEATURES)).astype(np.float64)
+    bounds = RollingMinMax(SEQUENCE_LENGTH, NUM_FEATURES)
+    for i, row in enumerate(rows):
+        bounds.push(row)
+        window = rows[max(0, i + 1 - SEQUENCE_LENGTH):i + 1]
+        mins, maxs = bounds.bounds()
+        np.testing.assert_array_equal(mins, window.min(axis=0))
+        np.testing.assert_array_equal(maxs, window.max(axis=0))
+        if len(window) == SEQUENCE_LENGTH:
+            np.testing.assert_allclose(scale_window(window, mins, maxs), MinMaxScaler().fit_transform(window), rtol=1e-12, atol=1e-12)
+
+
+def test_replace_last_restores_what_the_stale_value_evicted():
+    bounds = RollingMinMax(3, 1)
+    for value in (5.0, 4.0, 3.0):
+        bounds.push([value])
+    # A new low evicts 5, 4 and 3 from the min deque and 4 and 3 from the max deque
+    bounds.push([0.0])
+    assert bounds.bounds() == ([0.0], [4.0])
+    bounds.replace_last([10.0])
+    assert bounds.bounds() == ([3.0], [10.0])
+    bounds.replace_last([3.5])
+    assert bounds.bounds() == ([3.0], [4.0])
+
+
+def test_window_store_append_wraps_the_ring():
+    rng = np.random.default_rng(2)
+    store = WindowStore(["AUSDT"])
+    rows = rng.uniform(0, 100, size=(3 * SEQUENCE_LENGTH + 7, NUM_FEATURES))
+    for timestamp, row in enumerate(rows):
+        store.append("AUSDT", timestamp, row)
+        expected = rows[max(0, timestamp + 1 - SEQUENCE_LENGTH):timestamp + 1]
+        count = len(expected)
+        assert store.count[0] == count
+        assert store.last_timestamp("AUSDT") == timestamp
+        np.testing.assert_array_equal(store.window("AUSDT")[-count:], expected)
+
+    assert store.is_ready("AUSDT")
+    assert store.head[0] == len(rows) % SEQUENCE_LENGTH
+    np.testing.assert_allclose(store.normalized_window("AUSDT"), MinMaxScaler().fit_transform(rows[-SEQUENCE_LENGTH:]), rtol=1e-12, atol=1e-12)
+    symbols, windows = store.ready_windows()
+    assert symbols == ["AUSDT"]
+    np.testing.assert_array_equal(windows[0], rows[-SEQUENCE_LENGTH:])
+
+
+def test_window_store_refetched_candle_replaces_the_newest_row():
+    rng = np.random.default_rng(3)
+    store = WindowStore(["AUSDT"])
+    rows = rng.uniform(0, 100, size=(SEQUENCE_LENGTH * 2, NUM_FEATURES))
+    for timestamp, row in enumerate(rows):
+        store.append("AUSDT", timestamp, row)
+        # The still-open candle is refetched with new values, an older one is ignored
+        rows[timestamp] = rng.uniform(-50, 150, size=NUM_FEATURES)
+        store.append("AUSDT", timestamp, rows[timestamp])
+        store.append("AUSDT", timestamp - 1, rng.uniform(size=NUM_FEATURES))
+
+        window = rows[max(0, timestamp + 1 - SEQUENCE_LENGTH):timestamp + 1]
+        np.testing.assert_array_equal(store.window("AUSDT")[-len(window):], window)
+        mins, maxs = store.bounds[0].bounds()
+        np.testing.assert_array_equal(mins, window.min(axis=0))
+        np.testing.assert_array_equal(maxs, window.max(axis=0))
@@ -0,0 +1,77 @@
+import os
+import argparse
+import multiprocessing
+from collections import Counter
+import pytest
+from alert_dispatcher import AlertDispatcher
+from fake_binance import FakeBinance
+from sharded_scan import Coordinator, HashRing, worker_process
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SYMBOLS = [f"SYM{i}USDT" for i in range(12)]
+AUTHKEY = b"test-authkey"
+
+
+class RecordingCoordinator(Coordinator):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.results = {}
+
+    def finalize(self, candle_close):
+        assert candle_close not in self.results, "candle finalized twice"
+        results = super().finalize(candle_close)
+        self.results[candle_close] = list(results["symbol"])
+        return results
+
+
+def cycle_message(worker, candle_close, symbols):
+    return {"type": "cycle", "worker": worker, "candle_close": candle_close, "skipped": 0,
+            "results": {"symbol": symbols, "cosine_sim": [0.5] * len(symbols), "mse": [0.1] * len(symbols)},
+            "stats": {"fetched": len(symbols), "failed": 0, "scored": len(symbols), "batches": 1}}
+
+
+def test_coordinator_needs_an_authkey():
+    with pytest.raises(ValueError):
+        Coordinator(("127.0.0.1", 0), ["w0"], AlertDispatcher(None), None)
+
+
+def test_late_reports_for_a_finalized_candle_are_dropped():
+    coordinator = RecordingCoordinator(("127.0.0.1", 0), ["w0", "w1"], AlertDispatcher(None), AUTHKEY, collect_timeout=0)
+    coordinator.handle(cycle_message("w0", 1000, ["AUSDT"]))
+    # w1 never reported, the straggler timeout finalizes the candle with w0's shard only
+    coordinator.run(cycles=1)
+    coordinator.handle(cycle_message("w1", 1000, ["BUSDT"]))
+    assert coordinator.results == {1000: ["AUSDT"]}
+    assert not coordinator.pending
+    assert coordinator.finalized == 1
+
+
+def test_local_workers_score_every_symbol_once_per_candle(tmp_path):
+    folder = tmp_path / "concurrent_data"
+    folder.mkdir()
+    for symbol in SYMBOLS:
+        (folder / f"{symbol}_concurrent_data.csv").touch()
+    workers = ["w0", "w1", "w2"]
+    assert all(HashRing(workers).assign(SYMBOLS).values()), "every worker should own part of the universe"
+
+    with FakeBinance() as server:
+        # A day long interval puts every worker on the same latest candle
+        args = argparse.Namespace(folder=str(folder), model=os.path.join(PROJECT_ROOT, 'autoencoder_model.h5'), backend='numpy',
+                                  checkpoint_pointer=None, resident='float32', snapshot_dir=None, concurrency=10, micro_batch=4, interval=86400,
+                                  grace=0.0, cycles=1, fapi_url=server.base_url, futures_data_url=server.base_url, authkey=AUTHKEY)
+        coordinator = RecordingCoordinator(("127.0.0.1", 0), workers, AlertDispatcher(None), AUTHKEY, collect_timeout=120).start()
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=worker_process, args=(worker, workers, coordinator.address, args)) for worker in workers]
+        for process in processes:
+            process.start()
+        try:
+            coordinator.run(cycles=1)
+        finally:
+            for process in processes:
+                process.join(timeout=60)
+            coordinator.close()
+
+    assert all(process.exitcode == 0 for process in processes)
+    assert len(coordinator.results) == 1
+    for symbols in coordinator.results.values():
+        assert Counter(symbols) == Counter(SYMBOLS)
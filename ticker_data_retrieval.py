@@ -1,119 +1,356 @@
 import requests
 import json
 import zipfile
-import io
-import csv
+import os
+import hashlib
+import argparse
+import threading
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
-import os
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from history_store import HistoryStore
+
+# Run this to download the historical data to build training data off, e.g.
+# python3 ticker_data_retrieval.py --symbols AGIXUSDT WOOUSDT --ranges 2022-09-01:2023-09-01
+# With --store history each merged day is also added to the columnar history store, days it already holds are not downloaded again
 
-# Run this with asked for input to generate the historical data to build training data off
+LISTING_URL = 'https://www.binance.com/bapi/bigdata/v1/public/bigdata/finance/exchange/listDownloadData2'
+CACHE_DIR = 'download_cache'
+CANDLE_INTERVAL_MS = 5 * 60 * 1000
+SLOTS_PER_DAY = 24 * 60 * 60 * 1000 // CANDLE_INTERVAL_MS
 
-# Function to download and merge data
-def download_and_merge_data(url, payload):
-    response = requests.post(url, json=payload)
+METRICS_COLUMNS = ["create_time", "symbol", "sum_open_interest", "sum_open_interest_value", "count_toptrader_long_short_ratio",
+                   "sum_toptrader_long_short_ratio", "count_long_short_ratio", "sum_taker_long_short_vol_ratio"]
+KLINES_COLUMNS = ["open_time", "open", "high", "low", "close", "volume", "close_time", "quote_volume", "count",
+                  "taker_buy_volume", "taker_buy_quote_volume", "dummy"]
+OUTPUT_COLUMNS = ["create_time", "symbol", "sum_open_interest", "sum_open_interest_value", "open", "high", "low", "close",
+                  "volume", "quote_volume", "count", "taker_buy_volume", "taker_buy_quote_volume", "volume_delta"]
+
+METRICS_DTYPES = {"create_time": str, "symbol": str, "sum_open_interest": "float64", "sum_open_interest_value": "float64",
+                  "count_toptrader_long_short_ratio": "float64", "sum_toptrader_long_short_ratio": "float64",
+                  "count_long_short_ratio": "float64", "sum_taker_long_short_vol_ratio": "float64"}
+KLINES_DTYPES = {"open_time": "int64", "open": "float64", "high": "float64", "low": "float64", "close": "float64",
+                 "volume": "float64", "close_time": "int64", "quote_volume": "float64", "count": "int64",
+                 "taker_buy_volume": "float64", "taker_buy_quote_volume": "float64", "dummy": "float64"}
+
+PRODUCTS = {
+    "metrics": {"granularity": [], "columns": METRICS_COLUMNS, "dtypes": METRICS_DTYPES},
+    "klines": {"granularity": ["5m"], "columns": KLINES_COLUMNS, "dtypes": KLINES_DTYPES},
+}
 
-    if response.status_code == 200:
-        data = response.json()
-        download_items = data.get('data', {}).get('downloadItemList', [])
-        merged_data = []
 
-        for item in tqdm(download_items, desc='Downloading data'):
-            download_url = item.get('url')
-            day = item.get('day')
-            filename = f'{symbol}-{day}.zip'  # Modified filename to include symbol
+# Function to create a pooled session that retries transient failures
+def make_session(pool_size=16):
+    session = requests.Session()
+    retry = Retry(total=5, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=None, respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
-            zip_response = requests.get(download_url)
 
-            if zip_response.status_code == 200:
-                with zipfile.ZipFile(io.BytesIO(zip_response.content)) as zip_file:
-                    for file_info in zip_file.infolist():
-                        with zip_file.open(file_info) as csv_file:
-                            # Read CSV data and append to merged_data
-                            csv_reader = csv.reader(io.TextIOWrapper(csv_file, 'utf-8'))
-                            for i, row in enumerate(csv_reader):
-                                if i > 0:  # Skip the header row
-                                    merged_data.append(row)
+# Function to build the listing request for one product, symbol and date range
+def build_payload(product, symbol, start_date, end_date):
+    return {
+        "bizType": "FUTURES_UM",
+        "productName": product,
+        "symbolRequestItems": [{
+            "endDay": end_date,
+            "granularityList": PRODUCTS[product]["granularity"],
+            "interval": "daily",
+            "startDay": start_date,
+            "symbol": symbol
+        }]
+    }
 
-            else:
-                print(f"Failed to download zip file for {day}")
 
-        return merged_data
+# Function to list the daily archives available for a product, symbol and date range
+def list_download_items(session, listing_url, product, symbol, start_date, end_date):
+    response = session.post(listing_url, json=build_payload(product, symbol, start_date, end_date))
 
-    else:
-        print(f"Failed to fetch data. Status code: {response.status_code}")
+    if response.status_code != 200:
+        print(f"Failed to fetch {product} listing for {symbol}. Status code: {response.status_code}")
         return None
 
-# Get user input for ticker, start date, and end date
-symbol = input("Enter the ticker symbol (e.g., BTCUSDT): ")
-start_date = input("Enter the start date (YYYY-MM-DD): ")
-end_date = input("Enter the end date (YYYY-MM-DD): ")
-
-# Define the endpoints using user input
-url = 'https://www.binance.com/bapi/bigdata/v1/public/bigdata/finance/exchange/listDownloadData2'
-payload_metrics = {
-    "bizType": "FUTURES_UM",
-    "productName": "metrics",
-    "symbolRequestItems": [{
-        "endDay": end_date,
-        "granularityList": [],
-        "interval": "daily",
-        "startDay": start_date,
-        "symbol": symbol
-    }]
-}
-payload_klines = {
-    "bizType": "FUTURES_UM",
-    "productName": "klines",
-    "symbolRequestItems": [{
-        "endDay": end_date,
-        "granularityList": ["5m"],
-        "interval": "daily",
-        "startDay": start_date,
-        "symbol": symbol
-    }]
-}
+    items = response.json().get('data', {}).get('downloadItemList', []) or []
+    return sorted(({"url": item.get('url'), "day": item.get('day')} for item in items), key=lambda item: item["day"])
+
+
+class DownloadCache:
+    """
+    Content-addressed store of downloaded daily archives.
+
+    Archives live under objects/<sha256>.zip and index.json maps product/symbol/day to the digest,
+    so overlapping ranges and reruns find a day without downloading it again.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.partial_dir = os.path.join(cache_dir, 'partial')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.partial_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+
+    @staticmethod
+    def key(product, symbol, day):
+        return f"{product}/{symbol}/{day}"
+
+    def get(self, product, symbol, day):
+        digest = self.index.get(self.key(product, symbol, day))
+        if digest is None:
+            return None
+        path = os.path.join(self.objects_dir, f"{digest}.zip")
+        return path if os.path.exists(path) else None
+
+    def partial_path(self, product, symbol, day):
+        return os.path.join(self.partial_dir, f"{product}-{symbol}-{day}.zip.part")
+
+    def commit(self, product, symbol, day, partial_path):
+        # Move a finished download into the store under its digest
+        digest = hashlib.sha256()
+        with open(partial_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+        path = os.path.join(self.objects_dir, f"{digest}.zip")
+        os.replace(partial_path, path)
+
+        with self.lock:
+            self.index[self.key(product, symbol, day)] = digest
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.index, f)
+            os.replace(tmp_path, self.index_path)
+        return path
+
+
+# Function to download one daily archive into the cache, resuming a partial download if one exists
+def download_day(session, cache, product, symbol, item):
+    path = cache.get(product, symbol, item["day"])
+    if path is not None:
+        return path
+
+    partial_path = cache.partial_path(product, symbol, item["day"])
+    offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+    with session.get(item["url"], headers=headers, stream=True, timeout=60) as response:
+        if response.status_code == 416:
+            # The partial file already holds the whole archive
+            return cache.commit(product, symbol, item["day"], partial_path)
+        if response.status_code not in (200, 206):
+            print(f"Failed to download {product} zip file for {symbol} on {item['day']}")
+            return None
+        mode = 'ab' if response.status_code == 206 else 'wb'
+        with open(partial_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=1 << 16):
+                f.write(chunk)
+
+    return cache.commit(product, symbol, item["day"], partial_path)
 
-# Download and merge metrics data
-print("Downloading and merging metrics data...")
-merged_metrics_data = download_and_merge_data(url, payload_metrics)
 
-# Download and merge klines data
-print("Downloading and merging klines data...")
-merged_klines_data = download_and_merge_data(url, payload_klines)
+# Function to decode a daily archive straight into typed columns
+def read_daily_csv(zip_path, product):
+    columns = PRODUCTS[product]["columns"]
+    dtypes = PRODUCTS[product]["dtypes"]
+    frames = []
+    with zipfile.ZipFile(zip_path) as zip_file:
+        for file_info in zip_file.infolist():
+            with zip_file.open(file_info) as csv_file:
+                # Newer archives carry a header row, older klines archives do not
+                has_header = csv_file.peek(1)[:1].isalpha()
+                frames.append(pd.read_csv(csv_file, header=0 if has_header else None, names=columns, dtype=dtypes))
+    if not frames:
+        return pd.DataFrame({col: pd.Series(dtype=dtypes[col]) for col in columns})
+    return pd.concat(frames, ignore_index=True)
+
+
+def download_days(session, cache, product, symbol, items, workers=8):
+    """
+    Download every listed day concurrently into the cache.
+
+    Returns:
+    dict: Cached archive path per day, days that failed to download are left out
+    """
+    paths = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(download_day, session, cache, product, symbol, item): item["day"] for item in items}
+        for future in tqdm(as_completed(futures), total=len(futures), desc=f'Downloading {symbol} {product}'):
+            day = futures[future]
+            try:
+                path = future.result()
+            except requests.exceptions.RequestException as e:
+                print(f"Failed to download {product} zip file for {symbol} on {day}: {e}")
+                continue
+            if path is not None:
+                paths[day] = path
+
+    return paths
+
+
+# Function to get a daily frame's 5m timestamps in epoch milliseconds
+def stream_timestamps(df, product):
+    if product == "metrics":
+        return pd.to_datetime(df["create_time"], format="%Y-%m-%d %H:%M:%S").to_numpy(dtype="datetime64[ms]").astype(np.int64)
+    timestamps = df["open_time"].to_numpy(dtype=np.int64)
+    # Newer kline archives use microsecond timestamps
+    return np.where(timestamps > 10 ** 14, timestamps // 1000, timestamps)
+
+
+# Function to sort one day of a stream by timestamp and drop repeated candles
+def sort_unique(df, product):
+    timestamps = stream_timestamps(df, product)
+    order = np.argsort(timestamps, kind="stable")
+    timestamps = timestamps[order]
+    keep = np.ones(len(timestamps), dtype=bool)
+    keep[1:] = timestamps[1:] != timestamps[:-1]
+    return df.iloc[order[keep]].reset_index(drop=True), timestamps[keep], int((~keep).sum())
+
+
+def merge_day(day, metrics, klines):
+    """
+    Align one day of metrics and klines on their 5m timestamps with a sort-merge join.
+
+    Returns:
+    tuple: (merged DataFrame with OUTPUT_COLUMNS, report dict of gaps and duplicates)
+    """
+    metrics, metrics_timestamps, metrics_duplicates = sort_unique(metrics, "metrics")
+    klines, klines_timestamps, klines_duplicates = sort_unique(klines, "klines")
+
+    _, metrics_rows, klines_rows = np.intersect1d(metrics_timestamps, klines_timestamps, assume_unique=True, return_indices=True)
+
+    day_start = int(np.datetime64(day, 'ms').astype(np.int64))
+    expected = day_start + np.arange(SLOTS_PER_DAY, dtype=np.int64) * CANDLE_INTERVAL_MS
+    report = {
+        "metrics_gaps": int(np.setdiff1d(expected, metrics_timestamps, assume_unique=True).size),
+        "klines_gaps": int(np.setdiff1d(expected, klines_timestamps, assume_unique=True).size),
+        "metrics_duplicates": metrics_duplicates,
+        "klines_duplicates": klines_duplicates,
+        "unmatched": len(metrics_timestamps) + len(klines_timestamps) - 2 * len(metrics_rows),
+    }
+
+    df = pd.concat([metrics.iloc[metrics_rows].reset_index(drop=True),
+                    klines.iloc[klines_rows].drop(columns=["open_time"]).reset_index(drop=True)], axis=1)
+
+    # Calculate volume delta for each row
+    df['volume_delta'] = df['taker_buy_volume'] - (df['volume'] - df['taker_buy_volume'])
+    return df[OUTPUT_COLUMNS], report
+
+
+def retrieve_symbol(session, cache, symbol, start_date, end_date, listing_url=LISTING_URL, output_root='.', workers=8,
+                    store=None, write_csv=True):
+    """
+    Download, merge and save one symbol's metrics and 5m klines for a date range.
+
+    Days are merged one at a time and appended to the output, so memory stays flat
+    however long the range is. With a HistoryStore, days it already holds are read back from it
+    instead of being downloaded, and every newly merged day is added to it as a partition.
+
+    Returns:
+    str: Path of the merged <SYMBOL>_<start>_<end>.csv (the store folder without write_csv), or None if nothing could be downloaded
+    """
+    paths = {}
+    listed = set()
+    for product in PRODUCTS:
+        items = list_download_items(session, listing_url, product, symbol, start_date, end_date)
+        if not items:
+            print(f"No {product} data listed for {symbol} between {start_date} and {end_date}.")
+            return None
+        listed.update(item["day"] for item in items)
+        if store is not None:
+            items = [item for item in items if not store.has_day(symbol, item["day"])]
+        paths[product] = download_days(session, cache, product, symbol, items, workers)
+
+    metrics_paths = paths["metrics"]
+    klines_paths = paths["klines"]
+    stored_days = set(store.days(symbol, start_date, end_date)) if store is not None else set()
+    days = sorted(set(metrics_paths) | set(klines_paths) | (stored_days & listed))
+    if not days:
+        return None
+
+    output_filepath = None
+    if write_csv:
+        # Create a directory for the symbol if it doesn't exist
+        output_directory = os.path.join(output_root, symbol)
+        os.makedirs(output_directory, exist_ok=True)
+        output_filepath = os.path.join(output_directory, f'{symbol}_{start_date}_{end_date}.csv')
 
-# Merge data based on timestamps (assuming timestamps are the first column)
-print("Merging data...")
-merged_data = []
-for metrics_row, klines_row in tqdm(zip(merged_metrics_data, merged_klines_data), desc='Merging data'):
-    merged_row = metrics_row + klines_row[1:]  # Exclude the duplicate timestamp
-    merged_data.append(merged_row)
+    totals = {}
+    rows = 0
+    appended = 0
+    output_file = open(output_filepath, 'w', newline='') if write_csv else None
+    try:
+        if output_file is not None:
+            pd.DataFrame(columns=OUTPUT_COLUMNS).to_csv(output_file, index=False)
+        for day in tqdm(days, desc=f'Merging {symbol}'):
+            if day in stored_days:
+                # Already merged on an earlier run
+                if output_file is not None:
+                    df = store.read(symbol, day, day)
+                    df.to_csv(output_file, index=False, header=False)
+                    rows += len(df)
+                continue
 
-# Create a DataFrame from merged_data
-columns = ["create_time", "symbol", "sum_open_interest", "sum_open_interest_value", "count_toptrader_long_short_ratio",
-           "sum_toptrader_long_short_ratio", "count_long_short_ratio", "sum_taker_long_short_vol_ratio", "open", "high",
-           "low", "close", "volume", "close_time", "quote_volume", "count", "taker_buy_volume", "taker_buy_quote_volume", "dummy"]
+            if day not in metrics_paths or day not in klines_paths:
+                missing = "metrics" if day not in metrics_paths else "klines"
+                print(f"{symbol} {day}: no {missing} archive, skipping the day.")
+                totals[f"{missing}_missing_days"] = totals.get(f"{missing}_missing_days", 0) + 1
+                continue
 
-df = pd.DataFrame(merged_data, columns=columns)
+            df, report = merge_day(day, read_daily_csv(metrics_paths[day], "metrics"), read_daily_csv(klines_paths[day], "klines"))
+            if any(report.values()):
+                print(f"{symbol} {day}: " + ", ".join(f"{key}={value}" for key, value in report.items() if value))
+            for key, value in report.items():
+                totals[key] = totals.get(key, 0) + value
 
-# Drop specified columns
-columns_to_drop = ["count_toptrader_long_short_ratio", "sum_toptrader_long_short_ratio",
-                   "count_long_short_ratio", "sum_taker_long_short_vol_ratio", "dummy", "close_time"]
+            if store is not None and len(df):
+                appended += store.append_day(symbol, day, df)
+            # Append the day's typed rows to the output
+            if output_file is not None:
+                df.to_csv(output_file, index=False, header=False)
+            rows += len(df)
+    finally:
+        if output_file is not None:
+            output_file.close()
 
-df.drop(columns=columns_to_drop, inplace=True)
+    summary = "".join(f", {key}={value}" for key, value in totals.items() if value)
+    if store is not None:
+        print(f"{appended} new day(s) added to {os.path.join(store.root, symbol)}, {len(stored_days & listed)} already stored{summary}.")
+    if output_filepath is None:
+        return os.path.join(store.root, symbol)
+    print(f"Data saved to {output_filepath} ({rows} rows{summary}).")
+    return output_filepath
 
-# Calculate volume delta for each row
-df['taker_buy_volume'] = df['taker_buy_volume'].astype(float)
-df['volume'] = df['volume'].astype(float)
-df['volume_delta'] = df['taker_buy_volume'] - (df['volume'] - df['taker_buy_volume'])
 
-# Create a directory for the symbol if it doesn't exist
-output_directory = symbol
-if not os.path.exists(output_directory):
-    os.makedirs(output_directory)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk download Binance futures metrics and 5m klines into merged CSVs.")
+    parser.add_argument("-s", "--symbols", nargs='+', required=True, help="Ticker symbols, e.g. BTCUSDT ETHUSDT")
+    parser.add_argument("-r", "--ranges", nargs='+', required=True, help="Date ranges as START:END in YYYY-MM-DD, e.g. 2022-09-01:2023-09-01")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="Daily archives downloaded in parallel")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Content-addressed cache of downloaded archives")
+    parser.add_argument("--listing-url", default=LISTING_URL, help="Endpoint listing the daily archives")
+    parser.add_argument("-o", "--output-root", default='.', help="Folder the <SYMBOL>/ output folders are created in")
+    parser.add_argument("--store", default=None, help="Also add every merged day to this columnar history store, e.g. history")
+    parser.add_argument("--no-csv", action='store_true', help="Only write to the history store, not the merged CSV")
+    args = parser.parse_args()
+    if args.no_csv and not args.store:
+        parser.error("--no-csv needs --store")
 
-# Write the DataFrame to a CSV file within the symbol-specific directory
-output_filepath = os.path.join(output_directory, f'{symbol}_{start_date}_{end_date}.csv')
-df.to_csv(output_filepath, index=False)
+    session = make_session(args.workers)
+    cache = DownloadCache(args.cache_dir)
+    store = HistoryStore(args.store) if args.store else None
 
-print(f"Data saved to {output_filepath}.")
+    for symbol in args.symbols:
+        for date_range in args.ranges:
+            start_date, end_date = date_range.split(':')
+            retrieve_symbol(session, cache, symbol, start_date, end_date, args.listing_url, args.output_root, args.workers,
+                            store, not args.no_csv)
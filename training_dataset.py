@@ -0,0 +1,163 @@
+import os
+import re
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+# Packed training dataset, one contiguous float32 (windows, 25, 12) .npy shard per training folder plus a
+# small CSV index, so the whole corpus can be memory-mapped instead of parsing thousands of tiny CSVs
+
+SEQUENCE_LENGTH = 25
+NUM_FEATURES = 12
+INDEX_COLUMNS = ["symbol", "window_start", "surge_threshold", "surge_horizon", "source"]
+
+# Surge definition of folders without a suffix, matches generate_training_data.py's defaults
+DEFAULT_SURGE_THRESHOLD = 0.05
+DEFAULT_SURGE_HORIZON = 6
+
+
+# Function to get the shard and index paths that sit next to a training folder
+def shard_paths(folder):
+    folder = os.path.normpath(folder)
+    return f"{folder}.npy", f"{folder}_index.csv"
+
+
+# Function to read the surge definition back out of a training folder name
+def parse_training_folder(folder):
+    name = os.path.basename(os.path.normpath(folder))
+    match = re.match(r"^(.+?)_training_data(?:_([0-9.]+)pct_([0-9]+))?$", name)
+    if match is None:
+        return None
+    symbol, percent, horizon = match.groups()
+    if percent is None:
+        return symbol, DEFAULT_SURGE_THRESHOLD, DEFAULT_SURGE_HORIZON
+    return symbol, float(percent) / 100, int(horizon)
+
+
+def write_shard(folder, windows, index):
+    """
+    Write a shard and its index for one training folder.
+
+    Parameters:
+    folder (str): Training folder the shard describes, e.g. AGIXUSDT/AGIXUSDT_training_data
+    windows (ndarray): Windows with shape (N, 25, 12)
+    index (DataFrame): One row per window with INDEX_COLUMNS
+    """
+    shard_path, index_path = shard_paths(folder)
+    windows = np.ascontiguousarray(windows, dtype=np.float32).reshape(-1, SEQUENCE_LENGTH, NUM_FEATURES)
+    np.save(shard_path, windows)
+    index[INDEX_COLUMNS].to_csv(index_path, index=False)
+    return shard_path
+
+
+# Function to sort window CSVs by their trailing count instead of lexically
+def _window_number(file_name):
+    match = re.search(r"_(\d+)_training_data\.csv$", file_name)
+    return int(match.group(1)) if match else -1
+
+
+def convert_csv_folder(folder):
+    """
+    Pack an existing folder of 25-row window CSVs into a shard.
+
+    The CSVs carry no timestamps, so window_start is left empty for converted windows.
+    """
+    parsed = parse_training_folder(folder)
+    if parsed is None:
+        print(f"{folder} is not a training data folder. Skipping.")
+        return None
+    symbol, threshold, horizon = parsed
+
+    csv_files = sorted((f for f in os.listdir(folder) if f.endswith('.csv')), key=_window_number)
+    windows = np.empty((len(csv_files), SEQUENCE_LENGTH, NUM_FEATURES), dtype=np.float32)
+    for i, csv_file in enumerate(csv_files):
+        windows[i] = np.loadtxt(os.path.join(folder, csv_file), delimiter=',', skiprows=1, dtype=np.float32)[:SEQUENCE_LENGTH]
+
+    index = pd.DataFrame({"symbol": symbol, "window_start": "", "surge_threshold": threshold,
+                          "surge_horizon": horizon, "source": csv_files}, columns=INDEX_COLUMNS)
+    return write_shard(folder, windows, index)
+
+
+# Function to convert every training folder found under root, existing shards are kept unless overwrite is set
+def convert_all(root, overwrite=False):
+    shards = []
+    for dirpath, dirnames, files in os.walk(root):
+        for dirname in dirnames:
+            folder = os.path.join(dirpath, dirname)
+            if parse_training_folder(folder) is not None:
+                if not overwrite and os.path.exists(shard_paths(folder)[0]):
+                    print(f"{folder} is already packed. Skipping.")
+                    continue
+                shard_path = convert_csv_folder(folder)
+                if shard_path:
+                    print(f"Packed {folder} into {shard_path}.")
+                    shards.append(shard_path)
+    return shards
+
+
+# Function to find every shard under root
+def find_shards(root):
+    shards = []
+    for dirpath, dirnames, files in os.walk(root):
+        for file_name in files:
+            if file_name.endswith('.npy') and parse_training_folder(file_name[:-4]) is not None:
+                shards.append(os.path.join(dirpath, file_name))
+    return sorted(shards)
+
+
+def load_shard(shard_path, mmap=True):
+    """
+    Load a shard and its index.
+
+    Parameters:
+    shard_path (str): Path to a <folder>.npy shard
+    mmap (bool): Memory-map the shard read-only instead of reading it into memory
+
+    Returns:
+    tuple: (windows with shape (N, 25, 12), index DataFrame)
+    """
+    windows = np.load(shard_path, mmap_mode='r' if mmap else None)
+    index = pd.read_csv(f"{shard_path[:-4]}_index.csv", keep_default_na=False)
+    return windows, index
+
+
+def load_corpus(root, mmap=True):
+    """
+    Load every shard under root without copying.
+
+    Returns:
+    tuple: (list of shard arrays, index DataFrame with shard and row columns pointing into the list)
+    """
+    shards = []
+    indexes = []
+    for i, shard_path in enumerate(find_shards(root)):
+        windows, index = load_shard(shard_path, mmap)
+        index["shard"] = i
+        index["row"] = np.arange(len(index))
+        shards.append(windows)
+        indexes.append(index)
+
+    if not indexes:
+        return shards, pd.DataFrame(columns=INDEX_COLUMNS + ["shard", "row"])
+    return shards, pd.concat(indexes, ignore_index=True)
+
+
+# Function to copy the whole corpus into one contiguous array when a single block is needed
+def corpus_array(shards):
+    if not shards:
+        return np.empty((0, SEQUENCE_LENGTH, NUM_FEATURES), dtype=np.float32)
+    return np.concatenate(shards, axis=0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack the <SYMBOL>_training_data CSV folders into .npy shards.")
+    parser.add_argument("-r", "--root", default=os.getcwd(), help="Folder to search for training data folders")
+    parser.add_argument("--overwrite", action="store_true", help="Repack folders that already have a shard")
+    args = parser.parse_args()
+
+    convert_all(args.root, args.overwrite)
+
+    start = time.perf_counter()
+    shards, index = load_corpus(args.root)
+    print(f"Loaded {len(index)} windows from {len(shards)} shards in {(time.perf_counter() - start) * 1000:.1f} ms.")
@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import asyncio
+
+# Symbol universe for the scanner, USDT perpetuals from the futures exchange info that actually publish
+# openInterestHist. Exchange info and per-symbol probe results are cached on disk with a TTL so a refresh
+# only probes symbols that are new or whose last probe has expired
+
+CACHE_PATH = 'universe_cache.json'
+EXCHANGE_INFO_TTL = 60 * 60
+PROBE_TTL = 24 * 60 * 60
+# Fresh listings take a while to get open interest history, so symbols without any are re-probed sooner
+EMPTY_PROBE_TTL = 60 * 60
+CONCURRENT_DATA_DIR = 'concurrent_data'
+
+
+# Function to check if a symbol contains certain words
+def contains_invalid_words(symbol):
+    invalid_words = ['BULL', 'BEAR', 'UP', 'DOWN']
+    for word in invalid_words:
+        if word in symbol:
+            return True
+    return False
+
+
+# Function to pick the tradable USDT perpetuals out of an exchange info payload
+def usdt_perpetuals(exchange_info):
+    return sorted(item['symbol'] for item in exchange_info.get('symbols', [])
+                  if item.get('quoteAsset') == 'USDT'
+                  and item.get('contractType', 'PERPETUAL') == 'PERPETUAL'
+                  and item.get('status', 'TRADING') == 'TRADING'
+                  and not contains_invalid_words(item['symbol']))
+
+
+# Function to list the symbols that already have a tracking file
+def concurrent_data_symbols(folder=CONCURRENT_DATA_DIR):
+    if not os.path.isdir(folder):
+        return []
+    return sorted(csv_file.split('_')[0] for csv_file in os.listdir(folder) if csv_file.endswith('.csv'))
+
+
+# Function to create and remove tracking files so the folder matches the universe
+def sync_concurrent_data(added, removed, folder=CONCURRENT_DATA_DIR):
+    os.makedirs(folder, exist_ok=True)
+    for symbol in added:
+        file_path = os.path.join(folder, f"{symbol}_concurrent_data.csv")
+        if not os.path.exists(file_path):
+            with open(file_path, "w", newline=""):
+                # Do not write any headers
+                pass
+    for symbol in removed:
+        file_path = os.path.join(folder, f"{symbol}_concurrent_data.csv")
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+class UniverseManager:
+    """
+    Track the scannable symbol universe and report listings and delistings between refreshes.
+
+    Parameters:
+    fetcher (BinanceFetcher): Open fetcher whose pooled session is used for every request
+    symbols (list): Universe currently being scanned, defaults to the cached one
+    cache_path (str): JSON cache of exchange info and probe results
+    exchange_info_ttl (float): Seconds before exchange info is fetched again
+    probe_ttl (float): Seconds before a symbol with data is probed again
+    empty_probe_ttl (float): Seconds before a symbol without data is probed again
+    clock (callable): Time source, replaceable in tests
+    """
+
+    def __init__(self, fetcher, symbols=None, cache_path=CACHE_PATH, exchange_info_ttl=EXCHANGE_INFO_TTL, probe_ttl=PROBE_TTL,
+                 empty_probe_ttl=EMPTY_PROBE_TTL, clock=time.time):
+        self.fetcher = fetcher
+        self.cache_path = cache_path
+        self.exchange_info_ttl = exchange_info_ttl
+        self.probe_ttl = probe_ttl
+        self.empty_probe_ttl = empty_probe_ttl
+        self.clock = clock
+        self.cache = {"exchange_info": None, "probes": {}, "symbols": []}
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path) as f:
+                    self.cache.update(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable universe cache {cache_path}: {str(e)}")
+        self.symbols = sorted(symbols) if symbols is not None else list(self.cache["symbols"])
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        temporary_path = self.cache_path + ".tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump(self.cache, f)
+        os.replace(temporary_path, self.cache_path)
+
+    async def _listed_symbols(self, force):
+        now = self.clock()
+        cached = self.cache["exchange_info"]
+        if not force and cached and now - cached["fetched_at"] < self.exchange_info_ttl:
+            return cached["symbols"]
+
+        exchange_info = await self.fetcher.fetch_exchange_info()
+        if exchange_info is None:
+            # Keep scanning the last known listing rather than dropping everything on one failed request
+            return cached["symbols"] if cached else None
+        symbols = usdt_perpetuals(exchange_info)
+        self.cache["exchange_info"] = {"fetched_at": now, "symbols": symbols}
+        return symbols
+
+    def _probe_expired(self, symbol, now):
+        probe = self.cache["probes"].get(symbol)
+        if probe is None:
+            return True
+        ttl = self.probe_ttl if probe["has_data"] else self.empty_probe_ttl
+        return now - probe["checked_at"] >= ttl
+
+    async def _probe(self, symbol):
+        return symbol, await self.fetcher.fetch_open_interest_data(symbol, 1)
+
+    async def refresh(self, force=False):
+        """
+        Re-read the listing and probe only new or expired symbols, all concurrently.
+
+        Parameters:
+        force (bool): Ignore the TTLs and refetch everything
+
+        Returns:
+        tuple: (symbols, added, removed) against the universe before this refresh
+        """
+        listed = await self._listed_symbols(force)
+        if listed is None:
+            return self.symbols, [], []
+
+        now = self.clock()
+        pending = [symbol for symbol in listed if force or self._probe_expired(symbol, now)]
+        if pending:
+            print(f"Probing open interest history for {len(pending)} symbol(s)..")
+        for symbol, data in await asyncio.gather(*(self._probe(symbol) for symbol in pending)):
+            # A failed request says nothing about the symbol, keep its previous probe
+            if data is not None:
+                self.cache["probes"][symbol] = {"has_data": len(data) > 0, "checked_at": now}
+
+        listed_set = set(listed)
+        for symbol in list(self.cache["probes"]):
+            if symbol not in listed_set:
+                del self.cache["probes"][symbol]
+
+        symbols = [symbol for symbol in listed if self.cache["probes"].get(symbol, {}).get("has_data")]
+        previous = set(self.symbols)
+        current = set(symbols)
+        added = [symbol for symbol in symbols if symbol not in previous]
+        removed = [symbol for symbol in self.symbols if symbol not in current]
+
+        self.symbols = symbols
+        self.cache["symbols"] = symbols
+        self._save()
+        return symbols, added, removed
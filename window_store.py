@@ -0,0 +1,215 @@
+import os
+import json
+import numpy as np
+from rolling_normalizer import RollingMinMax, scale_window
+
+# In-memory ring buffer holding the latest 25 candles for every symbol, optionally backed by memory-mapped files
+# so a restarted scanner can resume without refetching the full window for each symbol
+
+SEQUENCE_LENGTH = 25
+NUM_FEATURES = 12
+CANDLE_INTERVAL_MS = 5 * 60 * 1000
+
+
+class WindowStore:
+    """
+    Preallocated (symbols, 25, 12) block of candles keyed by symbol and candle timestamp.
+
+    Each symbol owns one row of the block which is written as a ring, so appending the
+    incremental candle is O(1) and never shifts the rest of the window. A RollingMinMax per
+    symbol tracks the window's per-feature bounds for normalization.
+    """
+
+    def __init__(self, symbols, sequence_length=SEQUENCE_LENGTH, num_features=NUM_FEATURES, dtype=np.float64, snapshot_dir=None):
+        self.symbols = list(symbols)
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.sequence_length = sequence_length
+        self.num_features = num_features
+        self.snapshot_dir = snapshot_dir
+        self.bounds = [RollingMinMax(sequence_length, num_features) for _ in self.symbols]
+        self._allocate(dtype)
+
+    def _allocate(self, dtype):
+        shape = (len(self.symbols), self.sequence_length)
+        if self.snapshot_dir is None:
+            self.data = np.zeros(shape + (self.num_features,), dtype=dtype)
+            self.timestamps = np.zeros(shape, dtype=np.int64)
+            self.head = np.zeros(len(self.symbols), dtype=np.int64)
+            self.count = np.zeros(len(self.symbols), dtype=np.int64)
+        else:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            self.data = self._open_memmap('data.npy', shape + (self.num_features,), dtype)
+            self.timestamps = self._open_memmap('timestamps.npy', shape, np.int64)
+            self.head = self._open_memmap('head.npy', (len(self.symbols),), np.int64)
+            self.count = self._open_memmap('count.npy', (len(self.symbols),), np.int64)
+            with open(os.path.join(self.snapshot_dir, 'symbols.json'), 'w') as f:
+                json.dump(self.symbols, f)
+
+    def _open_memmap(self, name, shape, dtype):
+        array = np.lib.format.open_memmap(os.path.join(self.snapshot_dir, name), mode='w+', dtype=dtype, shape=shape)
+        array[...] = 0
+        return array
+
+    @classmethod
+    def load(cls, snapshot_dir, symbols, sequence_length=SEQUENCE_LENGTH, num_features=NUM_FEATURES, dtype=np.float64):
+        """
+        Resume from a previous snapshot, keeping the windows of symbols that are still listed.
+
+        Parameters:
+        snapshot_dir (str): Directory written by a previous store
+        symbols (list): Symbols to track from now on
+
+        Returns:
+        WindowStore: Store backed by snapshot_dir
+        """
+        previous = None
+        symbols_path = os.path.join(snapshot_dir, 'symbols.json')
+        if os.path.exists(symbols_path):
+            try:
+                with open(symbols_path) as f:
+                    previous_symbols = json.load(f)
+                # Read fully into memory as the files are rewritten below
+                previous = {name: np.load(os.path.join(snapshot_dir, f'{name}.npy'))
+                            for name in ('data', 'timestamps', 'head', 'count')}
+                if previous['data'].shape[1:] != (sequence_length, num_features):
+                    previous = None
+            except (OSError, ValueError) as e:
+                print(f"Could not read window snapshot in {snapshot_dir}: {str(e)}")
+                previous = None
+
+        store = cls(symbols, sequence_length, num_features, dtype, snapshot_dir)
+
+        if previous is not None:
+            for old_i, symbol in enumerate(previous_symbols):
+                new_i = store.index.get(symbol)
+                if new_i is None:
+                    continue
+                store.data[new_i] = previous['data'][old_i]
+                store.timestamps[new_i] = previous['timestamps'][old_i]
+                store.head[new_i] = previous['head'][old_i]
+                store.count[new_i] = previous['count'][old_i]
+                store.bounds[new_i].reset(store.window(symbol)[-store.count[new_i]:] if store.count[new_i] else ())
+            store.flush()
+
+        return store
+
+    def set_symbols(self, symbols):
+        """
+        Switch to a new symbol list without touching the windows of symbols that stay listed.
+
+        New symbols start with empty windows and get their full history on the next fetch,
+        delisted symbols are dropped. A snapshot-backed store rewrites its files at the new size.
+
+        Parameters:
+        symbols (list): Symbols to track from now on
+
+        Returns:
+        tuple: (added, removed) symbol lists
+        """
+        symbols = list(symbols)
+        listed = set(symbols)
+        added = [symbol for symbol in symbols if symbol not in self.index]
+        removed = [symbol for symbol in self.symbols if symbol not in listed]
+        if not added and not removed:
+            return added, removed
+
+        old_rows = [self.index[symbol] for symbol in symbols if symbol in self.index]
+        new_rows = [i for i, symbol in enumerate(symbols) if symbol in self.index]
+        # Copied out before the arrays, and any files behind them, are reallocated
+        kept = {name: np.array(getattr(self, name)[old_rows]) for name in ('data', 'timestamps', 'head', 'count')}
+        bounds = {symbol: self.bounds[self.index[symbol]] for symbol in symbols if symbol in self.index}
+        dtype = self.data.dtype
+        self.data = self.timestamps = self.head = self.count = None
+
+        self.symbols = symbols
+        self.index = {symbol: i for i, symbol in enumerate(symbols)}
+        self._allocate(dtype)
+        for name, values in kept.items():
+            getattr(self, name)[new_rows] = values
+        self.bounds = [bounds.get(symbol) or RollingMinMax(self.sequence_length, self.num_features) for symbol in symbols]
+        self.flush()
+        return added, removed
+
+    def last_timestamp(self, symbol):
+        i = self.index[symbol]
+        if self.count[i] == 0:
+            return None
+        return int(self.timestamps[i, (self.head[i] - 1) % self.sequence_length])
+
+    def append(self, symbol, timestamp, row):
+        """
+        Append one candle to a symbol's window in O(1).
+
+        A candle with the same timestamp as the newest one replaces it in place (the
+        still-open candle gets refetched each cycle), older candles are ignored.
+        """
+        i = self.index[symbol]
+        timestamp = int(timestamp)
+        if self.count[i] > 0:
+            last_slot = (self.head[i] - 1) % self.sequence_length
+            last = self.timestamps[i, last_slot]
+            if timestamp == last:
+                self.data[i, last_slot] = row
+                self.bounds[i].replace_last(row)
+                return
+            if timestamp < last:
+                return
+
+        slot = self.head[i]
+        self.data[i, slot] = row
+        self.timestamps[i, slot] = timestamp
+        self.head[i] = (slot + 1) % self.sequence_length
+        self.count[i] = min(self.count[i] + 1, self.sequence_length)
+        self.bounds[i].push(row)
+
+    def extend(self, symbol, timestamps, rows):
+        order = np.argsort(np.asarray(timestamps, dtype=np.int64), kind='stable')
+        for j in order:
+            self.append(symbol, timestamps[j], rows[j])
+
+    def missing_candles(self, symbol, now_ms):
+        """
+        Number of candles to request so the symbol's window is complete and current.
+        """
+        last = self.last_timestamp(symbol)
+        if last is None or self.count[self.index[symbol]] < self.sequence_length:
+            return self.sequence_length
+        # Refetch the newest stored candle too, it may have still been open last time
+        behind = (int(now_ms) - last) // CANDLE_INTERVAL_MS + 1
+        return int(min(max(behind, 1), self.sequence_length))
+
+    def is_ready(self, symbol):
+        return self.count[self.index[symbol]] == self.sequence_length
+
+    def window(self, symbol):
+        """
+        Return the symbol's window as a (25, 12) array ordered oldest to newest.
+        """
+        i = self.index[symbol]
+        order = (self.head[i] + np.arange(self.sequence_length)) % self.sequence_length
+        return self.data[i, order]
+
+    def normalized_window(self, symbol):
+        """
+        Return the symbol's window min-max scaled per feature from the rolling bounds.
+        """
+        mins, maxs = self.bounds[self.index[symbol]].bounds()
+        return scale_window(self.window(symbol), mins, maxs)
+
+    def ready_windows(self):
+        """
+        Gather every complete window in one fancy-indexing pass.
+
+        Returns:
+        tuple: list of symbols and an (N, 25, 12) array ordered oldest to newest
+        """
+        ready = np.flatnonzero(self.count == self.sequence_length)
+        order = (self.head[ready][:, None] + np.arange(self.sequence_length)) % self.sequence_length
+        windows = self.data[ready[:, None], order]
+        return [self.symbols[i] for i in ready], windows
+
+    def flush(self):
+        if self.snapshot_dir is None:
+            return
+        for array in (self.data, self.timestamps, self.head, self.count):
+            array.flush()